@@ -15,10 +15,12 @@ bl_info = {
 # support reloading sub-modules
 if "bpy" in locals():
     import importlib
+    importlib.reload(part_cache)
     importlib.reload(brick_operators)
     importlib.reload(brick_panels)
     importlib.reload(brick_sufPre_operators)
 else:
+    from . import part_cache
     from . import brick_operators
     from . import brick_panels
 
@@ -39,16 +41,58 @@ classes = (
     brick_panels.VIEW3D_PT_tools_select_material_panel,
     brick_panels.MaterialMenu,
     brick_operators.VIEW3D_OT_add_brick,
+    brick_operators.WM_OT_brick_catalog_page,
+    brick_operators.WM_OT_compile_brick_library,
 )
 
+def reset_catalog_page(self, context):
+    #a new search starts at its first page
+    self.brick_catalog_page = 0
+
+
 def register():
     from bpy.utils import register_class
     for cls in classes:
         register_class(cls)
 
+    WindowManager = bpy.types.WindowManager
+    WindowManager.brick_catalog_search = StringProperty(
+        name="Search",
+        description="Show parts with words starting with these, or dimensions like 2x4",
+        options={'TEXTEDIT_UPDATE'},
+        update=reset_catalog_page,
+    )
+    WindowManager.brick_catalog_category = EnumProperty(
+        name="Category",
+        description="Only show parts of this category",
+        items=brick_panels.category_items,
+        update=reset_catalog_page,
+    )
+    WindowManager.brick_catalog_page = IntProperty(name="Page", min=0)
+    WindowManager.brick_use_instancing = BoolProperty(
+        name="Instanced",
+        description="Add bricks as instances of a shared part collection, much lighter than copies for large models",
+    )
+    WindowManager.brick_use_snapping = BoolProperty(
+        name="Snap to Studs",
+        description="Place added bricks with the mouse, snapping them onto the nearest free studs and holes",
+        default=True,
+    )
+
+    part_cache.register()
+
 
 def unregister():
     from bpy.utils import unregister_class
+    part_cache.unregister()
+
+    WindowManager = bpy.types.WindowManager
+    del WindowManager.brick_use_snapping
+    del WindowManager.brick_use_instancing
+    del WindowManager.brick_catalog_page
+    del WindowManager.brick_catalog_category
+    del WindowManager.brick_catalog_search
+
     for cls in reversed(classes):
         unregister_class(cls)
 
@@ -14,6 +14,10 @@ import sys
 sys.path.insert(0, 'brickcad/release/scripts/startup/')
 from bl_operators import import_brk
 
+from brickcad import catalog, library
+
+from . import brick_panels, part_cache
+
 class VIEW3D_OT_add_brick(bpy.types.Operator):
     bl_idname = "object.add_brick"
     bl_label = "Add brick"
@@ -25,11 +29,55 @@ class VIEW3D_OT_add_brick(bpy.types.Operator):
     def execute(self, context):
         scene = context.scene
 
-        #add brick, hardcoded for now
-        keywords = self.as_keywords(ignore=("axis_forward", "axis_up", "filter_glob", "split_mode", "path"))
-
+        #add brick, hardcoded for now. Only the first add of each file parses it, later ones share its mesh
         global_matrix = axis_conversion(from_forward='-Z', from_up='Y').to_4x4()
-        keywords["global_matrix"] = global_matrix
-        import_brk.load(context=context, filepath=self.path, **keywords)
+        part_cache.add_part(context, self.path, global_matrix, instanced=context.window_manager.brick_use_instancing)
+
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        result = self.execute(context)
+
+        #added from the panel, the new brick follows the mouse until it is clicked into place
+        if context.window_manager.brick_use_snapping and bpy.ops.object.place_brick.poll():
+            bpy.ops.object.place_brick('INVOKE_DEFAULT')
+
+        return result
+
+
+class WM_OT_brick_catalog_page(bpy.types.Operator):
+    bl_idname = "wm.brick_catalog_page"
+    bl_label = "Change page"
+    bl_description = "Show another page of the part catalog"
+
+    delta: bpy.props.IntProperty(default=1)
+
+    def execute(self, context):
+        wm = context.window_manager
+        _, _, pages = brick_panels.search_catalog(catalog.get_catalog(), wm)
+        wm.brick_catalog_page = min(max(0, wm.brick_catalog_page + self.delta), pages - 1)
+        return {'FINISHED'}
+
+
+class WM_OT_compile_brick_library(bpy.types.Operator):
+    bl_idname = "wm.compile_brick_library"
+    bl_label = "Compile brick library"
+    bl_description = "Pre-compile every part of the brick library to .brkc files, so adding bricks never parses text"
+
+    force: bpy.props.BoolProperty(name="Force", description="Recompile parts that didn't change")
+
+    def execute(self, context):
+        #workers have to be started with the bundled python, sys.executable is BrickCAD itself
+        results = library.compile_library(library.DEFAULT_ROOT,
+                                          force=self.force,
+                                          executable=bpy.app.binary_path_python,
+                                          report=lambda result: print(library.format_result(result)))
+
+        compiled = sum(1 for result in results if result.status == 'COMPILED')
+        failed = [result.path for result in results if result.status == 'FAILED']
+        if failed:
+            self.report({'WARNING'}, "Compiled %d parts, failed: %s" % (compiled, ", ".join(failed)))
+        else:
+            self.report({'INFO'}, "Compiled %d parts, %d up to date" % (compiled, len(results) - compiled))
 
         return {'FINISHED'}
@@ -1,6 +1,16 @@
 import bpy
 from bpy.props import StringProperty
 
+from brickcad import catalog
+
+#parts listed per page, drawing cost depends on this and not on the size of the library
+PAGE_SIZE = 20
+
+def search_catalog(partCatalog, wm):
+    #the page of parts the window manager's search settings select: (parts, total matches, page count)
+    category = wm.brick_catalog_category if wm.brick_catalog_category != 'ALL' else ""
+    return partCatalog.search(wm.brick_catalog_search, category, wm.brick_catalog_page, PAGE_SIZE)
+
 class VIEW3D_PT_tools_add_brick_panel(bpy.types.Panel):
     bl_label = "Add Brick Panel"
     bl_space_type = "VIEW_3D"
@@ -8,20 +18,34 @@ class VIEW3D_PT_tools_add_brick_panel(bpy.types.Panel):
     bl_category = "Add Brick Panel"
 
     def draw(self, context):
-        path = "release/datafiles/bricks"
-
         layout = self.layout
-        scene = context.scene
+        wm = context.window_manager
         layout.use_property_split = True #activate single-column layout
 
-        #read file listing all brk files
-        listFile = open("release/datafiles/bricks/list.config", "r")
-        
-        #loop through line-by-line
-        for line in listFile:
-            splitLine = line.split("|")
-            addBrickOperator = layout.operator("object.add_brick", text=splitLine[1][:-1])
-            addBrickOperator.path = path + "/" + splitLine[0][:-1]
+        #the catalog only reads list.config again when it changed on disk
+        partCatalog = catalog.get_catalog()
+
+        layout.prop(wm, "brick_catalog_search", text="", icon='VIEWZOOM')
+        layout.prop(wm, "brick_catalog_category", text="Category")
+        layout.prop(wm, "brick_use_instancing")
+        layout.prop(wm, "brick_use_snapping")
+
+        parts, total, pages = search_catalog(partCatalog, wm)
+
+        for part in parts:
+            addBrickOperator = layout.operator("object.add_brick", text=part.name)
+            addBrickOperator.path = partCatalog.filepath(part)
+
+        if pages > 1:
+            page = min(wm.brick_catalog_page, pages - 1)
+            row = layout.row(align=True)
+            row.operator("wm.brick_catalog_page", text="", icon='TRIA_LEFT').delta = -1
+            row.label(text="Page %d / %d (%d parts)" % (page + 1, pages, total))
+            row.operator("wm.brick_catalog_page", text="", icon='TRIA_RIGHT').delta = 1
+        elif not total:
+            layout.label(text="No parts found")
+
+        layout.operator("wm.compile_brick_library", icon='FILE_REFRESH')
 
 class MaterialMenu(bpy.types.Menu):
     bl_label = "Material Menu"
@@ -43,6 +67,18 @@ class MaterialMenu(bpy.types.Menu):
         # call another menu
         layout.operator("wm.call_menu", text="Unwrap").name = "VIEW3D_MT_uv_map"
 
+def category_items(self, context):
+    #enum items have to stay referenced from python, or blender shows garbage
+    partCatalog = catalog.get_catalog()
+    categories = tuple(partCatalog.categories)
+    if categories != category_items.categories:
+        category_items.categories = categories
+        category_items.items = [('ALL', "All", "Parts of every category")] + [(name, name, "") for name in categories]
+    return category_items.items
+
+category_items.categories = None
+category_items.items = []
+
 class VIEW3D_PT_tools_select_material_panel(bpy.types.Panel):
     bl_label = "Material panel"
     bl_space_type = "VIEW_3D"
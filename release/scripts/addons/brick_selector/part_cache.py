@@ -0,0 +1,99 @@
+import os
+
+import bpy
+from bpy.app.handlers import persistent
+from mathutils import Matrix
+
+from bl_operators import brick_instances, brick_inventory, import_brk
+
+#absolute .brk path -> PartEntry of the first import of that file
+_parts = {}
+
+
+class PartEntry:
+    #what we need to place another copy of an imported part without reading the file again
+    def __init__(self, scene, mtime, objects, connectors, global_matrix):
+        self.mtime = mtime
+        #mesh name, matrix and mould of every object, the matrix without the import's global_matrix so later adds can use their own
+        parts = scene.brick_parts
+        inverse = global_matrix.inverted()
+        self.meshes = [(ob.data.name, inverse @ ob.matrix_world, parts[ob.brick_part_id - 1].name) for ob in objects]
+
+        #connector layout: (name, location, index of the parent in meshes or -1)
+        indices = {ob.name: i for i, ob in enumerate(objects)}
+        self.connectors = []
+        for empty in connectors:
+            parent = empty.parent
+            self.connectors.append((empty.name, empty.location.copy(), indices.get(parent.name, -1) if parent else -1))
+
+    def is_valid(self, mtime):
+        if mtime != self.mtime:
+            return False
+        return all(bpy.data.meshes.get(name) is not None for name, _, _ in self.meshes)
+
+
+def add_part(context, filepath, global_matrix, instanced=False):
+    """
+    Adds a brick from a .brk file. The first add of a file imports it, later adds are linked duplicates sharing its mesh.
+    With instanced the brick is an instance of the file's part collection instead.
+    Returns the new brick objects.
+    """
+    filepath = os.path.abspath(filepath)
+    if global_matrix is None:
+        global_matrix = Matrix()
+    if instanced:
+        return [brick_instances.add_instance(context, filepath, global_matrix=global_matrix)]
+
+    mtime = os.stat(filepath).st_mtime
+
+    entry = _parts.get(filepath)
+    if entry is None or not entry.is_valid(mtime):
+        objects, connectors = import_brk.load_objects(context, filepath, global_matrix=global_matrix)
+        _parts[filepath] = PartEntry(context.scene, mtime, objects, connectors, global_matrix)
+        return objects
+
+    if bpy.ops.object.select_all.poll():
+        bpy.ops.object.select_all(action='DESELECT')
+
+    collection = context.view_layer.active_layer_collection.collection
+    link = collection.objects.link
+
+    scene = context.scene
+    objects = []
+    inverses = []
+    for mesh_name, matrix, mould in entry.meshes:
+        mesh = bpy.data.meshes[mesh_name]
+        ob = bpy.data.objects.new(mesh.name, mesh)
+        link(ob)
+        matrix = global_matrix @ matrix
+        ob.matrix_world = matrix
+        ob.select_set(True)
+        brick_inventory.set_brick_ids(scene, ob, mould, filepath)
+        objects.append(ob)
+        inverses.append(matrix.inverted())
+
+    for name, location, parent_index in entry.connectors:
+        empty = bpy.data.objects.new(name, None)
+        empty.location = location
+        empty.brick_part_id = brick_inventory.NOT_A_BRICK
+        if parent_index >= 0:
+            empty.parent = objects[parent_index]
+            empty.matrix_parent_inverse = inverses[parent_index]
+        link(empty)
+
+    return objects
+
+
+@persistent
+def _clear(_):
+    #mesh names from another file mean nothing
+    _parts.clear()
+
+
+def register():
+    bpy.app.handlers.load_post.append(_clear)
+
+
+def unregister():
+    bpy.app.handlers.load_post.remove(_clear)
+    _parts.clear()
@@ -0,0 +1,81 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Bill of materials writers. A BOM is a list of (part, color, quantity) rows,
+part and color being names, color is an empty string for uncolored parts.
+"""
+
+import csv
+import json
+import xml.etree.ElementTree as ET
+
+
+def write_csv(filepath, rows):
+	with open(filepath, 'w', newline='', encoding='utf-8') as f:
+		writer = csv.writer(f)
+		writer.writerow(("part", "color", "quantity"))
+		writer.writerows(rows)
+
+
+def write_json(filepath, rows):
+	bom = {
+		"parts": [{"part": part, "color": color, "quantity": quantity} for part, color, quantity in rows],
+		"total": sum(row[2] for row in rows),
+	}
+	with open(filepath, 'w', encoding='utf-8') as f:
+		json.dump(bom, f, indent=1)
+
+
+def write_bricklink_xml(filepath, rows, color_ids=None):
+	"""
+	Writes a BrickLink wanted list. BrickLink wants numeric color IDs, colors that aren't a number
+	and aren't in the color_ids mapping (color name -> BrickLink ID) are left out, with their name in the item remarks.
+	"""
+	color_ids = color_ids or {}
+	inventory = ET.Element("INVENTORY")
+	for part, color, quantity in rows:
+		item = ET.SubElement(inventory, "ITEM")
+		ET.SubElement(item, "ITEMTYPE").text = "P"
+		ET.SubElement(item, "ITEMID").text = part
+
+		color_id = color_ids.get(color)
+		if color_id is None and color.isdigit():
+			color_id = color
+		if color_id is not None:
+			ET.SubElement(item, "COLOR").text = str(color_id)
+		elif color:
+			ET.SubElement(item, "REMARKS").text = color
+
+		ET.SubElement(item, "MINQTY").text = str(quantity)
+
+	ET.ElementTree(inventory).write(filepath, encoding='utf-8', xml_declaration=True)
+
+
+#format identifier -> (file extension, writer)
+FORMATS = {
+	'CSV': (".csv", write_csv),
+	'JSON': (".json", write_json),
+	'BRICKLINK': (".xml", write_bricklink_xml),
+}
+
+
+def write(filepath, rows, format='CSV'):
+	FORMATS[format][1](filepath, rows)
@@ -0,0 +1,117 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+BRK animation deltas. An animation is written as a BRK file of its first frame, the base, and a .brka file
+next to it holding only what changes after that frame. Each 'o' and 'r' line of the base starts a block,
+numbered from 0 in file order, and each frame lists the blocks that changed:
+
+	frame <number>
+	m <block> x y z a b c d e f g h i       the block is moved by this transform from where the base has it
+	b <block>                               the block's geometry, in its base placement, is replaced by
+	o <name>                                the BRK lines up to the next record, indices counted from 1
+	v ...
+
+A block keeps its last transform and geometry until a later frame has another record for it.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+from . import brk_parser
+
+EXTENSION = ".brka"
+
+
+def animation_path(filepath):
+	"""
+	The .brka file that goes with the base BRK filepath
+	"""
+	return os.path.splitext(filepath)[0] + EXTENSION
+
+
+def mesh_key(mesh):
+	"""
+	Digest of a brk_writer.MeshData, equal for meshes that are written the same. None for no mesh
+	"""
+	if mesh is None:
+		return None
+
+	digest = hashlib.sha1()
+	for value in mesh[:-2]:
+		if value is not None:
+			value = np.ascontiguousarray(value)
+			digest.update(str((value.dtype, value.shape)).encode())
+			digest.update(value.tobytes())
+	digest.update(repr(sorted(mesh.markers.items()) if mesh.markers else ()).encode())
+	if mesh.edges is not None:
+		digest.update(np.ascontiguousarray(mesh.edges).tobytes())
+	return digest.digest()
+
+
+def format_transform(block, matrix):
+	"""
+	The 'm' line moving block by matrix, 4x4 and indexed [row][column] like a mathutils.Matrix
+	"""
+	return 'm %d %.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f\n' % (
+		block,
+		matrix[0][3], matrix[1][3], matrix[2][3],
+		matrix[0][0], matrix[0][1], matrix[0][2],
+		matrix[1][0], matrix[1][1], matrix[1][2],
+		matrix[2][0], matrix[2][1], matrix[2][2])
+
+
+def read(filepath, **keywords):
+	"""
+	Reads a .brka file into a list of (frame, records), records being ('m', block, 4x4 matrix as a tuple of rows)
+	and ('b', block, BrkData) in file order. keywords are passed on to brk_parser.parse_lines.
+	"""
+	frames = []
+	geometry = None
+
+	def flush():
+		if geometry is not None:
+			frames[-1][1].append(('b', geometry[0], brk_parser.parse_lines(geometry[1], **keywords)))
+
+	with open(filepath, 'rb') as f:
+		for line in f:
+			line_split = line.split()
+			if not line_split or line_split[0].startswith(b'#'):
+				continue
+
+			line_start = line_split[0]
+			if line_start in {b'frame', b'm', b'b'}:
+				flush()
+				geometry = None
+				if line_start == b'frame':
+					frames.append((int(line_split[1]), []))
+				elif line_start == b'm':
+					x, y, z, a, b, c, d, e, f_, g, h, k = map(brk_parser._float, line_split[2:14])
+					frames[-1][1].append(('m', int(line_split[1]),
+										  ((a, b, c, x), (d, e, f_, y), (g, h, k, z), (0.0, 0.0, 0.0, 1.0))))
+				else:
+					geometry = (int(line_split[1]), [])
+			elif geometry is not None:
+				geometry[1].append(line)
+
+		flush()
+	return frames
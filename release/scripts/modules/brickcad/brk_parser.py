@@ -0,0 +1,374 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Parses BRK files into flat, array-backed buffers without touching bpy.
+The result can be fed straight into foreach_set by import_brk, or cached.
+"""
+
+import os
+import struct
+from array import array
+
+#one connector record: location, index of its name in BrkData.strings, index of its parent's name (-1 for none)
+CONNECTOR = struct.Struct("<3fii")
+
+
+class BrkData:
+	"""
+	Everything read from one BRK file. Indices are 0-based, faces index loops through face_loop_start/face_loop_total.
+	"""
+
+	def __init__(self):
+		self.positions = array('f')  #x, y, z per vertex
+		self.normals = array('f')  #x, y, z per normal
+		self.uvs = array('f')  #u, v per texture coordinate
+
+		self.loop_vertex = array('i')
+		self.loop_normal = array('i')
+		self.loop_uv = array('i')
+
+		self.face_loop_start = array('i')
+		self.face_loop_total = array('i')
+		self.face_smooth = array('i')  #index into smooth_groups, 0 for flat faces
+		self.face_object = array('i')  #index into objects
+		self.face_invalid = array('b')  #1 for ngons Blender can't store as they are (using an edge twice), these need tessellating
+
+		self.edges = array('i')  #vertex index pairs from 'l' lines
+		self.edge_object = array('i')
+
+		self.objects = [None]  #object names faces are split by, None for geometry before the first 'o' line
+		self.smooth_groups = [None]
+		self.vertex_groups = {}  #group name -> array of vertex indices, only filled with use_groups_as_vgroups
+
+		self.connectors = bytearray()  #packed CONNECTOR records
+		self.strings = []  #connector and parent names
+
+		#placed parts from 'r' lines: [part file, color or None] each, and their 3x4 transforms as x, y, z, a, b, c, d, e, f, g, h, i
+		self.references = []
+		self.reference_matrices = array('f')
+
+	@property
+	def vertex_count(self):
+		return len(self.positions) // 3
+
+	@property
+	def face_count(self):
+		return len(self.face_loop_start)
+
+	@property
+	def connector_count(self):
+		return len(self.connectors) // CONNECTOR.size
+
+	@property
+	def reference_count(self):
+		return len(self.references)
+
+	def add_connector(self, name, co, parent=None):
+		strings = self.strings
+		strings.append(name)
+		name_index = len(strings) - 1
+		parent_index = -1
+		if parent is not None:
+			strings.append(parent)
+			parent_index = len(strings) - 1
+
+		self.connectors += CONNECTOR.pack(co[0], co[1], co[2], name_index, parent_index)
+
+	def iter_connectors(self):
+		"""
+		Yields (name, location, parent name or None) for every connector
+		"""
+		strings = self.strings
+		for x, y, z, name_index, parent_index in CONNECTOR.iter_unpack(self.connectors):
+			yield strings[name_index], (x, y, z), (strings[parent_index] if parent_index >= 0 else None)
+
+	def iter_references(self):
+		"""
+		Yields (part file, color or None, 4x4 matrix as a tuple of rows) for every placed part
+		"""
+		matrices = self.reference_matrices
+		for i, (part, color) in enumerate(self.references):
+			x, y, z, a, b, c, d, e, f, g, h, k = matrices[i * 12:i * 12 + 12]
+			yield part, color, ((a, b, c, x), (d, e, f, y), (g, h, k, z), (0.0, 0.0, 0.0, 1.0))
+
+
+def _float(value):
+	try:
+		return float(value)
+	except ValueError:
+		#some exporters write decimal commas
+		return float(value.replace(b',', b'.'))
+
+
+def _value(line_split):
+	length = len(line_split)
+	if length == 1:
+		return None
+	elif length == 2:
+		return line_split[1]
+	return b' '.join(line_split[1:])
+
+
+def _strip_slash(line_split):
+	if line_split[-1][-1] == 92:  # '\' char
+		if len(line_split[-1]) == 1:
+			line_split.pop()  # remove the \ item
+		else:
+			line_split[-1] = line_split[-1][:-1]  # remove the \ from the end last number
+		return True
+	return False
+
+
+def _decode(name):
+	return name.decode('utf-8', 'replace')
+
+
+def parse(filepath,
+		  *,
+		  use_smooth_groups=True,
+		  use_edges=True,
+		  use_split_objects=True,
+		  use_split_groups=False,
+		  use_groups_as_vgroups=False,
+		  ):
+	"""
+	Reads a BRK file and returns its BrkData
+	"""
+	with open(filepath, 'rb') as f:
+		return parse_lines(f,
+						   use_smooth_groups=use_smooth_groups,
+						   use_edges=use_edges,
+						   use_split_objects=use_split_objects,
+						   use_split_groups=use_split_groups,
+						   use_groups_as_vgroups=use_groups_as_vgroups,
+						   )
+
+
+def parse_lines(lines,
+				*,
+				use_smooth_groups=True,
+				use_edges=True,
+				use_split_objects=True,
+				use_split_groups=False,
+				use_groups_as_vgroups=False,
+				):
+	"""
+	Parses an iterable of BRK lines (as bytes) into a BrkData
+	"""
+	if use_split_objects or use_split_groups:
+		use_groups_as_vgroups = False
+
+	data = BrkData()
+	positions = data.positions
+	normals = data.normals
+	uvs = data.uvs
+	loop_vertex = data.loop_vertex
+	loop_normal = data.loop_normal
+	loop_uv = data.loop_uv
+	face_invalid = data.face_invalid
+
+	object_indices = {None: 0}
+	smooth_indices = {None: 0}
+	object_names = set()
+
+	context_object = 0
+	context_object_obpart = None
+	context_smooth = 0
+	context_vgroup = None
+	context_multi_line = b''
+
+	vec = []
+	vec_target = None
+	face_usage = set()
+	face_start = 0
+
+	for line in lines:
+		line_split = line.split()
+		if not line_split:
+			continue
+
+		line_start = line_split[0]
+
+		if context_multi_line in (b'v', b'vn', b'vt'):
+			#continuation of a vector split over several lines
+			continued = _strip_slash(line_split)
+			vec += [_float(v) for v in line_split]
+			if not continued:
+				vec_target.extend(vec[:3 if vec_target is not uvs else 2])
+				context_multi_line = b''
+			continue
+
+		if line_start == b'v' or line_start == b'vn' or line_start == b'vt':
+			target, size = (positions, 3) if line_start == b'v' else ((normals, 3) if line_start == b'vn' else (uvs, 2))
+			if _strip_slash(line_split):
+				vec = [_float(v) for v in line_split[1:]]
+				vec_target = target
+				context_multi_line = line_start
+				continue
+			#the values are read before extending, a failed float() mustn't leave half a vector behind
+			try:
+				values = list(map(float, line_split[1:size + 1]))
+			except ValueError:
+				values = [_float(v) for v in line_split[1:size + 1]]
+			target.extend(values)
+
+		elif line_start == b'f' or context_multi_line == b'f':
+			if not context_multi_line:
+				line_split = line_split[1:]
+				face_start = len(loop_vertex)
+				data.face_loop_start.append(face_start)
+				data.face_smooth.append(context_smooth)
+				data.face_object.append(context_object)
+				face_invalid.append(0)
+				face_usage.clear()
+				verts_len = len(positions) // 3
+				normals_len = len(normals) // 3
+				uvs_len = len(uvs) // 2
+
+			context_multi_line = b'f' if _strip_slash(line_split) else b''
+
+			for v in line_split:
+				brk_vert = v.split(b'/')
+				idx = int(brk_vert[0])
+				vidx = (idx + verts_len) if (idx < 1) else idx - 1
+
+				if use_groups_as_vgroups and context_vgroup:
+					data.vertex_groups[context_vgroup].append(vidx)
+
+				#first round to quick-detect ngons that *may* use a same edge more than once, checked properly once the face is complete
+				if not face_invalid[-1]:
+					if vidx in face_usage:
+						face_invalid[-1] = 1
+					else:
+						face_usage.add(vidx)
+				loop_vertex.append(vidx)
+
+				#formatting for faces with normals and textures is loc_index/tex_index/nor_index
+				if len(brk_vert) > 1 and brk_vert[1] and brk_vert[1] != b'0':
+					idx = int(brk_vert[1])
+					loop_uv.append((idx + uvs_len) if (idx < 1) else idx - 1)
+				else:
+					loop_uv.append(0)
+
+				if len(brk_vert) > 2 and brk_vert[2] and brk_vert[2] != b'0':
+					idx = int(brk_vert[2])
+					loop_normal.append((idx + normals_len) if (idx < 1) else idx - 1)
+				else:
+					loop_normal.append(0)
+
+			if not context_multi_line:
+				data.face_loop_total.append(len(loop_vertex) - face_start)
+
+				if face_invalid[-1]:
+					#a repeated vertex is fine, a repeated edge is not
+					face_invalid[-1] = 0
+					face_usage.clear()
+					face_verts = loop_vertex[face_start:]
+					prev_vidx = face_verts[-1]
+					for vidx in face_verts:
+						edge_key = (prev_vidx, vidx) if (prev_vidx < vidx) else (vidx, prev_vidx)
+						if edge_key in face_usage:
+							face_invalid[-1] = 1
+							break
+						face_usage.add(edge_key)
+						prev_vidx = vidx
+
+		elif use_edges and (line_start == b'l' or context_multi_line == b'l'):
+			if not context_multi_line:
+				line_split = line_split[1:]
+				prev_vidx = None
+
+			context_multi_line = b'l' if _strip_slash(line_split) else b''
+
+			verts_len = len(positions) // 3
+			for v in line_split:
+				idx = int(v.split(b'/')[0]) - 1
+				vidx = (idx + verts_len + 1) if (idx < 0) else idx
+				if prev_vidx is not None:
+					data.edges.append(prev_vidx)
+					data.edges.append(vidx)
+					data.edge_object.append(context_object)
+				prev_vidx = vidx
+
+		elif line_start == b's':
+			if use_smooth_groups:
+				group = _value(line_split)
+				if group == b'off':
+					group = None
+				context_smooth = smooth_indices.get(group)
+				if context_smooth is None:
+					context_smooth = smooth_indices[group] = len(data.smooth_groups)
+					data.smooth_groups.append(_decode(group))
+
+		elif line_start == b'o':
+			if use_split_objects:
+				name_orig = _value(line_split)
+				name = name_orig
+				i = 0
+				while name in object_names:
+					name = b"%s.%03d" % (name_orig, i)
+					i += 1
+				object_names.add(name)
+
+				context_object_obpart = name
+				context_object = object_indices[name] = len(data.objects)
+				data.objects.append(_decode(name))
+
+		elif line_start == b'g':
+			if use_split_groups:
+				group = _value(line_split)
+				key = (context_object_obpart, group) if context_object_obpart else group
+				context_object = object_indices.get(key)
+				if context_object is None:
+					context_object = object_indices[key] = len(data.objects)
+					data.objects.append(_decode(b"_".join(key) if isinstance(key, tuple) else key))
+			elif use_groups_as_vgroups:
+				context_vgroup = _value(line.split())
+				if context_vgroup and context_vgroup != b'(null)':
+					context_vgroup = _decode(context_vgroup)
+					data.vertex_groups.setdefault(context_vgroup, array('i'))
+				else:
+					context_vgroup = None  # dont assign a vgroup
+
+		elif line_start == b'st':
+			parent = _decode(line_split[6]) if len(line_split) == 7 else None
+			data.add_connector(_decode(line_split[1]),
+							   (_float(line_split[2]), _float(line_split[3]), _float(line_split[4])),
+							   parent)
+
+		elif line_start == b'r':
+			#r <color> x y z a b c d e f g h i <part file>, like an LDraw type 1 line. The file may contain spaces
+			if len(line_split) >= 15:
+				color = _decode(line_split[1])
+				data.references.append([_decode(b' '.join(line_split[14:])), None if color == '-' else color])
+				data.reference_matrices.extend(_float(v) for v in line_split[2:14])
+
+	return data
+
+
+def object_name(data, index, filepath):
+	"""
+	Name for the mesh of objects[index], unnamed geometry is named after the file
+	"""
+	name = data.objects[index]
+	if name is None:
+		return os.path.splitext(os.path.basename(filepath))[0]
+	return name
@@ -0,0 +1,320 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Formatting of BRK lines from arrays. A whole block of lines (all the vertices of a mesh, all its faces)
+is formatted with a single % operation on a format string repeated once per line, instead of one
+format call and one write per line.
+
+An exporter reads each object into a MeshSnapshot and leaves the rest to format_items, which numbers
+the indices of each object on from the previous ones and, for large exports, formats in worker processes.
+"""
+
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+#bytes of buffering of files being written, big enough that writes are rare
+WRITE_BUFFER = 1 << 22
+
+#lines formatted at once, limits the size of the format string and argument tuple
+CHUNK_LINES = 1 << 16
+
+#face loops formatted by one worker task, and the number of loops below which workers aren't worth starting
+BATCH_LOOPS = 1 << 16
+PARALLEL_LOOPS = 1 << 18
+
+#a mesh's geometry, in its own space and ready to format. Indices are counted from 0 within the mesh.
+#positions (n x 3), uvs (n x 2) and normals (n x 3) are the v, vt and vn lines, uvs and normals None when not written.
+#columns has a row per face loop, in face order: vertex index, then uv and normal index when written.
+#smooth_groups (per face) is None when faces only use smooth or flat, markers maps a face index to its 'g' line.
+#edges are the vertex index pairs of the 'l' lines, or None.
+MeshData = namedtuple("MeshData", ("positions", "uvs", "normals", "loop_total", "columns",
+								   "use_smooth", "smooth_groups", "markers", "edges"))
+
+#one object: its 'o' and connector lines, its MeshData, which objects with the same mesh share,
+#and the 4x4 matrix that places the mesh in the file
+MeshSnapshot = namedtuple("MeshSnapshot", ("head", "mesh", "matrix"))
+
+
+def open_file(filepath):
+	return open(filepath, 'w', encoding='utf8', newline='\n', buffering=WRITE_BUFFER)
+
+
+def format_rows(fmt, values):
+	"""
+	fmt formatted with each row of values, a 2D array with one row per line, as a single string
+	"""
+	values = np.asarray(values)
+	rows = len(values)
+	if not rows:
+		return ""
+
+	values = values.reshape(rows, -1)
+	return "".join((fmt * len(chunk)) % tuple(chunk.ravel().tolist())
+				   for chunk in (values[start:start + CHUNK_LINES] for start in range(0, rows, CHUNK_LINES)))
+
+
+def face_loop_order(loop_start, loop_total):
+	"""
+	Indices of the loops of all faces, one face after the other. The identity unless loops are stored out of face order
+	"""
+	loop_total = np.asarray(loop_total)
+	offsets = np.cumsum(loop_total) - loop_total
+	return np.arange(int(loop_total.sum())) + np.repeat(np.asarray(loop_start) - offsets, loop_total)
+
+
+def first_seen(keys):
+	"""
+	Deduplicates the rows of keys, a 2D array. Returns the index of the first row of each distinct key,
+	in order of first appearance, and for each row the index of its key in that order.
+	"""
+	keys = np.asarray(keys)
+	if not len(keys):
+		return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+	#lexsort is stable, the first row of each run of equal keys is the first occurrence of that key
+	order = np.lexsort(keys.T[::-1])
+	sorted_keys = keys[order]
+	starts = np.empty(len(keys), dtype=bool)
+	starts[0] = True
+	np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1, out=starts[1:])
+
+	first = order[starts]
+	appearance = np.argsort(first, kind='stable')
+	rank = np.empty_like(appearance)
+	rank[appearance] = np.arange(len(appearance))
+
+	ids = np.empty(len(keys), dtype=np.intp)
+	ids[order] = rank[np.cumsum(starts) - 1]
+	return first[appearance], ids
+
+
+def smooth_markers(use_smooth, groups=None):
+	"""
+	The 's' lines of a list of faces: face index -> line, for each face where smoothing changes.
+	groups are the smooth groups of the faces, if written.
+	"""
+	use_smooth = np.asarray(use_smooth, dtype=bool)
+	if not len(use_smooth):
+		return {}
+
+	state = use_smooth.astype(np.intc) if groups is None else np.where(use_smooth, groups, 0)
+	changes = np.flatnonzero(np.concatenate(([True], state[1:] != state[:-1])))
+
+	markers = {}
+	for index, value in zip(changes.tolist(), state[changes].tolist()):
+		if not value:
+			markers[index] = "s off\n"
+		elif groups is not None:
+			markers[index] = "s %d\n" % value
+		else:
+			markers[index] = "s 1\n"
+	return markers
+
+
+def format_faces(loop_total, columns, loop_fmt, markers=None):
+	"""
+	'f' lines of faces of loop_total loops each. columns has a row per loop, in face order, holding the
+	indices written for it as formatted by loop_fmt (" %d", " %d/%d", " %d//%d" or " %d/%d/%d").
+	markers maps a face index to lines to write before that face.
+	"""
+	loop_total = np.asarray(loop_total)
+	if not len(loop_total):
+		return ""
+
+	columns = np.asarray(columns).reshape(int(loop_total.sum()), -1)
+	line_fmts = {}
+	fmts = []
+	for total in loop_total.tolist():
+		fmt = line_fmts.get(total)
+		if fmt is None:
+			fmt = line_fmts[total] = "f" + loop_fmt * total + "\n"
+		fmts.append(fmt)
+
+	if markers:
+		for index, text in markers.items():
+			fmts[index] = text.replace("%", "%%") + fmts[index]
+
+	ends = np.cumsum(loop_total).tolist()
+	chunks = []
+	start = loop = 0
+	while start < len(fmts):
+		stop = min(start + CHUNK_LINES, len(fmts))
+		chunks.append("".join(fmts[start:stop]) % tuple(columns[loop:ends[stop - 1]].ravel().tolist()))
+		start, loop = stop, ends[stop - 1]
+	return "".join(chunks)
+
+
+def flipped_loop_order(loop_total):
+	"""
+	Loop order of faces with reversed winding, the way Blender flips them: each face keeps its first loop
+	and has the others reversed
+	"""
+	loop_total = np.asarray(loop_total)
+	starts = np.repeat(np.cumsum(loop_total) - loop_total, loop_total)
+	totals = np.repeat(loop_total, loop_total)
+	local = np.arange(len(starts)) - starts
+	return starts + np.where(local == 0, 0, totals - local)
+
+
+def _compact(values, ids):
+	#values still used by ids, and ids numbered among those
+	used = np.zeros(len(values), dtype=bool)
+	used[ids] = True
+	return values[used], (np.cumsum(used) - 1)[ids]
+
+
+def drop_faces(mesh, drop):
+	"""
+	A MeshData without the faces where drop is True, and without the vertices, uvs and normals only those used
+	"""
+	drop = np.asarray(drop, dtype=bool)
+	if not drop.any():
+		return mesh
+
+	keep = ~drop
+	columns = mesh.columns[np.repeat(keep, mesh.loop_total)].copy()
+
+	#vertices are also kept for the loose edges
+	vertex_ids = columns[:, 0] if mesh.edges is None else np.concatenate((columns[:, 0], mesh.edges.ravel()))
+	positions, vertex_ids = _compact(mesh.positions, vertex_ids)
+	columns[:, 0] = vertex_ids[:len(columns)]
+	edges = None if mesh.edges is None else vertex_ids[len(columns):].reshape(-1, 2)
+
+	uvs = normals = None
+	column = 1
+	if mesh.uvs is not None:
+		uvs, columns[:, column] = _compact(mesh.uvs, columns[:, column])
+		column += 1
+	if mesh.normals is not None:
+		normals, columns[:, column] = _compact(mesh.normals, columns[:, column])
+
+	markers = None
+	if mesh.markers:
+		#a marker of a dropped face goes to the next face kept, unless that face has its own
+		kept = int(keep.sum())
+		before = (np.cumsum(keep) - keep).tolist()
+		markers = {}
+		for index in sorted(mesh.markers):
+			if before[index] < kept:
+				markers[before[index]] = mesh.markers[index]
+
+	return MeshData(positions, uvs, normals, mesh.loop_total[keep], columns, mesh.use_smooth[keep],
+					None if mesh.smooth_groups is None else mesh.smooth_groups[keep], markers, edges)
+
+
+def format_mesh(snapshot, offsets):
+	"""
+	All the lines of a MeshSnapshot, with its vertex, uv and normal indices starting at offsets
+	"""
+	mesh = snapshot.mesh
+	matrix = np.asarray(snapshot.matrix, dtype=np.float64)
+	rotation = matrix[:3, :3]
+
+	lines = [snapshot.head, format_rows('v %.6f %.6f %.6f\n', mesh.positions @ rotation.T + matrix[:3, 3])]
+	column_offsets = [offsets[0]]
+	if mesh.uvs is not None:
+		lines.append(format_rows('vt %.6f %.6f\n', mesh.uvs))
+		column_offsets.append(offsets[1])
+	if mesh.normals is not None:
+		#normals transform with the inverse transpose, which keeps them perpendicular under non-uniform scale
+		normals = mesh.normals @ np.linalg.inv(rotation) if len(mesh.normals) else mesh.normals
+		lengths = np.linalg.norm(normals, axis=1)
+		lengths[lengths == 0.0] = 1.0
+		lines.append(format_rows('vn %.4f %.4f %.4f\n', normals / lengths[:, None]))
+		column_offsets.append(offsets[2])
+
+	markers = smooth_markers(mesh.use_smooth, mesh.smooth_groups)
+	if mesh.markers:
+		for index, text in mesh.markers.items():
+			markers[index] = text + markers.get(index, "")
+
+	columns = mesh.columns
+	if np.linalg.det(rotation) < 0.0:
+		#a mirrored mesh would face inwards, flip its faces
+		columns = columns[flipped_loop_order(mesh.loop_total)]
+
+	if mesh.uvs is not None:
+		loop_fmt = " %d/%d/%d" if mesh.normals is not None else " %d/%d"  # vert, uv, normal
+	else:
+		loop_fmt = " %d//%d" if mesh.normals is not None else " %d"
+	lines.append(format_faces(mesh.loop_total, columns + np.array(column_offsets), loop_fmt, markers))
+
+	if mesh.edges is not None:
+		lines.append(format_rows('l %d %d\n', mesh.edges + offsets[0]))
+	return "".join(lines)
+
+
+def _format_batch(batch):
+	#runs in a worker process for parallel exports. batch is a list of (text or MeshSnapshot, offsets)
+	return "".join(item if offsets is None else format_mesh(item, offsets) for item, offsets in batch)
+
+
+def format_items(items, *, jobs=0, executable=None):
+	"""
+	Formats a list of strings and MeshSnapshots, yielding the text in order. Indices go on from one snapshot
+	to the next the way the file numbers them, from 1. Exports with enough geometry are formatted by up to
+	jobs worker processes (0 for one per CPU), started with the Python executable, see library.compile_library.
+	"""
+	batches = []
+	batch = []
+	batch_loops = total_loops = 0
+	offsets = [1, 1, 1]
+	for item in items:
+		if isinstance(item, str):
+			batch.append((item, None))
+			continue
+
+		mesh = item.mesh
+		batch.append((item, tuple(offsets)))
+		offsets[0] += len(mesh.positions)
+		offsets[1] += 0 if mesh.uvs is None else len(mesh.uvs)
+		offsets[2] += 0 if mesh.normals is None else len(mesh.normals)
+
+		#instances of one mesh in a batch share its MeshData, which is sent to the worker once
+		batch_loops += len(mesh.columns)
+		if batch_loops >= BATCH_LOOPS:
+			total_loops += batch_loops
+			batches.append(batch)
+			batch = []
+			batch_loops = 0
+
+	if batch:
+		total_loops += batch_loops
+		batches.append(batch)
+
+	jobs = min(jobs or os.cpu_count() or 1, len(batches))
+	if jobs <= 1 or total_loops < PARALLEL_LOOPS:
+		for batch in batches:
+			yield _format_batch(batch)
+		return
+
+	import multiprocessing
+
+	context = multiprocessing.get_context('spawn')
+	if executable is not None:
+		context.set_executable(executable)
+
+	with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as executor:
+		#map keeps the order of the batches, whichever worker finishes first
+		yield from executor.map(_format_batch, batches)
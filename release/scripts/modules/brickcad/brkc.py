@@ -0,0 +1,256 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Compiled BRK files (.brkc), stored next to the .brk they were compiled from.
+
+A .brkc holds the BrkData of its source as raw little-endian blocks, so loading one is
+a memory map and a copy of each block, no parsing. Layout:
+
+	header      HEADER (magic, format version, parse options, source size/mtime/sha256, block count)
+	block table one BLOCK (offset, byte length) per entry of BLOCKS
+	blocks      each aligned to 8 bytes: float32 / int32 / int8 arrays, packed connector
+	            records, and a UTF-8 JSON table of the names and part references
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from .brk_parser import BrkData, parse
+
+MAGIC = b"BRKC"
+VERSION = 2
+
+HEADER = struct.Struct("<4sHHqq32sI")
+BLOCK = struct.Struct("<QQ")
+
+#BrkData attribute and item format of every block, in file order
+BLOCKS = (
+	("positions", 'f'),
+	("normals", 'f'),
+	("uvs", 'f'),
+	("loop_vertex", 'i'),
+	("loop_normal", 'i'),
+	("loop_uv", 'i'),
+	("face_loop_start", 'i'),
+	("face_loop_total", 'i'),
+	("face_smooth", 'i'),
+	("face_object", 'i'),
+	("face_invalid", 'b'),
+	("edges", 'i'),
+	("edge_object", 'i'),
+	("connectors", 'B'),
+	("vertex_group_indices", 'i'),
+	("reference_matrices", 'f'),
+	("tables", 'B'),
+)
+
+#the parse options a compiled file was made with, it is only valid for imports using the same ones
+OPTION_FLAGS = (
+	"use_smooth_groups",
+	"use_edges",
+	"use_split_objects",
+	"use_split_groups",
+	"use_groups_as_vgroups",
+)
+
+DEFAULT_OPTIONS = {
+	"use_smooth_groups": True,
+	"use_edges": True,
+	"use_split_objects": True,
+	"use_split_groups": False,
+	"use_groups_as_vgroups": False,
+}
+
+
+def option_flags(options):
+	flags = 0
+	for bit, name in enumerate(OPTION_FLAGS):
+		if options.get(name, DEFAULT_OPTIONS[name]):
+			flags |= 1 << bit
+	return flags
+
+
+def sidecar_path(filepath):
+	return os.path.splitext(filepath)[0] + ".brkc"
+
+
+def file_hash(filepath):
+	with open(filepath, 'rb') as f:
+		return hashlib.sha256(f.read()).digest()
+
+
+def write(filepath, data, source, *, source_hash=None, **options):
+	"""
+	Writes data, parsed from the file source with the given parse options, to the compiled file filepath
+	"""
+	st = os.stat(source)
+	if source_hash is None:
+		source_hash = file_hash(source)
+
+	vertex_groups = list(data.vertex_groups.items())
+	tables = {
+		"objects": data.objects,
+		"smooth_groups": data.smooth_groups,
+		"strings": data.strings,
+		"vertex_groups": [[name, len(indices)] for name, indices in vertex_groups],
+		"references": data.references,
+	}
+
+	blocks = []
+	for name, fmt in BLOCKS:
+		if name == "tables":
+			block = json.dumps(tables).encode('utf-8')
+		elif name == "vertex_group_indices":
+			block = array('i')
+			for _, indices in vertex_groups:
+				block.extend(indices)
+		else:
+			block = getattr(data, name)
+
+		if isinstance(block, array) and sys.byteorder != 'little':
+			block = array(block.typecode, block)
+			block.byteswap()
+		blocks.append(bytes(block))
+
+	offset = HEADER.size + BLOCK.size * len(blocks)
+	table = []
+	for block in blocks:
+		offset += -offset % 8
+		table.append((offset, len(block)))
+		offset += len(block)
+
+	with open(filepath, 'wb') as f:
+		f.write(HEADER.pack(MAGIC, VERSION, option_flags(options), st.st_size, st.st_mtime_ns, source_hash, len(blocks)))
+		for entry in table:
+			f.write(BLOCK.pack(*entry))
+		for (offset, _), block in zip(table, blocks):
+			f.write(b'\0' * (offset - f.tell()))
+			f.write(block)
+
+
+def read(filepath, source=None, **options):
+	"""
+	Memory maps a compiled file and returns its BrkData, its blocks copied out into arrays so the map is closed again.
+	Returns None if the file is missing or corrupt, from another format version or other parse options,
+	or (when source is given) out of date with its source.
+	"""
+	try:
+		f = open(filepath, 'rb')
+	except OSError:
+		return None
+
+	with f:
+		try:
+			mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			#empty file
+			return None
+
+	#an open map keeps the file locked on Windows, so a part couldn't be compiled again
+	try:
+		with memoryview(mm) as buf:
+			return _read_blocks(buf, source, options)
+	finally:
+		mm.close()
+
+
+def _read_blocks(buf, source, options):
+	if len(buf) < HEADER.size:
+		return None
+
+	magic, version, flags, source_size, source_mtime, source_hash, count = HEADER.unpack_from(buf)
+	if magic != MAGIC or version != VERSION or count != len(BLOCKS) or flags != option_flags(options):
+		return None
+
+	if source is not None:
+		try:
+			st = os.stat(source)
+		except OSError:
+			return None
+		if st.st_size != source_size:
+			return None
+		if st.st_mtime_ns != source_mtime and file_hash(source) != source_hash:
+			return None
+
+	data = BrkData()
+	try:
+		for i, (name, fmt) in enumerate(BLOCKS):
+			offset, length = BLOCK.unpack_from(buf, HEADER.size + BLOCK.size * i)
+			if offset + length > len(buf):
+				return None
+
+			#views into the map are released right away, the map can't close while one is alive
+			with buf[offset:offset + length] as view:
+				if name == "tables":
+					tables = json.loads(bytes(view).decode('utf-8'))
+					continue
+				if fmt == 'B':
+					block = bytearray(view)
+				else:
+					block = array(fmt)
+					block.frombytes(view)
+					if sys.byteorder != 'little':
+						block.byteswap()
+
+			if name == "vertex_group_indices":
+				indices = block
+			else:
+				setattr(data, name, block)
+
+		data.objects = tables["objects"]
+		data.smooth_groups = tables["smooth_groups"]
+		data.strings = tables["strings"]
+		data.references = tables["references"]
+
+		start = 0
+		for name, length in tables["vertex_groups"]:
+			data.vertex_groups[name] = indices[start:start + length]
+			start += length
+	except (ValueError, TypeError, KeyError, struct.error):
+		#corrupt tables, or a block that doesn't divide into its items, the source is parsed instead
+		return None
+
+	return data
+
+
+def load(filepath, **options):
+	"""
+	Returns the BrkData of a .brk file, from its compiled sidecar when there is a valid one, otherwise parsed from the text
+	"""
+	data = read(sidecar_path(filepath), filepath, **options)
+	if data is None:
+		data = parse(filepath, **options)
+
+	return data
+
+
+def compile_file(filepath, **options):
+	"""
+	Parses a .brk file and writes its sidecar, returns the BrkData
+	"""
+	data = parse(filepath, **options)
+	write(sidecar_path(filepath), data, filepath, **options)
+	return data
@@ -0,0 +1,215 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+The part catalog: the parts listed in a library's list.config, loaded once, reloaded when the
+file changes, and indexed so that searching and paging don't depend on the size of the library.
+
+list.config has one part per line:
+
+	<file relative to the library> | <display name> [| <category>]
+
+Without a category the name is split into dimensions and category, "2x4 Brick" is a 2x4 in "Brick".
+"""
+
+import os
+import re
+from bisect import bisect_left
+from collections import namedtuple
+
+from .library import DEFAULT_ROOT
+
+LIST_FILE = "list.config"
+
+#dimensions are in studs, (2, 4) or (1, 2, 3), empty if the name has none
+Part = namedtuple("Part", ("file", "name", "category", "dimensions"))
+
+_dimensions_re = re.compile(r"^\s*(\d+(?:\s*x\s*\d+)+)\s*", re.IGNORECASE)
+
+
+def dimensions_key(text):
+	"""
+	Dimensions of a '2x4' style string as a tuple of ints, None if it isn't one
+	"""
+	match = _dimensions_re.fullmatch(text)
+	if match is None:
+		return None
+	return tuple(int(n) for n in re.split(r"\s*x\s*", match.group(1).lower()))
+
+
+def parse_line(line):
+	"""
+	The Part of one list.config line, None for blank lines and comments
+	"""
+	line = line.strip()
+	if not line or line.startswith("#"):
+		return None
+
+	fields = [field.strip() for field in line.split("|")]
+	filepath = fields[0]
+	name = fields[1] if len(fields) > 1 and fields[1] else os.path.splitext(os.path.basename(filepath))[0]
+
+	dimensions = ()
+	rest = name
+	match = _dimensions_re.match(name)
+	if match is not None:
+		dimensions = dimensions_key(match.group(1))
+		rest = name[match.end():]
+
+	category = fields[2] if len(fields) > 2 and fields[2] else (rest.strip() or "Other")
+	return Part(filepath, name, category, dimensions)
+
+
+class Catalog:
+	"""
+	Parts of one library. Call refresh() before use, it only reloads when list.config changed
+	"""
+
+	#a query result is kept for each of this many recent (text, category) searches
+	QUERY_CACHE_SIZE = 8
+
+	def __init__(self, root=DEFAULT_ROOT):
+		self.root = root
+		self.path = os.path.join(root, LIST_FILE)
+		self._stat = None
+		self._clear()
+
+	def _clear(self):
+		self.parts = []
+		self.by_name = {}  #lower case name -> index into parts
+		self.by_category = {}  #category -> list of indices
+		self.by_dimensions = {}  #dimensions tuple -> list of indices
+		self.words = {}  #lower case word of a name, file or category -> set of indices
+		self.categories = []  #sorted category names
+		self._sorted_words = []
+		self._queries = {}
+
+	def refresh(self):
+		"""
+		Reloads the catalog if list.config changed (or is gone) since the last load, returns whether it did
+		"""
+		try:
+			st = os.stat(self.path)
+			stat = (st.st_mtime_ns, st.st_size)
+		except OSError:
+			stat = None
+
+		if stat == self._stat:
+			return False
+
+		self._stat = stat
+		self._clear()
+		if stat is not None:
+			with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+				for line in f:
+					part = parse_line(line)
+					if part is not None:
+						self._add(part)
+
+		self.categories = sorted(self.by_category)
+		self._sorted_words = sorted(self.words)
+		return True
+
+	def _add(self, part):
+		index = len(self.parts)
+		self.parts.append(part)
+		self.by_name.setdefault(part.name.lower(), index)
+		self.by_category.setdefault(part.category, []).append(index)
+		if part.dimensions:
+			self.by_dimensions.setdefault(part.dimensions, []).append(index)
+
+		text = " ".join((part.name, part.category, os.path.splitext(part.file)[0])).lower()
+		for word in re.split(r"[^\w]+", text):
+			if word:
+				self.words.setdefault(word, set()).add(index)
+
+	def filepath(self, part):
+		return os.path.join(self.root, part.file)
+
+	def _matches(self, term):
+		#indices of parts with a word starting with term, or with the dimensions term spells
+		dimensions = dimensions_key(term)
+		if dimensions is not None:
+			return set(self.by_dimensions.get(dimensions, ()))
+
+		found = set()
+		words = self._sorted_words
+		for i in range(bisect_left(words, term), len(words)):
+			if not words[i].startswith(term):
+				break
+			found |= self.words[words[i]]
+		return found
+
+	def query(self, text="", category=""):
+		"""
+		Indices of the parts matching every word of text and, if given, in category, in catalog order.
+		Results are cached until the catalog reloads, so redrawing with the same search is free.
+		"""
+		key = (text.strip().lower(), category)
+		result = self._queries.get(key)
+		if result is not None:
+			return result
+
+		if category:
+			candidates = set(self.by_category.get(category, ()))
+		else:
+			candidates = None
+
+		for term in key[0].split():
+			found = self._matches(term)
+			candidates = found if candidates is None else candidates & found
+			if not candidates:
+				break
+
+		result = list(range(len(self.parts))) if candidates is None else sorted(candidates)
+
+		if len(self._queries) >= self.QUERY_CACHE_SIZE:
+			del self._queries[next(iter(self._queries))]
+		self._queries[key] = result
+		return result
+
+	def search(self, text="", category="", page=0, per_page=20):
+		"""
+		One page of matching parts, returns (list of Parts, total number of matches, page count)
+		"""
+		result = self.query(text, category)
+		pages = max(1, -(-len(result) // per_page))
+		page = min(max(page, 0), pages - 1)
+		parts = self.parts
+		return [parts[i] for i in result[page * per_page:(page + 1) * per_page]], len(result), pages
+
+	def find(self, name):
+		index = self.by_name.get(name.lower())
+		return None if index is None else self.parts[index]
+
+
+#library root -> Catalog
+_catalogs = {}
+
+
+def get_catalog(root=DEFAULT_ROOT):
+	"""
+	The up to date Catalog of the library at root
+	"""
+	catalog = _catalogs.get(root)
+	if catalog is None:
+		catalog = _catalogs[root] = Catalog(root)
+	catalog.refresh()
+	return catalog
@@ -0,0 +1,136 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Broad phase of brick clash detection: world bounding boxes of many bricks, and the pairs of them that
+overlap, found by sweep and prune instead of comparing all pairs. Only those pairs need an exact test.
+Also the parts of the exact test surface intersection misses: one brick inside another.
+"""
+
+import numpy as np
+
+#candidate pairs expanded at once while sweeping, bounds the memory used by crowded models
+SWEEP_CHUNK = 1 << 20
+
+#direction of the rays counting surface crossings, skewed so they don't run along the faces and edges of grid aligned bricks
+RAY_DIRECTION = np.array((0.5377, 0.3125, 0.7833)) / np.linalg.norm((0.5377, 0.3125, 0.7833))
+
+
+def world_boxes(local_min, local_max, matrices):
+	"""
+	Axis aligned world bounds of boxes given in object space by (n, 3) local_min and local_max,
+	placed by (n, 4, 4) matrices indexed [row][column]. Returns (n, 3) arrays of mins and maxs.
+	"""
+	local_min = np.asarray(local_min, dtype=float)
+	local_max = np.asarray(local_max, dtype=float)
+	matrices = np.asarray(matrices, dtype=float)
+
+	rotation = matrices[:, :3, :3]
+	center = np.einsum('nij,nj->ni', rotation, (local_min + local_max) * 0.5) + matrices[:, :3, 3]
+	extent = np.einsum('nij,nj->ni', np.abs(rotation), (local_max - local_min) * 0.5)
+	return center - extent, center + extent
+
+
+def overlapping_pairs(mins, maxs):
+	"""
+	Pairs (i, j), i < j, of boxes that share some volume, boxes that only touch don't count.
+	Returns an (m, 2) array sorted by i, then j.
+	"""
+	mins = np.asarray(mins, dtype=float)
+	maxs = np.asarray(maxs, dtype=float)
+	count = len(mins)
+	if count < 2:
+		return np.empty((0, 2), dtype=np.intp)
+
+	#sweep along the axis the boxes are most spread out on, each box is only compared with the ones starting inside it
+	axis = int(np.argmax(np.var(mins + maxs, axis=0)))
+	order = np.argsort(mins[:, axis], kind='stable')
+	starts = mins[order, axis]
+	ends = np.searchsorted(starts, maxs[order, axis], side='left')
+	counts = np.maximum(ends - np.arange(count) - 1, 0)
+	cumulative = np.cumsum(counts)
+
+	chunks = []
+	first = 0
+	while first < count:
+		#as many boxes as keep the expansion under SWEEP_CHUNK pairs, at least one
+		stop = int(np.searchsorted(cumulative, cumulative[first] - counts[first] + SWEEP_CHUNK, side='right'))
+		stop = min(max(stop, first + 1), count)
+		chunk = counts[first:stop]
+		left = np.repeat(np.arange(first, stop), chunk)
+		right = left + 1 + np.arange(len(left)) - np.repeat(np.cumsum(chunk) - chunk, chunk)
+
+		a = order[left]
+		b = order[right]
+		keep = np.all((mins[a] < maxs[b]) & (mins[b] < maxs[a]), axis=1)
+		chunks.append(np.sort(np.column_stack((a[keep], b[keep])), axis=1))
+		first = stop
+
+	pairs = np.concatenate(chunks)
+	return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def transform_key(matrix, decimals=3):
+	"""
+	Hashable, rounded form of the 3x4 part of a 4x4 matrix. Bricks on a stud grid repeat the same few
+	relative transforms, pairs of the same shapes with the same key clash or don't alike.
+	"""
+	values = np.round(np.asarray(matrix, dtype=float)[:3].ravel(), decimals) + 0.0
+	return tuple(values.tolist())
+
+
+#transform_key of bricks placed the same way
+IDENTITY_KEY = transform_key(np.identity(4))
+
+
+def fan_triangles(polygons):
+	"""
+	(m, 3) array of vertex indices splitting polygons, lists of vertex indices, into triangle fans
+	"""
+	triangles = [(face[0], face[k], face[k + 1]) for face in polygons for k in range(1, len(face) - 1)]
+	return np.array(triangles, dtype=np.intp).reshape(-1, 3)
+
+
+def contains(vertices, triangles, point):
+	"""
+	Whether point is inside the closed surface made of (m, 3) triangles indexing the (n, 3) vertices,
+	from the parity of the number of triangles a ray from it crosses
+	"""
+	vertices = np.asarray(vertices, dtype=float)
+	if not len(triangles):
+		return False
+
+	#Moller-Trumbore against every triangle at once
+	v0 = vertices[triangles[:, 0]]
+	edge1 = vertices[triangles[:, 1]] - v0
+	edge2 = vertices[triangles[:, 2]] - v0
+	p = np.cross(RAY_DIRECTION, edge2)
+	det = np.einsum('ij,ij->i', edge1, p)
+	valid = np.abs(det) > 1e-12
+	inverse = np.zeros_like(det)
+	inverse[valid] = 1.0 / det[valid]
+
+	s = np.asarray(point, dtype=float) - v0
+	u = np.einsum('ij,ij->i', s, p) * inverse
+	q = np.cross(s, edge1)
+	v = q @ RAY_DIRECTION * inverse
+	t = np.einsum('ij,ij->i', edge2, q) * inverse
+	crossings = valid & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t > 0.0)
+	return bool(np.count_nonzero(crossings) & 1)
@@ -0,0 +1,85 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Finding the geometry of studs in a brick mesh, so studs buried in the brick above can be left out.
+A stud is the cylinder standing on its connector, every face lying wholly inside it (the stud's sides,
+its top and the part of the brick's top surface it stands on) belongs to the stud.
+"""
+
+import numpy as np
+
+#size of a stud in BrickCAD units, 6 LDU across the radius and 4 LDU high above its connector
+STUD_RADIUS = 1.5
+STUD_HEIGHT = 1.0
+
+#slack around the cylinder for float noise from transforms and the 6 decimal places of the BRK format
+EPSILON = 0.01
+
+
+def stud_labels(positions, loop_total, face_vertex, locations, directions):
+	"""
+	For each face of a mesh, the index of the stud whose cylinder holds all of its vertices, or -1.
+	positions are the (n, 3) vertices, loop_total the loops of each face, face_vertex the vertex of every loop
+	in face order, locations and directions (m, 3) arrays of the studs, all in the mesh's space.
+	"""
+	positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+	loop_total = np.asarray(loop_total)
+	face_vertex = np.asarray(face_vertex)
+	locations = np.asarray(locations, dtype=float).reshape(-1, 3)
+	directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+	if not len(loop_total):
+		return np.empty(0, dtype=np.intp)
+
+	lengths = np.linalg.norm(directions, axis=1)
+	lengths[lengths == 0.0] = 1.0
+	directions = directions / lengths[:, None]
+
+	#only the vertices in the slab of x a stud can reach are tested against it
+	vertex_stud = np.full(len(positions), -1, dtype=np.intp)
+	order = np.argsort(positions[:, 0], kind='stable')
+	xs = positions[order, 0]
+	reach = STUD_RADIUS + STUD_HEIGHT + EPSILON
+	starts = np.searchsorted(xs, locations[:, 0] - reach, side='left').tolist()
+	stops = np.searchsorted(xs, locations[:, 0] + reach, side='right').tolist()
+
+	for stud, (start, stop) in enumerate(zip(starts, stops)):
+		candidates = order[start:stop]
+		offsets = positions[candidates] - locations[stud]
+		heights = offsets @ directions[stud]
+		radii = np.linalg.norm(offsets - np.outer(heights, directions[stud]), axis=1)
+		inside = (heights >= -EPSILON) & (heights <= STUD_HEIGHT + EPSILON) & (radii <= STUD_RADIUS + EPSILON)
+		vertex_stud[candidates[inside]] = stud
+
+	labels = vertex_stud[face_vertex]
+	face_start = np.cumsum(loop_total) - loop_total
+	first = labels[face_start]
+	same = np.minimum.reduceat((labels == np.repeat(first, loop_total)).astype(np.int8), face_start)
+	return np.where(same.astype(bool), first, -1)
+
+
+def culled_faces(labels, occupied):
+	"""
+	Mask of the faces to leave out, those of the studs whose index is in occupied
+	"""
+	labels = np.asarray(labels)
+	if not len(occupied):
+		return np.zeros(len(labels), dtype=bool)
+	return np.isin(labels, np.asarray(list(occupied), dtype=np.intp))
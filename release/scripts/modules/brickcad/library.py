@@ -0,0 +1,240 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Pre-compiles the brick part library: every .brk below a directory gets its .brkc sidecar,
+parsed in worker processes, and the library gets a manifest.json recording the content hash
+and a few statistics of each part. Files whose hash matches the manifest are skipped.
+
+Usage, with the Python that ships with BrickCAD:
+
+	python -m brickcad.library [library directory] [--jobs N] [--force]
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import brk_parser, brkc
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+
+#release/datafiles/bricks, found the same way from a source checkout and an installed BrickCAD
+DEFAULT_ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "datafiles", "bricks"))
+
+#status is one of 'COMPILED', 'SKIPPED' or 'FAILED', seconds is the parse time (0 when skipped)
+CompileResult = namedtuple("CompileResult", ("path", "status", "seconds", "message"))
+
+
+def library_files(root):
+	"""
+	Paths of all the .brk files below root, relative to it and with forward slashes
+	"""
+	paths = []
+	for dirpath, dirnames, filenames in os.walk(root):
+		dirnames.sort()
+		for filename in sorted(filenames):
+			if filename.lower().endswith(".brk"):
+				paths.append(os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, "/"))
+	return paths
+
+
+def part_reference(filepath, root=DEFAULT_ROOT):
+	"""
+	How a scene file refers to the part file filepath: its path relative to the library root, with forward slashes.
+	None if the file isn't in the library.
+	"""
+	path = os.path.relpath(os.path.abspath(filepath), os.path.abspath(root))
+	if path == os.curdir or path.startswith(os.pardir) or os.path.isabs(path):
+		return None
+	return path.replace(os.sep, "/")
+
+
+def resolve_part(reference, base_dir=None, root=DEFAULT_ROOT):
+	"""
+	The part file of a reference read from a scene file in base_dir: looked up in the library,
+	then next to the scene file. None if neither has it.
+	"""
+	reference = reference.replace("/", os.sep)
+	if os.path.isabs(reference):
+		return reference if os.path.isfile(reference) else None
+
+	for directory in (root, base_dir):
+		if directory is not None:
+			filepath = os.path.join(directory, reference)
+			if os.path.isfile(filepath):
+				return os.path.normpath(filepath)
+	return None
+
+
+def load_manifest(root):
+	"""
+	The manifest of the library at root, an empty one if it has none or it is from another version
+	"""
+	try:
+		with open(os.path.join(root, MANIFEST), 'r', encoding='utf-8') as f:
+			manifest = json.load(f)
+	except (OSError, ValueError):
+		manifest = None
+
+	if (not isinstance(manifest, dict) or
+		manifest.get("version") != MANIFEST_VERSION or
+		manifest.get("format") != brkc.VERSION or
+		manifest.get("flags") != brkc.option_flags(brkc.DEFAULT_OPTIONS)):
+		manifest = {
+			"version": MANIFEST_VERSION,
+			"format": brkc.VERSION,
+			"flags": brkc.option_flags(brkc.DEFAULT_OPTIONS),
+			"files": {},
+		}
+	return manifest
+
+
+def _save_manifest(root, manifest):
+	#write next to it and swap, so a reader never sees half a manifest
+	path = os.path.join(root, MANIFEST)
+	tmp = path + ".tmp"
+	with open(tmp, 'w', encoding='utf-8') as f:
+		json.dump(manifest, f, separators=(",", ":"), sort_keys=True)
+	os.replace(tmp, path)
+
+
+def _compile_file(filepath, source_hash):
+	#runs in a worker process, returns the manifest entry of the file and its parse time
+	start = time.perf_counter()
+	with open(filepath, 'rb') as f:
+		data = brk_parser.parse_lines(f.read().splitlines(), **brkc.DEFAULT_OPTIONS)
+	seconds = time.perf_counter() - start
+
+	brkc.write(brkc.sidecar_path(filepath), data, filepath, source_hash=bytes.fromhex(source_hash), **brkc.DEFAULT_OPTIONS)
+
+	positions = data.positions
+	if len(positions):
+		bounds = [[min(positions[axis::3]) for axis in range(3)],
+				  [max(positions[axis::3]) for axis in range(3)]]
+	else:
+		bounds = [[0.0] * 3, [0.0] * 3]
+
+	entry = {
+		"sha256": source_hash,
+		"objects": [name for name in data.objects if name is not None],
+		"vertices": data.vertex_count,
+		"faces": data.face_count,
+		"connectors": data.connector_count,
+		"references": data.reference_count,
+		"bounds": bounds,
+	}
+	return entry, seconds
+
+
+def compile_library(root=DEFAULT_ROOT, *, jobs=None, force=False, executable=None, report=None):
+	"""
+	Compiles every .brk below root whose content changed since the last run (all of them with force),
+	using up to jobs worker processes. executable is the Python to start the workers with,
+	needed when running inside BrickCAD where sys.executable is BrickCAD itself.
+	report is called with each CompileResult as it comes in. Returns the list of CompileResults.
+	"""
+	import multiprocessing
+
+	manifest = load_manifest(root)
+	files = manifest["files"]
+	results = []
+
+	def done(result):
+		results.append(result)
+		if report is not None:
+			report(result)
+
+	pending = {}
+	for path in library_files(root):
+		filepath = os.path.join(root, path)
+		with open(filepath, 'rb') as f:
+			source_hash = hashlib.sha256(f.read()).hexdigest()
+
+		entry = files.get(path)
+		if (not force and entry is not None and entry.get("sha256") == source_hash and
+			os.path.exists(brkc.sidecar_path(filepath))):
+			done(CompileResult(path, 'SKIPPED', 0.0, ""))
+		else:
+			pending[path] = (filepath, source_hash)
+
+	#files that are gone from the library leave the manifest
+	for path in set(files) - set(pending) - {result.path for result in results}:
+		del files[path]
+
+	if pending:
+		#spawn rather than fork, forking a process with a UI and GPU context is asking for trouble
+		context = multiprocessing.get_context('spawn')
+		if executable is not None:
+			context.set_executable(executable)
+
+		with ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count() or 1, len(pending)), mp_context=context) as executor:
+			futures = {executor.submit(_compile_file, filepath, source_hash): path
+					   for path, (filepath, source_hash) in pending.items()}
+			for future in as_completed(futures):
+				path = futures[future]
+				try:
+					entry, seconds = future.result()
+				except Exception as ex:
+					files.pop(path, None)
+					done(CompileResult(path, 'FAILED', 0.0, str(ex)))
+				else:
+					files[path] = entry
+					done(CompileResult(path, 'COMPILED', seconds, ""))
+
+	_save_manifest(root, manifest)
+	return results
+
+
+def format_result(result):
+	if result.status == 'COMPILED':
+		return "compiled %s (%.1f ms)" % (result.path, result.seconds * 1000.0)
+	elif result.status == 'FAILED':
+		return "failed   %s: %s" % (result.path, result.message)
+	return "skipped  %s" % result.path
+
+
+def main(argv=None):
+	import argparse
+
+	parser = argparse.ArgumentParser(description="Pre-compile a BrickCAD part library to .brkc files")
+	parser.add_argument("root", nargs='?', default=DEFAULT_ROOT, help="library directory (default: %(default)s)")
+	parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes (default: one per CPU)")
+	parser.add_argument("-f", "--force", action='store_true', help="recompile files that didn't change")
+	parser.add_argument("-q", "--quiet", action='store_true', help="only print the summary")
+	args = parser.parse_args(argv)
+
+	start = time.perf_counter()
+	results = compile_library(args.root, jobs=args.jobs, force=args.force,
+							  report=None if args.quiet else lambda result: print(format_result(result)))
+
+	counts = {status: sum(1 for result in results if result.status == status) for status in ('COMPILED', 'SKIPPED', 'FAILED')}
+	print("%d compiled, %d skipped, %d failed in %.2f s" % (counts['COMPILED'], counts['SKIPPED'], counts['FAILED'],
+															time.perf_counter() - start))
+	return 1 if counts['FAILED'] else 0
+
+
+if __name__ == "__main__":
+	import sys
+	sys.exit(main())
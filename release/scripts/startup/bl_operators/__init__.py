@@ -68,11 +68,15 @@ def register():
     for mod in _modules_loaded:
         for cls in mod.classes:
             register_class(cls)
+        if hasattr(mod, "register"):
+            mod.register()
 
 
 def unregister():
     from bpy.utils import unregister_class
     for mod in reversed(_modules_loaded):
+        if hasattr(mod, "unregister"):
+            mod.unregister()
         for cls in reversed(mod.classes):
             if cls.is_registered:
                 unregister_class(cls)
@@ -1,4 +1,24 @@
+from math import pi
+
 import bpy
+import numpy as np
+from bpy.app.handlers import persistent
+from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
+from bpy_extras import view3d_utils
+from bpy_extras.io_utils import ExportHelper
+from mathutils import Matrix, Vector
+
+from brickcad import bom
+
+from . import (
+	brick_cache,
+	brick_clash,
+	brick_connectivity,
+	brick_culling,
+	brick_inventory,
+	brick_snapping,
+	brick_stability,
+)
 
 def selectWithChildren(context):
 	selected = context.selected_objects
@@ -9,6 +29,13 @@ def selectWithChildren(context):
 
 	return
 
+def selectNames(scene, names):
+	get = brick_cache.object_getter(scene.objects, names)
+	for name in names:
+		get(name).select_set(state=True)
+
+	return
+
 class SelectConnectedOP(bpy.types.Operator):
 	bl_idname = "object.select_connected"
 	bl_label = "Select connected"
@@ -18,36 +45,123 @@ class SelectConnectedOP(bpy.types.Operator):
 		return context.selected_objects is not None
 
 	def execute(self, context):
-		selectedOrig = context.selected_objects
-		selected = selectedOrig.copy()
-		allObjects = context.scene.objects
-		numObjects = len(allObjects)
-
-		brickInstances = []
-		for obj in allObjects:
-			if obj.type != "EMPTY":
-				brickInstances.append(Brick(obj))
-
-		for i in range(0, numObjects): #should terminate LONG before this, but thats a good upper bound
-			selected = context.selected_objects
-			foundLink = False
-			for selectedObj in selected:
-				for BI in brickInstances:
-					if selectedObj == BI.brick:
-						selectedBrick = BI
-						break
-				
-				for BI in brickInstances:
-					if (BI != selectedBrick) and (selectedBrick.checkIfConnected(BI)):
-						BI.brick.select_set(state=True)
-						foundLink = True
-
-			if foundLink == False:
-				#we added no new connections on the last iteration, so we're at the end
-				break
+		#the scene graph only re-evaluates bricks changed since the last query, then we walk the connections outwards from the selection
+		graph = brick_connectivity.get_graph(context.scene)
+
+		seeds = [obj.name for obj in context.selected_objects]
+		selectNames(context.scene, graph.connected_component(seeds))
 
 		return {'FINISHED'}
 
+class SelectFloatingOP(bpy.types.Operator):
+	bl_idname = "object.select_floating"
+	bl_label = "Select floating bricks"
+	bl_description = "Select the bricks that aren't attached to the rest of the model"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	mode: EnumProperty(
+			name="Select",
+			items=(('DETACHED', "Detached Assemblies", "Every assembly but the largest"),
+				   ('SINGLE', "Single Bricks", "Bricks connected to nothing"),
+				   ),
+			default='DETACHED',
+			)
+
+	isolate: BoolProperty(
+			name="Isolate",
+			description="Hide every other brick",
+			default=False,
+			)
+
+	def execute(self, context):
+		#all the assemblies at once, from one pass over the connections of the scene graph
+		assemblies = brick_connectivity.get_graph(context.scene).components()
+
+		if self.mode == 'DETACHED':
+			chosen = assemblies[1:]
+		else:
+			chosen = [assembly for assembly in assemblies if len(assembly) == 1]
+		names = {name for assembly in chosen for name in assembly}
+
+		if bpy.ops.object.select_all.poll():
+			bpy.ops.object.select_all(action='DESELECT')
+		selectNames(context.scene, names)
+
+		if self.isolate:
+			#connectors are shown or hidden with their brick
+			for obj in context.view_layer.objects:
+				parent = obj.parent
+				owner = parent.name if parent is not None and not brick_connectivity.is_brick(obj) else obj.name
+				obj.hide_set(owner not in names)
+
+		self.report({'INFO'}, "%d assemblies (%s), %d bricks selected" % (len(assemblies), assemblySizes(assemblies), len(names)))
+		return {'FINISHED'}
+
+def assemblySizes(assemblies, shown=10):
+	sizes = ", ".join(str(len(assembly)) for assembly in assemblies[:shown])
+	return sizes + ", ..." if len(assemblies) > shown else sizes
+
+@persistent
+def checkFloatingOnSave(_):
+	#validation before saving, the graph is kept up to date so this only costs the union-find pass
+	scene = bpy.context.scene
+	if scene is None or not scene.brick_check_floating:
+		return
+
+	assemblies = brick_connectivity.get_graph(scene).components()
+	if len(assemblies) > 1:
+		detached = sum(len(assembly) for assembly in assemblies[1:])
+		print("Warning: %d bricks are not attached to the main assembly, %d assemblies (%s)" % (detached, len(assemblies), assemblySizes(assemblies)))
+
+class AnalyzeStabilityOP(bpy.types.Operator):
+	bl_idname = "object.analyze_stability"
+	bl_label = "Analyze stability"
+	bl_description = "Select the bricks resting on nothing and the joints held by too few studs, and show support as object colors"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	show_heat_map: BoolProperty(
+			name="Heat Map",
+			description="Color bricks by the studs holding them up, kept up to date while building",
+			default=True,
+			)
+
+	def execute(self, context):
+		scene = context.scene
+		analysis = brick_stability.get_analysis(scene)
+
+		unsupported = analysis.unsupported()
+		#the bricks of weak joints are left selected, the report only counts them
+		names = set(unsupported)
+		names.update(name for pair in analysis.weak for name in pair)
+
+		if bpy.ops.object.select_all.poll():
+			bpy.ops.object.select_all(action='DESELECT')
+		selectNames(scene, names)
+
+		if self.show_heat_map != scene.brick_show_stability:
+			scene.brick_show_stability = self.show_heat_map
+
+		self.report({'WARNING'} if names else {'INFO'}, "%d unsupported bricks, %d weak joints, %d bricks selected" % (len(unsupported), len(analysis.weak), len(names)))
+		return {'FINISHED'}
+
+def updateStabilityHeatMap(scene, context):
+	if scene.brick_show_stability:
+		brick_stability.show_heat_map(scene, everything=True)
+		#object colors only show with the object color shading
+		screen = context.screen
+		if screen is not None:
+			for area in screen.areas:
+				if area.type == 'VIEW_3D':
+					area.spaces.active.shading.color_type = 'OBJECT'
+	else:
+		brick_stability.hide_heat_map(scene)
+
+def updateStudCulling(scene, context):
+	if scene.brick_cull_studs:
+		brick_culling.cull_studs(scene, everything=True)
+	else:
+		brick_culling.uncull_studs(scene)
+
 class SelectByColorOP(bpy.types.Operator):
 	bl_idname = "object.select_color"
 	bl_label = "Select by color"
@@ -57,18 +171,9 @@ class SelectByColorOP(bpy.types.Operator):
 		return context.selected_objects is not None
 
 	def execute(self, context):
-		selected = context.selected_objects
-		selectedColors = []
-
-		for brick in selected:
-			brickMat = brick.material_slots[0].name
-			if brickMat not in selectedColors:
-				selectedColors.append(brickMat)
-
-		#now select all other objects with that material
-		for obj in context.scene.objects:
-			if (len(obj.material_slots) > 0) and (obj.material_slots[0].name in selectedColors):
-				obj.select_set(state=True)
+		#the inventory indexes bricks by color, so only the bricks to select are looked at
+		inventory = brick_inventory.get_inventory(context.scene)
+		selectNames(context.scene, inventory.select(context.selected_objects, inventory.by_color, 1))
 
 		return {'FINISHED'}
 
@@ -81,13 +186,8 @@ class SelectByMouldOP(bpy.types.Operator):
 		return context.selected_objects is not None
 
 	def execute(self, context):
-		selected = context.selected_objects
-
-		for brick in selected:
-			mouldName = brick.name.split(".")[0]
-			for otherBrick in context.scene.objects:
-				if otherBrick.name.split(".")[0] == mouldName:
-					otherBrick.select_set(state=True)
+		inventory = brick_inventory.get_inventory(context.scene)
+		selectNames(context.scene, inventory.select(context.selected_objects, inventory.by_mould, 0))
 
 		return {'FINISHED'}
 		
@@ -100,28 +200,8 @@ class SelectByMouldAndColorOP(bpy.types.Operator):
 		return context.selected_objects is not None
 		
 	def execute(self, context):
-		selected = context.selected_objects
-
-		#get list of all mould-pair combinations
-		mouldColorPairs = []
-		
-		for brick in selected:
-			mouldName = brick.name.split(".")[0]
-			brickMat = brick.material_slots[0].name
-			
-			newPair = [mouldName, brickMat]
-			
-			if newPair not in mouldColorPairs:
-				mouldColorPairs.append(newPair)
-			
-		for brick in context.scene.objects:
-			if brick.type != "EMPTY":
-				mouldName = brick.name.split(".")[0]
-				brickMat = brick.material_slots[0].name
-				thisPair = [mouldName, brickMat]
-			
-				if thisPair in mouldColorPairs:
-					brick.select_set(state=True)
+		inventory = brick_inventory.get_inventory(context.scene)
+		selectNames(context.scene, inventory.select(context.selected_objects, inventory.by_key))
 			
 		return {'FINISHED'}
 
@@ -130,27 +210,93 @@ class ListPartsOP(bpy.types.Operator):
 	bl_label = "List parts"
 
 	def execute(self, context):
-		partsCount = [] #array of paired part name and quantity
-
-		for brick in context.scene.objects:
-			if brick.type != "EMPTY":
-				#check if part of this name is already in the array
-				found = False
-				for pair in partsCount:
-					if pair[0] == brick.name.split(".")[0]:
-						#found it, increment count
-						pair[1] = pair[1] + 1
-						found = True
-						break
-
-				#if we didn't find it, add a new entry
-				if found == False:
-					partsCount.append([brick.name.split(".")[0], 1])
+		#counted once per scene and kept up to date as bricks change, so listing again is free
+		inventory = brick_inventory.get_inventory(context.scene)
 
 		#print the whole partslist, for early debugging (will eventually go to its own editor panel)
-		for pair in partsCount:
-			print(pair[0] + ": " + str(pair[1]))
-		
+		for mould, count in sorted(inventory.mould_counts().items()):
+			print(mould + ": " + str(count))
+
+		self.report({'INFO'}, "%d bricks, %d different parts" % (len(inventory.keys), len(inventory.counts)))
+		return {'FINISHED'}
+
+class ExportPartsListOP(bpy.types.Operator, ExportHelper):
+	bl_idname = "object.export_parts_list"
+	bl_label = "Export parts list"
+	bl_description = "Write the bill of materials of the scene, counted by mould and color"
+
+	filename_ext = ".csv"
+	filter_glob: StringProperty(
+			default="*.csv;*.json;*.xml",
+			options={'HIDDEN'},
+			)
+
+	format: EnumProperty(
+			name="Format",
+			items=(('CSV', "CSV", "Comma separated part, color and quantity"),
+				   ('JSON', "JSON", "List of part, color and quantity objects"),
+				   ('BRICKLINK', "BrickLink XML", "BrickLink wanted list"),
+				   ),
+			default='CSV',
+			)
+
+	def check(self, context):
+		self.filename_ext = bom.FORMATS[self.format][0]
+		return ExportHelper.check(self, context)
+
+	def execute(self, context):
+		inventory = brick_inventory.get_inventory(context.scene)
+		bom.write(self.filepath, inventory.rows(), self.format)
+
+		return {'FINISHED'}
+
+class SelectClashingOP(bpy.types.Operator):
+	bl_idname = "object.select_clashing"
+	bl_label = "Select clashing bricks"
+	bl_description = "Select the bricks that occupy the same volume as another brick"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	margin: FloatProperty(
+			name="Margin",
+			description="How far bricks may reach into each other without clashing, so touching bricks don't",
+			min=0.0, soft_max=1.0,
+			default=brick_clash.DEFAULT_MARGIN,
+			precision=3,
+			)
+
+	def execute(self, context):
+		#only bricks whose bounding boxes overlap are tested exactly
+		clashes = brick_clash.find_clashes(context.scene, margin=self.margin)
+
+		if bpy.ops.object.select_all.poll():
+			bpy.ops.object.select_all(action='DESELECT')
+
+		#the selection shows which bricks clash, the report only counts them
+		names = {name for pair in clashes for name in pair}
+		selectNames(context.scene, names)
+
+		self.report({'INFO'} if not clashes else {'WARNING'}, "%d clashing pairs of bricks, %d bricks selected" % (len(clashes), len(names)))
+		return {'FINISHED'}
+
+class AssignBrickIDsOP(bpy.types.Operator):
+	bl_idname = "object.assign_brick_ids"
+	bl_label = "Assign brick IDs"
+	bl_description = "Give bricks from before part IDs their part and color ID, found from their name and material"
+
+	def execute(self, context):
+		scene = context.scene
+		assigned = 0
+
+		for obj in scene.objects:
+			if obj.brick_part_id != brick_inventory.UNKNOWN_PART:
+				continue
+			if obj.type == 'EMPTY':
+				obj.brick_part_id = brick_inventory.NOT_A_BRICK
+			else:
+				brick_inventory.set_brick_ids(scene, obj, brick_inventory.brick_mould(obj.name))
+				assigned += 1
+
+		self.report({'INFO'}, "Assigned IDs to %d bricks" % assigned)
 		return {'FINISHED'}
 
 class SelectBrickOP(bpy.types.Operator):
@@ -183,44 +329,204 @@ class DeleteBrickOP(bpy.types.Operator):
 
 		return {'FINISHED'}
 
-class Brick:
-	#we use this to maintain a linked web of all brick-to-brick connections. Lots of stuff to optimize here, and it only works for stud-hole connections at the moment
-	def __init__(self, brick):
-		self.brick = brick
-		self.children = brick.children
-		self.uncheckedStuds = []
-		self.uncheckedHoles = []
-
-		for child in self.children:
-			if child.name.startswith("stud up") or child.name.startswith("stud_up"): #temp will later simplify this, currently maintaining backwards compatibility with the demo files
-				self.uncheckedStuds.append(child)
-			elif child.name.startswith("stud hole") or child.name.startswith("stud_hole"): #ditto
-				self.uncheckedHoles.append(child)
-
-		self.links = []
-
-	def checkIfConnected(self, otherBrick):
-		#this unfortunately changes the runtime depending on where the brick is located. If you start near the top of a structure and move down (through the holes, not studs) it increases runtime because it has to go through studs first anyway
-		for stud in self.uncheckedStuds:
-			for hole in otherBrick.uncheckedHoles:
-				if stud.matrix_world.translation == hole.matrix_world.translation:
-					#bricks are connected
-					self.links.append(otherBrick)
-					self.uncheckedStuds.remove(stud)
-					otherBrick.links.append(self)
-					otherBrick.uncheckedHoles.remove(hole)
-					return True
-
-		for hole in self.uncheckedHoles:
-			for stud in otherBrick.uncheckedStuds:
-				if stud.matrix_world.translation == hole.matrix_world.translation:
-					#bricks are connected
-					self.links.append(otherBrick)
-					self.uncheckedHoles.remove(hole)
-					otherBrick.links.append(stud)
-					otherBrick.uncheckedStuds.remove(stud)
-					return True
-
-		return False
-
-classes = [SelectConnectedOP, SelectByColorOP, SelectByMouldOP, SelectByMouldAndColorOP, ListPartsOP, SelectBrickOP, DeleteBrickOP]
+class PlaceBrickOP(bpy.types.Operator):
+	bl_idname = "object.place_brick"
+	bl_label = "Place brick"
+	bl_description = "Move the selected bricks with the mouse, snapping their studs and holes onto the nearest free ones"
+	bl_options = {'REGISTER', 'UNDO', 'BLOCKING'}
+
+	snap_distance: FloatProperty(
+			name="Snap Distance",
+			description="Largest distance a connector jumps to reach a free connector of another brick",
+			min=0.0, soft_max=10.0,
+			default=2.5,
+			)
+
+	#ray casts that hit a brick being placed go on through it, at most this many times
+	MAX_HITS = 8
+
+	@classmethod
+	def poll(cls, context):
+		return context.area is not None and context.area.type == 'VIEW_3D' and any(brick_connectivity.is_brick(obj) for obj in context.selected_objects)
+
+	def invoke(self, context, event):
+		scene = context.scene
+		selected = context.selected_objects
+		names = {obj.name for obj in selected}
+		#connectors move with their brick, only the top level of the selection is moved
+		self.objects = [obj for obj in selected if obj.parent is None or obj.parent.name not in names]
+		self.starts = [obj.matrix_world.copy() for obj in self.objects]
+
+		bricks = [obj for obj in self.objects if brick_connectivity.is_brick(obj)]
+		self.reference = bricks[0]
+		self.exclude = {obj.name for obj in selected}
+
+		#the trees of free connectors are brought up to date once, moving the bricks around doesn't touch them
+		self.free = brick_snapping.get_free_connectors(scene)
+		table = brick_connectivity.get_connector_table(scene)
+
+		#connectors of the moved bricks, relative to the reference brick
+		inverse = np.array(self.reference.matrix_world.inverted())
+		self.connectors = []
+		for obj in bricks:
+			connectors = table.bricks.get(obj.name)
+			if connectors is not None and len(connectors.types):
+				self.connectors.append((connectors.types,
+										connectors.locations @ inverse[:3, :3].T + inverse[:3, 3],
+										connectors.directions @ inverse[:3, :3].T))
+		self.is_stud = np.concatenate([types == brick_connectivity.ConnectorType.STUD for types, _, _ in self.connectors]) if self.connectors else np.empty(0, dtype=bool)
+		locations = np.concatenate([chunk[1] for chunk in self.connectors]) if self.connectors else np.zeros((0, 3))
+		directions = np.concatenate([chunk[2] for chunk in self.connectors]) if self.connectors else np.zeros((0, 3))
+		self.locations = locations
+		self.directions = directions
+
+		#the point held under the mouse: the middle of the holes, which go down onto other bricks' studs
+		holes = locations[~self.is_stud]
+		grab = holes.mean(axis=0) if len(holes) else (locations.mean(axis=0) if len(locations) else np.zeros(3))
+		self.grab = Vector(grab.tolist())
+
+		self.matrix = self.reference.matrix_world.copy()
+		self.update(context, event)
+
+		context.window_manager.modal_handler_add(self)
+		context.area.header_text_set("Place brick: click to place, R to rotate, right click or Esc to cancel")
+		return {'RUNNING_MODAL'}
+
+	def modal(self, context, event):
+		if event.type == 'MOUSEMOVE':
+			self.update(context, event)
+		elif event.type == 'R' and event.value == 'PRESS':
+			#quarter turn about the vertical through the held point
+			pivot = self.matrix @ self.grab
+			self.matrix = Matrix.Translation(pivot) @ Matrix.Rotation(pi / 2, 4, 'Z') @ Matrix.Translation(-pivot) @ self.matrix
+			self.update(context, event)
+		elif event.type == 'LEFTMOUSE' and event.value == 'PRESS':
+			context.area.header_text_set(None)
+			return {'FINISHED'}
+		elif event.type in {'RIGHTMOUSE', 'ESC'} and event.value == 'PRESS':
+			for obj, matrix in zip(self.objects, self.starts):
+				obj.matrix_world = matrix
+			context.area.header_text_set(None)
+			return {'CANCELLED'}
+		elif event.type in {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE'}:
+			#let the view be navigated while placing
+			return {'PASS_THROUGH'}
+
+		return {'RUNNING_MODAL'}
+
+	def hit(self, context, event):
+		#where the mouse ray meets the scene, leaving out the bricks being placed, or the ground
+		region = context.region
+		view = context.region_data
+		co = (event.mouse_region_x, event.mouse_region_y)
+		origin = view3d_utils.region_2d_to_origin_3d(region, view, co)
+		direction = view3d_utils.region_2d_to_vector_3d(region, view, co)
+
+		for _ in range(self.MAX_HITS):
+			result, location, _, _, obj, _ = context.scene.ray_cast(context.view_layer, origin, direction)
+			if not result:
+				break
+			if obj.name not in self.exclude and (obj.parent is None or obj.parent.name not in self.exclude):
+				return location
+			origin = location + direction * 1e-4
+
+		if abs(direction.z) > 1e-6:
+			distance = -origin.z / direction.z
+			if distance > 0.0:
+				return origin + direction * distance
+		return None
+
+	def update(self, context, event):
+		location = self.hit(context, event)
+		if location is not None:
+			self.matrix.translation += location - self.matrix @ self.grab
+
+		if len(self.locations):
+			matrix = np.array(self.matrix)
+			locations = (self.locations @ matrix[:3, :3].T + matrix[:3, 3]).tolist()
+			directions = self.directions @ matrix[:3, :3].T
+			lengths = np.linalg.norm(directions, axis=1)
+			lengths[lengths == 0.0] = 1.0
+			directions = (directions / lengths[:, None]).tolist()
+
+			placements = list(zip(locations, directions))
+			studs = [placement for placement, isStud in zip(placements, self.is_stud.tolist()) if isStud]
+			holes = [placement for placement, isStud in zip(placements, self.is_stud.tolist()) if not isStud]
+			offset = self.free.snap(studs, holes, self.snap_distance, self.exclude)
+			if offset is not None:
+				self.matrix.translation += Vector(offset)
+
+		#every moved object keeps its place relative to the reference brick
+		delta = self.matrix @ self.starts[self.objects.index(self.reference)].inverted()
+		for obj, start in zip(self.objects, self.starts):
+			obj.matrix_world = delta @ start
+
+classes = [brick_inventory.BrickPart, brick_inventory.BrickColor, SelectConnectedOP, SelectFloatingOP, AnalyzeStabilityOP, SelectByColorOP, SelectByMouldOP, SelectByMouldAndColorOP, ListPartsOP, ExportPartsListOP, AssignBrickIDsOP, SelectBrickOP, DeleteBrickOP, PlaceBrickOP, SelectClashingOP]
+
+
+def register():
+	from bpy.props import CollectionProperty, FloatProperty, IntProperty
+
+	bpy.types.Scene.brick_connection_tolerance = FloatProperty(
+			name="Connection Tolerance",
+			description="Largest distance between a stud and a hole for the bricks to count as connected",
+			min=0.0, max=brick_connectivity.MAX_TOLERANCE,
+			default=brick_connectivity.DEFAULT_TOLERANCE,
+			precision=4,
+			)
+	bpy.types.Scene.brick_show_stability = BoolProperty(
+			name="Stability Heat Map",
+			description="Color bricks by the studs holding them up: red for resting on nothing, through orange and yellow to green",
+			default=False,
+			update=updateStabilityHeatMap,
+			)
+	bpy.types.Scene.brick_cull_studs = BoolProperty(
+			name="Cull Hidden Studs",
+			description="Leave the studs pushed into other bricks out of the bricks' meshes, for the viewport and rendering",
+			default=False,
+			update=updateStudCulling,
+			)
+	bpy.types.Scene.brick_check_floating = BoolProperty(
+			name="Check Floating Bricks",
+			description="Warn when saving a scene with bricks that aren't attached to its main assembly",
+			default=False,
+			)
+
+	bpy.types.Scene.brick_parts = CollectionProperty(type=brick_inventory.BrickPart)
+	bpy.types.Scene.brick_colors = CollectionProperty(type=brick_inventory.BrickColor)
+
+	bpy.types.Object.brick_part_id = IntProperty(
+			name="Part ID",
+			description="Index of the brick's mould in the scene's part table, 0 when unknown, -1 for objects that aren't bricks",
+			min=-1,
+			default=brick_inventory.UNKNOWN_PART,
+			)
+	bpy.types.Object.brick_color_id = IntProperty(
+			name="Color ID",
+			description="Index of the brick's color in the scene's color table, 0 for no color",
+			min=0,
+			)
+
+	brick_cache.register()
+	brick_stability.register()
+	brick_culling.register()
+	if checkFloatingOnSave not in bpy.app.handlers.save_pre:
+		bpy.app.handlers.save_pre.append(checkFloatingOnSave)
+
+
+def unregister():
+	if checkFloatingOnSave in bpy.app.handlers.save_pre:
+		bpy.app.handlers.save_pre.remove(checkFloatingOnSave)
+	brick_culling.unregister()
+	brick_stability.unregister()
+	brick_cache.unregister()
+
+	del bpy.types.Object.brick_color_id
+	del bpy.types.Object.brick_part_id
+	del bpy.types.Scene.brick_colors
+	del bpy.types.Scene.brick_parts
+
+	del bpy.types.Scene.brick_check_floating
+	del bpy.types.Scene.brick_cull_studs
+	del bpy.types.Scene.brick_show_stability
+	del bpy.types.Scene.brick_connection_tolerance
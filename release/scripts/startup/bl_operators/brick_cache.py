@@ -0,0 +1,171 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Per-scene caches for the brick tools, kept up to date by depsgraph update handlers.
+
+Each cache lives as long as the scene it belongs to (until undo or a new file is loaded).
+The handlers only record which objects changed, the work of bringing a cache up to date
+is done lazily the next time a tool asks for it with get().
+"""
+
+import bpy
+from bpy.app.handlers import persistent
+
+_caches = {}  #scene pointer -> {cache class: cache instance}
+
+
+class SceneCache:
+	"""
+	Base class for data derived from the objects of one scene.
+	Subclasses implement rebuild() to compute everything from scratch, and update() to refresh only the given objects.
+	"""
+
+	uses_materials = False  #rebuild whenever any material changes
+
+	def __init__(self):
+		self.valid = False
+		self.dirty = set()  #names of objects changed since the last sync
+		self.check_members = False  #objects may have been added or deleted since the last sync
+		self.members = set()  #names of the objects this cache currently knows about
+
+	def tag(self, name):
+		self.dirty.add(name)
+
+	def tag_members(self):
+		self.check_members = True
+
+	def tag_all(self):
+		self.valid = False
+
+	def sync(self, scene):
+		if not self.valid:
+			self.dirty.clear()
+			self.check_members = False
+			self.members = set(scene.objects.keys())
+			self.rebuild(scene)
+			self.valid = True
+			return
+
+		if not self.dirty <= self.members:
+			#new or renamed objects, the old names have to be dropped
+			self.check_members = True
+
+		if self.check_members:
+			#cheap set difference on names, only the objects that came or went are refreshed
+			self.check_members = False
+			current = set(scene.objects.keys())
+			self.dirty |= current ^ self.members
+			self.members = current
+
+		if self.dirty:
+			dirty = self.dirty
+			self.dirty = set()
+			self.update(scene, dirty)
+
+	def rebuild(self, scene):
+		raise NotImplementedError
+
+	def update(self, scene, names):
+		raise NotImplementedError
+
+
+def get(scene, cls):
+	"""
+	Returns the up to date cache of type cls for scene, creating it on first use
+	"""
+	caches = _caches.setdefault(scene.as_pointer(), {})
+	cache = caches.get(cls)
+	if cache is None:
+		cache = caches[cls] = cls()
+
+	cache.sync(scene)
+	return cache
+
+
+def object_getter(objects, names):
+	"""
+	Returns a function looking up objects by name.
+	Every objects.get() is a linear search, so for more than a handful of names a dictionary of the whole collection is built once instead.
+	"""
+	if len(names) <= 16:
+		return objects.get
+	return dict(zip(objects.keys(), objects)).get
+
+
+@persistent
+def _depsgraph_update_post(scene):
+	caches = _caches.get(scene.as_pointer())
+	if not caches:
+		return
+
+	names = set()
+	members = False
+	everything = False
+
+	depsgraph = bpy.context.evaluated_depsgraph_get()
+	for update in depsgraph.updates:
+		id = update.id
+		if isinstance(id, bpy.types.Object):
+			names.add(id.name)
+			#connector empties belong to the brick they are parented to
+			if id.parent is not None:
+				names.add(id.parent.name)
+		elif isinstance(id, (bpy.types.Scene, bpy.types.Collection)):
+			#objects linked or unlinked
+			members = True
+		elif isinstance(id, bpy.types.Material):
+			#materials are shared, we don't know which objects use them
+			everything = True
+
+	for cache in caches.values():
+		if everything and cache.uses_materials:
+			cache.tag_all()
+			continue
+		cache.dirty |= names
+		if members:
+			cache.tag_members()
+
+
+@persistent
+def _clear_all(_):
+	#undo, redo and loading a file reallocate the scenes, caches of the old pointers would never be used again
+	_caches.clear()
+
+
+_handlers = (
+	(bpy.app.handlers.depsgraph_update_post, _depsgraph_update_post),
+	(bpy.app.handlers.undo_post, _clear_all),
+	(bpy.app.handlers.redo_post, _clear_all),
+	(bpy.app.handlers.load_post, _clear_all),
+)
+
+
+def register():
+	for handlers, func in _handlers:
+		if func not in handlers:
+			handlers.append(func)
+
+
+def unregister():
+	for handlers, func in _handlers:
+		if func in handlers:
+			handlers.remove(func)
+	_caches.clear()
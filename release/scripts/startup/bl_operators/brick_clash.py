@@ -0,0 +1,204 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Clash detection, bricks occupying the same volume. Bricks are paired up by their world bounding boxes
+(brickcad.clash), and only those pairs are tested exactly: with BVHTree.overlap, which finds surfaces crossing,
+and for bricks whose surfaces don't cross, whether one is inside the other.
+BVHTree.overlap misses coplanar triangles, so two bricks of the same shape in the same place always clash.
+"""
+
+import numpy as np
+from mathutils.bvhtree import BVHTree
+
+from brickcad import clash
+
+from . import brick_connectivity
+
+#how far (in BrickCAD units) surfaces are pulled in before testing, so bricks that only touch,
+#stacked or with a stud in a hole, don't clash. Stud grid mistakes are a whole LDU (0.25) or more
+DEFAULT_MARGIN = 0.05
+
+
+def mesh_geometry(mesh):
+	"""
+	Returns the vertices of a mesh as an (n, 3) array, its vertex normals the same way, and its polygons as lists of vertex indices
+	"""
+	vertices = np.empty(len(mesh.vertices) * 3)
+	normals = np.empty(len(mesh.vertices) * 3)
+	mesh.vertices.foreach_get("co", vertices)
+	mesh.vertices.foreach_get("normal", normals)
+
+	loop_start = np.empty(len(mesh.polygons), dtype=np.intc)
+	loop_total = np.empty(len(mesh.polygons), dtype=np.intc)
+	mesh.polygons.foreach_get("loop_start", loop_start)
+	mesh.polygons.foreach_get("loop_total", loop_total)
+	loop_vertex = np.empty(len(mesh.loops), dtype=np.intc)
+	mesh.loops.foreach_get("vertex_index", loop_vertex)
+
+	polygons = [loop_vertex[start:start + total].tolist() for start, total in zip(loop_start.tolist(), loop_total.tolist())]
+	return vertices.reshape(-1, 3), normals.reshape(-1, 3), polygons
+
+
+class Shape:
+	"""
+	Geometry of a brick mesh or part collection in object space, with its surfaces pulled in by the margin
+	"""
+
+	def __init__(self, pieces, margin):
+		#pieces are (vertices, vertex normals, polygons, 4x4 matrix placing them in the shape)
+		vertices = []
+		polygons = []
+		offset = 0
+		for co, normals, faces, matrix in pieces:
+			rotation = matrix[:3, :3]
+			moved = co @ rotation.T + matrix[:3, 3]
+			turned = normals @ rotation.T
+			lengths = np.linalg.norm(turned, axis=1)
+			lengths[lengths == 0.0] = 1.0
+			vertices.append(moved - turned * (margin / lengths)[:, None])
+			polygons.extend([index + offset for index in face] for face in faces)
+			offset += len(co)
+
+		self.vertices = np.concatenate(vertices) if vertices else np.zeros((0, 3))
+		self.polygons = polygons
+		self.min = self.vertices.min(axis=0) if len(self.vertices) else np.zeros(3)
+		self.max = self.vertices.max(axis=0) if len(self.vertices) else np.zeros(3)
+		self._tree = None
+		self._triangles = None
+
+	def __bool__(self):
+		return bool(self.polygons)
+
+	def tree(self, matrix=None):
+		"""
+		BVHTree of the shape, moved by matrix. The unmoved tree is built once
+		"""
+		if matrix is None:
+			if self._tree is None:
+				self._tree = BVHTree.FromPolygons(self.vertices.tolist(), self.polygons)
+			return self._tree
+
+		vertices = self.vertices @ matrix[:3, :3].T + matrix[:3, 3]
+		return BVHTree.FromPolygons(vertices.tolist(), self.polygons)
+
+	def contains(self, point):
+		"""
+		Whether point, in the space of the shape, is inside it
+		"""
+		if self._triangles is None:
+			self._triangles = clash.fan_triangles(self.polygons)
+		return clash.contains(self.vertices, self._triangles, point)
+
+
+def shapes_clash(first, second, relative):
+	"""
+	Whether Shape second, placed by the 4x4 matrix relative in the space of first, shares volume with it
+	"""
+	if first.tree().overlap(second.tree(relative)):
+		return True
+
+	#no surfaces cross, one may still be inside the other
+	inside = second.vertices[0] @ relative[:3, :3].T + relative[:3, 3]
+	if first.contains(inside):
+		return True
+	inverse = np.linalg.inv(relative)
+	return second.contains(first.vertices[0] @ inverse[:3, :3].T + inverse[:3, 3])
+
+
+def shape_key(obj):
+	"""
+	What the shape of a brick is read from, bricks with the same key share it. None for objects without one
+	"""
+	if obj.type == 'MESH':
+		return ('MESH', obj.data.name)
+	if obj.instance_type == 'COLLECTION' and obj.instance_collection is not None:
+		return ('COLLECTION', obj.instance_collection.name)
+	return None
+
+
+def read_shape(obj, margin):
+	if obj.type == 'MESH':
+		return Shape([mesh_geometry(obj.data) + (np.identity(4),)], margin)
+
+	#the meshes of a part collection, where they sit relative to its instance offset
+	collection = obj.instance_collection
+	offset = np.identity(4)
+	offset[:3, 3] = -np.array(collection.instance_offset)
+	pieces = []
+	for part in collection.all_objects:
+		if part.type == 'MESH':
+			pieces.append(mesh_geometry(part.data) + (offset @ np.array(part.matrix_world),))
+	return Shape(pieces, margin)
+
+
+def find_clashes(scene, objects=None, margin=DEFAULT_MARGIN):
+	"""
+	Returns the pairs of names of bricks that occupy the same volume, among objects (default every object of scene).
+	Pairs of the same shapes placed the same way relative to each other are only tested once.
+	"""
+	if objects is None:
+		objects = scene.objects
+
+	names = []
+	keys = []
+	shapes = {}
+	for obj in objects:
+		key = shape_key(obj)
+		if key is None:
+			continue
+		shape = shapes.get(key)
+		if shape is None:
+			shape = shapes[key] = read_shape(obj, margin)
+		if shape:
+			names.append(obj.name)
+			keys.append(key)
+
+	if len(names) < 2:
+		return []
+
+	#broad phase: bounding boxes of the pulled in shapes, which bricks that only touch don't overlap
+	matrices = np.transpose(brick_connectivity.read_matrices(scene.objects, names), (0, 2, 1))
+	mins, maxs = clash.world_boxes([shapes[key].min for key in keys], [shapes[key].max for key in keys], matrices)
+	pairs = clash.overlapping_pairs(mins, maxs)
+
+	#narrow phase: exact test of the candidates, in the space of the first brick of the pair
+	inverses = {}
+	results = {}
+	clashes = []
+	for i, j in pairs.tolist():
+		inverse = inverses.get(i)
+		if inverse is None:
+			inverse = inverses[i] = np.linalg.inv(matrices[i])
+		relative = inverse @ matrices[j]
+
+		resultKey = (keys[i], keys[j], clash.transform_key(relative))
+		result = results.get(resultKey)
+		if result is None:
+			if keys[i] == keys[j] and resultKey[2] == clash.IDENTITY_KEY:
+				#a duplicate brick, its surfaces lie on the other's
+				result = True
+			else:
+				result = shapes_clash(shapes[keys[i]], shapes[keys[j]], relative)
+			results[resultKey] = result
+		if result:
+			clashes.append((names[i], names[j]))
+
+	return clashes
@@ -0,0 +1,646 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Spatial hash of stud and hole connectors, so the brick tools can find
+brick-to-brick connections without comparing every pair of bricks.
+"""
+
+from bisect import bisect_right
+from collections import Counter, deque, namedtuple
+from enum import IntEnum
+from math import floor
+
+import numpy as np
+
+from . import brick_cache
+
+#1 BrickCAD unit is 1.6mm and 1 LDraw unit (LDU) is 0.4mm. Studs are 5 units (20 LDU) apart and a brick is 6 units (24 LDU) tall,
+#so every connector sits on a whole LDU and we can hash on integer LDU coordinates
+LDU_PER_UNIT = 4
+
+#how far apart (in BrickCAD units) a stud and hole may be and still count as connected. Absorbs float noise from
+#rotations, scaling and the 6 decimal places of the BRK format, must stay well under half an LDU
+DEFAULT_TOLERANCE = 0.01
+MAX_TOLERANCE = 0.1
+
+#a stud only mates with a hole facing the opposite way, this is the cosine of the largest allowed angle between them
+MATE_COS = 0.99
+
+#temp will later simplify this, currently maintaining backwards compatibility with the demo files
+STUD_PREFIXES = ("stud up", "stud_up")
+HOLE_PREFIXES = ("stud hole", "stud_hole")
+
+
+class ConnectorType(IntEnum):
+	STUD = 0
+	HOLE = 1
+
+
+def connector_type(name):
+	"""
+	Returns the ConnectorType of a connector empty from its name, or None if it isn't one
+	"""
+	if name.startswith(STUD_PREFIXES):
+		return ConnectorType.STUD
+	elif name.startswith(HOLE_PREFIXES):
+		return ConnectorType.HOLE
+	return None
+
+
+def _cell(value):
+	return floor(value * LDU_PER_UNIT + 0.5)
+
+
+def grid_key(co):
+	"""
+	Returns the canonical integer LDU grid cell of a world space location
+	"""
+	return (_cell(co[0]), _cell(co[1]), _cell(co[2]))
+
+
+def probe_keys(co, tolerance):
+	"""
+	Returns every grid cell a point within tolerance of co could have been hashed to.
+	Usually just one, at most 8 while the tolerance is under half a cell.
+	"""
+	ranges = [range(_cell(v - tolerance), _cell(v + tolerance) + 1) for v in co]
+	return [(x, y, z) for x in ranges[0] for y in ranges[1] for z in ranges[2]]
+
+
+def is_brick(obj):
+	#connectors are empties, everything else is treated as a brick. Empties instancing a part collection are instanced bricks
+	return obj.type != 'EMPTY' or (obj.instance_type == 'COLLECTION' and obj.instance_collection is not None)
+
+
+#ID properties of a brick's mesh holding its connectors, in object space: ConnectorType per connector,
+#then flat x, y, z lists of locations and facing directions (studs face out of the brick, holes into it)
+CONNECTOR_TYPES = "brick_connector_type"
+CONNECTOR_LOCATIONS = "brick_connector_co"
+CONNECTOR_DIRECTIONS = "brick_connector_dir"
+
+
+def has_connector_layer(mesh):
+	return mesh is not None and CONNECTOR_TYPES in mesh
+
+
+def set_connector_layer(mesh, types, locations, directions):
+	"""
+	Stores connectors on a mesh, types is a sequence of ConnectorType, locations and directions (n, 3) arrays
+	"""
+	mesh[CONNECTOR_TYPES] = [int(kind) for kind in types]
+	mesh[CONNECTOR_LOCATIONS] = np.asarray(locations, dtype=float).ravel().tolist()
+	mesh[CONNECTOR_DIRECTIONS] = np.asarray(directions, dtype=float).ravel().tolist()
+
+
+def mesh_layout(mesh):
+	"""
+	Returns the connectors stored on a mesh as (names, ConnectorType array, (n, 3) locations, (n, 3) Z axes)
+	in object space, the same form as read from connector empties, or None if it has none
+	"""
+	if not has_connector_layer(mesh):
+		return None
+
+	types = np.array(mesh[CONNECTOR_TYPES], dtype=np.int8)
+	locations = np.array(mesh[CONNECTOR_LOCATIONS], dtype=float).reshape(-1, 3)
+	axes = np.array(mesh[CONNECTOR_DIRECTIONS], dtype=float).reshape(-1, 3)
+	#the layer stores facing directions, hole empties point the other way
+	axes[types == ConnectorType.HOLE] *= -1.0
+
+	names = ["%s.%d" % (STUD_PREFIXES[1] if kind == ConnectorType.STUD else HOLE_PREFIXES[1], i) for i, kind in enumerate(types.tolist())]
+	return names, types, locations, axes
+
+
+def part_layout(collection):
+	"""
+	Returns the connectors of a part collection as (names, ConnectorType array, (n, 3) locations, (n, 3) Z axes),
+	relative to the collection's instance offset
+	"""
+	names = []
+	types = []
+	locations = []
+	axes = []
+
+	for obj in collection.all_objects:
+		if obj.type == 'MESH':
+			layout = mesh_layout(obj.data)
+			if layout is not None:
+				#connectors of the part's mesh, moved to where the mesh sits in the part
+				rows = np.array([column[:] for column in obj.matrix_world.col])
+				names.extend(layout[0])
+				types.extend(layout[1].tolist())
+				locations.extend((layout[2] @ rows[:3, :3] + rows[3, :3]).tolist())
+				axes.extend((layout[3] @ rows[:3, :3]).tolist())
+			continue
+
+		kind = connector_type(obj.name)
+		if kind is None or obj.parent is None or not is_brick(obj.parent) or has_connector_layer(obj.parent.data):
+			continue
+		matrix = obj.matrix_world
+		names.append(obj.name)
+		types.append(kind)
+		locations.append(matrix.translation[:])
+		axes.append(matrix.col[2].xyz[:])
+
+	locations = np.array(locations, dtype=float).reshape(-1, 3) - np.array(collection.instance_offset)
+	return names, np.array(types, dtype=np.int8), locations, np.array(axes, dtype=float).reshape(-1, 3)
+
+
+def read_matrices(objects, names):
+	"""
+	Returns the world matrices of the named objects as an (n, 4, 4) array, stored column by column:
+	row i of a matrix holds axis i and row 3 the translation.
+	Large batches are fetched with a single foreach_get over the matrices of the whole scene.
+	"""
+	count = len(names)
+	if count > 16:
+		matrices = np.empty(len(objects) * 16, dtype=np.float32)
+		objects.foreach_get("matrix_world", matrices)
+		matrices.shape = (-1, 4, 4)
+
+		order = {name: i for i, name in enumerate(objects.keys())}
+		return matrices[[order[name] for name in names]].astype(float)
+
+	rows = np.empty((count, 4, 4))
+	for i, name in enumerate(names):
+		rows[i] = [column[:] for column in objects.get(name).matrix_world.col]
+	return rows
+
+
+def read_placements(objects, names):
+	"""
+	Returns (locations, Z axes) of the named objects as two (n, 3) arrays
+	"""
+	rows = read_matrices(objects, names)
+	return rows[:, 3, :3], rows[:, 2, :3]
+
+
+class BrickConnectors(namedtuple("BrickConnectors", ("names", "types", "locations", "directions"))):
+	"""
+	Connectors of one brick: their names, a ConnectorType array, and (n, 3) arrays of world locations and facing directions
+	"""
+	__slots__ = ()
+
+	def placements(self):
+		"""
+		Returns (studs, holes) as lists of (location, direction) tuples, for ConnectionIndex.add_connectors
+		"""
+		studs = []
+		holes = []
+		for kind, co, direction in zip(self.types.tolist(), self.locations.tolist(), self.directions.tolist()):
+			if kind == ConnectorType.STUD:
+				studs.append((co, direction))
+			else:
+				holes.append((co, direction))
+
+		return studs, holes
+
+
+class ConnectorTable(brick_cache.SceneCache):
+	"""
+	Every connector of every brick in a scene, as per-brick arrays.
+	Connector empties are classified by name once, moving a brick only re-reads the matrices of its own connectors.
+	"""
+
+	#after this many logged changes per brick consumers rebuild instead of replaying the log
+	LOG_LIMIT = 2
+
+	def __init__(self):
+		super().__init__()
+		self.types = {}  #connector name -> ConnectorType
+		self.owners = {}  #connector name -> brick name
+		self.children = {}  #brick name -> connector names
+		self.bricks = {}  #brick name -> BrickConnectors
+		#bricks whose connectors aren't objects of the scene: instanced bricks and meshes with a connector layer.
+		#Their connectors come from a layout in object space, shared by every brick using the same part collection or mesh
+		self.sources = {}  #brick name -> layout key, ('COLLECTION', name) or ('MESH', name)
+		self.layouts = {}  #layout key -> (names, types, locations, Z axes)
+
+		#change log, so caches built on top of this table can catch up on just the bricks that changed
+		self.revision = 0
+		self.rebuild_revision = 0
+		self.log_revisions = []
+		self.log_names = []
+
+	def rebuild(self, scene):
+		self.types.clear()
+		self.owners.clear()
+		self.children.clear()
+		self.bricks.clear()
+		self.sources.clear()
+		self.layouts.clear()
+
+		fresh = set()
+		for obj in scene.objects:
+			if is_brick(obj):
+				self._add_brick(obj, fresh)
+			else:
+				self._classify(obj)
+
+		self._read(scene, self.children.keys())
+
+		self.revision += 1
+		self.rebuild_revision = self.revision
+		self.log_revisions.clear()
+		self.log_names.clear()
+
+	def update(self, scene, names):
+		get = brick_cache.object_getter(scene.objects, names)
+		changed = set()
+		fresh = set()
+		pending = list(names)
+
+		while pending:
+			name = pending.pop()
+			owner = self.owners.pop(name, None)
+			if owner is not None:
+				#connector, forget where it was and re-classify below
+				del self.types[name]
+				self.children[owner].remove(name)
+				changed.add(owner)
+
+			obj = get(name)
+			self.sources.pop(name, None)
+			if obj is None:
+				children = self.children.pop(name, None)
+				if children is not None:
+					#deleted or renamed brick, its connectors may now belong to a brick of another name
+					self.bricks.pop(name, None)
+					changed.add(name)
+					for child in children:
+						del self.types[child]
+						del self.owners[child]
+					pending.extend(children)
+			elif is_brick(obj):
+				self._add_brick(obj, fresh)
+				changed.add(name)
+			else:
+				self._classify(obj, changed)
+
+		self._read(scene, [name for name in changed if name in self.children])
+
+		self.revision += 1
+		for name in changed:
+			self.log_revisions.append(self.revision)
+			self.log_names.append(name)
+
+		if len(self.log_names) > self.LOG_LIMIT * len(self.children) + 1024:
+			self.rebuild_revision = self.revision
+			self.log_revisions.clear()
+			self.log_names.clear()
+
+	def _add_brick(self, obj, fresh):
+		#fresh holds the layout keys already read during this rebuild or update, others are read again in case the part changed
+		self.children.setdefault(obj.name, [])
+		if obj.type == 'EMPTY':
+			collection = obj.instance_collection
+			key = ('COLLECTION', collection.name)
+			if key not in fresh:
+				fresh.add(key)
+				self.layouts[key] = part_layout(collection)
+		elif has_connector_layer(obj.data):
+			key = ('MESH', obj.data.name)
+			if key not in fresh:
+				fresh.add(key)
+				self.layouts[key] = mesh_layout(obj.data)
+		else:
+			return
+		self.sources[obj.name] = key
+
+	def _classify(self, obj, changed=None):
+		#changed gets the brick a connector belongs to, a rebuild reads every brick anyway
+		name = obj.name
+		parent = obj.parent
+		kind = connector_type(name)
+		if kind is not None and parent is not None and is_brick(parent):
+			self.types[name] = kind
+			self.owners[name] = parent.name
+			self.children.setdefault(parent.name, []).append(name)
+			if changed is not None:
+				changed.add(parent.name)
+
+	def _read(self, scene, bricks):
+		#one batch of matrix reads for the connector objects of all the given bricks, and one for the bricks with a layout
+		bricks = list(bricks)
+		sources = self.sources
+		objects = scene.objects
+
+		names = [name for brick in bricks if brick not in sources for name in self.children[brick]]
+		locations, axes = read_placements(objects, names)
+		types = np.fromiter((self.types[name] for name in names), dtype=np.int8, count=len(names))
+
+		#bricks with a layout have no connector objects (or only ones for show), theirs are the layout moved by the brick's matrix
+		chunks = {}
+		start = 0
+		for brick in bricks:
+			if brick in sources:
+				continue
+			end = start + len(self.children[brick])
+			chunks[brick] = (names[start:end], types[start:end], locations[start:end], axes[start:end])
+			start = end
+
+		placed = [brick for brick in bricks if brick in sources]
+		if placed:
+			matrices = read_matrices(objects, placed)
+			byLayout = {}
+			for i, brick in enumerate(placed):
+				byLayout.setdefault(sources[brick], []).append(i)
+
+			for key, indices in byLayout.items():
+				layoutNames, layoutTypes, layoutLocations, layoutAxes = self.layouts[key]
+				rows = matrices[indices]
+				#(bricks, connectors, 3): rotate/scale by the 3x3 part of each brick's matrix, then translate
+				worldLocations = np.einsum('kji,mj->kmi', rows[:, :3, :3], layoutLocations) + rows[:, None, 3, :3]
+				worldAxes = np.einsum('kji,mj->kmi', rows[:, :3, :3], layoutAxes)
+				for k, i in enumerate(indices):
+					chunks[placed[i]] = (layoutNames, layoutTypes, worldLocations[k], worldAxes[k])
+
+		if not bricks:
+			return
+
+		ordered = [chunks[brick] for brick in bricks]
+		types = np.concatenate([chunk[1] for chunk in ordered])
+		locations = np.concatenate([chunk[2] for chunk in ordered])
+		axes = np.concatenate([chunk[3] for chunk in ordered])
+
+		lengths = np.linalg.norm(axes, axis=1)
+		lengths[lengths == 0.0] = 1.0
+		directions = axes / lengths[:, None]
+		directions[types == ConnectorType.HOLE] *= -1.0
+
+		start = 0
+		for brick, chunk in zip(bricks, ordered):
+			end = start + len(chunk[1])
+			self.bricks[brick] = BrickConnectors(chunk[0], types[start:end], locations[start:end], directions[start:end])
+			start = end
+
+	def changes(self, since):
+		"""
+		Returns the names of bricks added, removed or changed after revision since,
+		or None if that is too long ago and the caller should rebuild from scratch
+		"""
+		if since < self.rebuild_revision:
+			return None
+
+		return set(self.log_names[bisect_right(self.log_revisions, since):])
+
+
+def get_connector_table(scene):
+	"""
+	Returns the up to date ConnectorTable of scene
+	"""
+	return brick_cache.get(scene, ConnectorTable)
+
+
+class ConnectorMap:
+	"""
+	Connectors of one kind (studs or holes) hashed on their LDU grid cell.
+	Entries are (owner, location, direction), lookups probe only the few cells within tolerance of the location.
+	"""
+
+	def __init__(self, tolerance=DEFAULT_TOLERANCE):
+		self.tolerance = tolerance
+		self.cells = {}  #grid key -> list of entries
+
+	def add(self, owner, co, direction):
+		key = grid_key(co)
+		self.cells.setdefault(key, []).append((owner, co, direction))
+		return key
+
+	def remove(self, key, owner):
+		entries = self.cells[key]
+		entries[:] = [entry for entry in entries if entry[0] != owner]
+		if not entries:
+			del self.cells[key]
+
+	def mates(self, co, direction):
+		"""
+		Returns the entries that mate with a connector of the opposite kind at co facing direction
+		"""
+		found = []
+		x, y, z = co
+		dx, dy, dz = direction
+		tolerance = self.tolerance
+		limit = tolerance * tolerance
+
+		for key in probe_keys(co, tolerance):
+			for entry in self.cells.get(key, ()):
+				ex, ey, ez = entry[1]
+				fx, fy, fz = entry[2]
+				if ((ex - x) ** 2 + (ey - y) ** 2 + (ez - z) ** 2 <= limit and
+						fx * dx + fy * dy + fz * dz <= -MATE_COS):
+					found.append(entry)
+
+		return found
+
+
+class ConnectionIndex:
+	"""
+	Stud and hole ConnectorMaps of many bricks, plus the links between bricks they imply.
+	Bricks are stored by name, a brick is connected to another if one of its studs mates with one of the other's holes.
+	"""
+
+	def __init__(self, tolerance=DEFAULT_TOLERANCE):
+		self.studs = ConnectorMap(tolerance)
+		self.holes = ConnectorMap(tolerance)
+		self.connectors = {}  #brick name -> (stud keys, hole keys)
+		self.links = {}  #brick name -> Counter of connected brick name -> number of joined stud/hole pairs
+
+	def add_connectors(self, name, studs, holes):
+		"""
+		Adds a brick from lists of (location, direction) pairs
+		"""
+		links = self.links[name] = Counter()
+		studKeys = []
+		holeKeys = []
+
+		for co, direction in studs:
+			for entry in self.holes.mates(co, direction):
+				links[entry[0]] += 1
+			studKeys.append(self.studs.add(name, co, direction))
+		for co, direction in holes:
+			for entry in self.studs.mates(co, direction):
+				links[entry[0]] += 1
+			holeKeys.append(self.holes.add(name, co, direction))
+
+		#a brick can't connect to itself
+		links.pop(name, None)
+		for other, count in links.items():
+			self.links[other][name] += count
+
+		self.connectors[name] = (studKeys, holeKeys)
+
+	def remove_brick(self, name):
+		connectors = self.connectors.pop(name, None)
+		if connectors is None:
+			return
+
+		studKeys, holeKeys = connectors
+		for key in set(studKeys):
+			self.studs.remove(key, name)
+		for key in set(holeKeys):
+			self.holes.remove(key, name)
+
+		for other in self.links.pop(name):
+			del self.links[other][name]
+
+	def neighbours(self, name):
+		"""
+		Returns the names of all bricks directly connected to the brick called name
+		"""
+		return self.links[name].keys()
+
+	def occupied(self, name, connectors):
+		"""
+		Returns a bool array telling which of the BrickConnectors of the brick called name mate with a connector of another brick
+		"""
+		result = np.zeros(len(connectors.types), dtype=bool)
+		for i, (kind, co, direction) in enumerate(zip(connectors.types.tolist(), connectors.locations.tolist(), connectors.directions.tolist())):
+			mates = self.holes if kind == ConnectorType.STUD else self.studs
+			result[i] = any(entry[0] != name for entry in mates.mates(co, direction))
+		return result
+
+	def connected_component(self, names):
+		"""
+		Breadth-first search over the connections, returns the names of every brick reachable from the given bricks
+		"""
+		visited = {name for name in names if name in self.connectors}
+		queue = deque(visited)
+
+		while queue:
+			for other in self.neighbours(queue.popleft()):
+				if other not in visited:
+					visited.add(other)
+					queue.append(other)
+
+		return visited
+
+	def components(self):
+		"""
+		Returns the names of the bricks of every connected assembly, as lists, largest first.
+		A single union-find pass over the links, near linear in the number of bricks and links.
+		"""
+		names = list(self.connectors)
+		indices = {name: i for i, name in enumerate(names)}
+		parents = list(range(len(names)))
+		sizes = [1] * len(names)
+
+		def find(i):
+			#path halving, every step points a brick at its grandparent
+			while parents[i] != i:
+				parents[i] = parents[parents[i]]
+				i = parents[i]
+			return i
+
+		for name, links in self.links.items():
+			for other in links:
+				a = find(indices[name])
+				b = find(indices[other])
+				if a != b:
+					#the smaller tree goes under the larger, which keeps them shallow
+					if sizes[a] < sizes[b]:
+						a, b = b, a
+					parents[b] = a
+					sizes[a] += sizes[b]
+
+		assemblies = {}
+		for i, name in enumerate(names):
+			assemblies.setdefault(find(i), []).append(name)
+
+		return sorted(assemblies.values(), key=len, reverse=True)
+
+
+def affected_bricks(changed, neighbours, index):
+	"""
+	Returns the bricks whose connections may have changed with the bricks of changed: those, the bricks they
+	were connected to (neighbours, brick name -> names, as last seen by the caller) and the ones they are now
+	"""
+	affected = set(changed)
+	for name in changed:
+		affected.update(neighbours.get(name, ()))
+		links = index.links.get(name)
+		if links:
+			affected.update(links)
+	return affected
+
+
+def build_index(table, tolerance=DEFAULT_TOLERANCE):
+	"""
+	Builds a ConnectionIndex of every brick in a ConnectorTable, in a single pass
+	"""
+	index = ConnectionIndex(tolerance)
+
+	for name, connectors in table.bricks.items():
+		index.add_connectors(name, *connectors.placements())
+
+	return index
+
+
+class ConnectivityGraph(brick_cache.SceneCache):
+	"""
+	Scene-wide ConnectionIndex, kept alive between operator calls.
+	It follows the change log of the scene's ConnectorTable, so only the bricks that were moved, added,
+	deleted or duplicated since the last query are re-evaluated.
+	"""
+
+	def __init__(self):
+		super().__init__()
+		self.tolerance = DEFAULT_TOLERANCE
+		self.index = ConnectionIndex(self.tolerance)
+		self.revision = -1
+
+	def sync(self, scene):
+		table = get_connector_table(scene)
+
+		tolerance = scene.brick_connection_tolerance
+		if tolerance != self.tolerance:
+			self.tolerance = tolerance
+			self.tag_all()
+
+		changed = table.changes(self.revision) if self.valid else None
+		if changed is None:
+			self.index = build_index(table, self.tolerance)
+			self.valid = True
+		else:
+			index = self.index
+			for name in changed:
+				index.remove_brick(name)
+				connectors = table.bricks.get(name)
+				if connectors is not None:
+					index.add_connectors(name, *connectors.placements())
+
+		self.revision = table.revision
+		self.dirty.clear()
+
+	def neighbours(self, name):
+		return self.index.neighbours(name)
+
+	def connected_component(self, names):
+		return self.index.connected_component(names)
+
+	def components(self):
+		return self.index.components()
+
+
+def get_graph(scene):
+	"""
+	Returns the up to date ConnectivityGraph of scene
+	"""
+	return brick_cache.get(scene, ConnectivityGraph)
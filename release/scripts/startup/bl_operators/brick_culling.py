@@ -0,0 +1,265 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Hidden stud culling. A stud pushed into the brick above can't be seen, the connection data tells which
+studs those are and brickcad.culling which faces make them up. Bricks in the scene get a copy of their
+mesh without them, shared by every brick of the same mesh with the same buried studs, and the exporter
+can leave them out of the file.
+"""
+
+import bpy
+import numpy as np
+from bpy.app.handlers import persistent
+
+from brickcad import culling
+
+from . import brick_cache, brick_connectivity
+
+#custom properties of a culled mesh copy: the name of the whole mesh, and which of its studs are left out
+CULLED_FROM = "brick_culled_from"
+CULLED_STUDS = "brick_culled_studs"
+
+#seconds after an edit before culling is brought up to date, edits in between are handled together
+REFRESH_DELAY = 0.2
+
+
+class StudCulling(brick_cache.SceneCache):
+	"""
+	The buried studs of every brick of a scene, as indices among the brick's studs in ConnectorTable order.
+	Follows the change log of the scene's ConnectorTable like FreeConnectors.
+	"""
+
+	def __init__(self):
+		super().__init__()
+		self.buried = {}  #brick name -> tuple of stud indices, only bricks with buried studs
+		self.neighbours = {}  #brick name -> names of the bricks it was connected to at the last sync
+		self.updated = set()  #bricks whose buried studs changed since take_updates()
+		self.tolerance = None
+		self.revision = -1
+
+	def sync(self, scene):
+		graph = brick_connectivity.get_graph(scene)
+		table = brick_connectivity.get_connector_table(scene)
+		index = graph.index
+
+		changed = table.changes(self.revision) if self.valid and graph.tolerance == self.tolerance else None
+		if changed is None:
+			self.updated |= self.buried.keys()
+			self.buried.clear()
+			self.neighbours.clear()
+			names = table.bricks.keys()
+			self.tolerance = graph.tolerance
+			self.valid = True
+		else:
+			names = brick_connectivity.affected_bricks(changed, self.neighbours, index)
+
+		for name in names:
+			self._refresh(name, table, index)
+
+		self.revision = table.revision
+		self.dirty.clear()
+
+	def _refresh(self, name, table, index):
+		connectors = table.bricks.get(name)
+		buried = ()
+		if connectors is None:
+			self.neighbours.pop(name, None)
+		else:
+			links = index.links.get(name)
+			self.neighbours[name] = set(links) if links else set()
+			studs = connectors.types == brick_connectivity.ConnectorType.STUD
+			buried = tuple(np.flatnonzero(index.occupied(name, connectors)[studs]).tolist())
+
+		if buried != self.buried.get(name, ()):
+			self.updated.add(name)
+			if buried:
+				self.buried[name] = buried
+			else:
+				del self.buried[name]
+
+	def take_updates(self):
+		"""
+		Returns the names of the bricks whose buried studs changed since the last call
+		"""
+		updated = self.updated
+		self.updated = set()
+		return updated
+
+
+def get_stud_culling(scene):
+	"""
+	Returns the up to date StudCulling of scene
+	"""
+	return brick_cache.get(scene, StudCulling)
+
+
+def local_studs(connectors, matrix):
+	"""
+	Locations and directions of the studs of a brick's BrickConnectors in the space of its mesh, matrix being its world matrix
+	"""
+	studs = connectors.types == brick_connectivity.ConnectorType.STUD
+	inverse = np.linalg.inv(np.asarray(matrix, dtype=float))
+	locations = connectors.locations[studs] @ inverse[:3, :3].T + inverse[:3, 3]
+	directions = connectors.directions[studs] @ inverse[:3, :3].T
+	return locations, directions
+
+
+def studs_key(locations):
+	#studs of bricks of the same mesh are the same up to float noise
+	return tuple((np.round(locations, 3) + 0.0).ravel().tolist())
+
+
+def mesh_faces(mesh):
+	"""
+	Returns the (n, 3) vertices of a mesh, the loop count of each face and the vertex of each loop in face order
+	"""
+	positions = np.empty(len(mesh.vertices) * 3)
+	mesh.vertices.foreach_get("co", positions)
+	loop_start = np.empty(len(mesh.polygons), dtype=np.intc)
+	loop_total = np.empty(len(mesh.polygons), dtype=np.intc)
+	mesh.polygons.foreach_get("loop_start", loop_start)
+	mesh.polygons.foreach_get("loop_total", loop_total)
+	loop_vertex = np.empty(len(mesh.loops), dtype=np.intc)
+	mesh.loops.foreach_get("vertex_index", loop_vertex)
+
+	offsets = np.cumsum(loop_total) - loop_total
+	face_loops = np.arange(int(loop_total.sum())) + np.repeat(loop_start - offsets, loop_total)
+	return positions.reshape(-1, 3), loop_total, loop_vertex[face_loops]
+
+
+def whole_mesh(obj):
+	"""
+	The mesh a brick has when none of its studs are culled
+	"""
+	name = obj.data.get(CULLED_FROM)
+	if name is None:
+		return obj.data
+	return bpy.data.meshes.get(name) or obj.data
+
+
+#(whole mesh name, studs_key) -> stud index of every face, and (whole mesh name, studs_key, buried studs) -> culled mesh name
+_labels = {}
+_culled = {}
+
+
+def culled_mesh(mesh, locations, directions, buried):
+	"""
+	A copy of mesh without the faces of the buried studs, made once for every mesh and set of studs
+	"""
+	import bmesh
+
+	key = (mesh.name, studs_key(locations))
+	culledKey = key + (buried,)
+	culled = bpy.data.meshes.get(_culled.get(culledKey, ""))
+	studs = ",".join(map(str, buried))
+	if culled is not None and culled.get(CULLED_FROM) == mesh.name and culled.get(CULLED_STUDS) == studs:
+		return culled
+
+	labels = _labels.get(key)
+	if labels is None:
+		labels = _labels[key] = culling.stud_labels(*mesh_faces(mesh), locations, directions)
+
+	culled = mesh.copy()
+	culled.name = mesh.name + ".culled"
+	culled[CULLED_FROM] = mesh.name
+	culled[CULLED_STUDS] = studs
+
+	bm = bmesh.new()
+	bm.from_mesh(culled)
+	bm.faces.ensure_lookup_table()
+	faces = bm.faces
+	bmesh.ops.delete(bm, geom=[faces[i] for i in np.flatnonzero(culling.culled_faces(labels, buried)).tolist()], context='FACES')
+	bm.to_mesh(culled)
+	bm.free()
+
+	_culled[culledKey] = culled.name
+	return culled
+
+
+def cull_studs(scene, everything=False):
+	"""
+	Gives the bricks of scene whose buried studs changed a mesh without them, or their whole mesh back.
+	Every brick with buried studs if everything.
+	"""
+	analysis = get_stud_culling(scene)
+	updated = analysis.take_updates()
+	names = updated | analysis.buried.keys() if everything else updated
+
+	table = brick_connectivity.get_connector_table(scene)
+	get = brick_cache.object_getter(scene.objects, names)
+	for name in names:
+		obj = get(name)
+		connectors = table.bricks.get(name)
+		if obj is None or obj.type != 'MESH' or connectors is None:
+			continue
+
+		mesh = whole_mesh(obj)
+		buried = analysis.buried.get(name)
+		if buried:
+			mesh = culled_mesh(mesh, *local_studs(connectors, obj.matrix_world), buried)
+		#swapping meshes is an edit too, only swap the ones that differ so refreshing settles
+		if obj.data != mesh:
+			obj.data = mesh
+
+
+def uncull_studs(scene):
+	"""
+	Gives every brick of scene its whole mesh back
+	"""
+	for obj in scene.objects:
+		if obj.type == 'MESH' and CULLED_FROM in obj.data:
+			obj.data = whole_mesh(obj)
+
+
+def _refresh():
+	scene = bpy.context.scene
+	if scene is not None and scene.brick_cull_studs:
+		cull_studs(scene)
+	return None
+
+
+@persistent
+def _depsgraph_update_post(scene):
+	#the caches only record what changed here, culling catches up once the edits pause
+	if scene.brick_cull_studs and not bpy.app.timers.is_registered(_refresh):
+		bpy.app.timers.register(_refresh, first_interval=REFRESH_DELAY)
+
+
+@persistent
+def _clear_meshes(_):
+	_labels.clear()
+	_culled.clear()
+
+
+def register():
+	if _depsgraph_update_post not in bpy.app.handlers.depsgraph_update_post:
+		bpy.app.handlers.depsgraph_update_post.append(_depsgraph_update_post)
+	if _clear_meshes not in bpy.app.handlers.load_post:
+		bpy.app.handlers.load_post.append(_clear_meshes)
+
+
+def unregister():
+	if _clear_meshes in bpy.app.handlers.load_post:
+		bpy.app.handlers.load_post.remove(_clear_meshes)
+	if _depsgraph_update_post in bpy.app.handlers.depsgraph_update_post:
+		bpy.app.handlers.depsgraph_update_post.remove(_depsgraph_update_post)
+	if bpy.app.timers.is_registered(_refresh):
+		bpy.app.timers.unregister(_refresh)
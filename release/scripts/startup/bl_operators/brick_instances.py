@@ -0,0 +1,218 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Instanced bricks. The geometry and connectors of each part file are imported once into a part
+collection, kept out of every scene under the "Brick Parts" collection. A placed brick is then an
+empty instancing that collection, with nothing of its own but a transform and its part and color IDs.
+
+The part collections are also where the parts referenced by a scene file ('r' lines) are resolved from.
+"""
+
+import os
+
+import bpy
+from brickcad import library
+from mathutils import Matrix
+
+from . import brick_inventory, import_brk
+
+PARTS_COLLECTION = "Brick Parts"
+
+#custom properties of a part collection, telling which file it was imported from and when
+PART_FILE = "brick_part_file"
+PART_MTIME = "brick_part_mtime"
+
+
+def parts_root():
+	"""
+	The collection all part collections are children of, it isn't linked to any scene
+	"""
+	root = bpy.data.collections.get(PARTS_COLLECTION)
+	if root is None:
+		root = bpy.data.collections.new(PARTS_COLLECTION)
+		#only instances use the parts, keep them when saving even if no brick is placed
+		root.use_fake_user = True
+	return root
+
+
+def find_part_collection(filepath):
+	for collection in parts_root().children:
+		if collection.get(PART_FILE) == filepath:
+			return collection
+	return None
+
+
+def part_collection(context, filepath, **keywords):
+	"""
+	The part collection of a .brk file, importing the file (again, if it changed on disk) when needed.
+	keywords are passed on to import_brk.load_objects.
+	"""
+	filepath = os.path.abspath(filepath)
+	mtime = os.stat(filepath).st_mtime
+
+	collection = find_part_collection(filepath)
+	if collection is not None:
+		if collection.get(PART_MTIME) == mtime:
+			return collection
+
+		#the file changed, reload it in place so existing instances pick up the new geometry
+		for obj in list(collection.objects):
+			bpy.data.objects.remove(obj)
+	else:
+		collection = bpy.data.collections.new(os.path.splitext(os.path.basename(filepath))[0])
+		collection[PART_FILE] = filepath
+		parts_root().children.link(collection)
+
+	collection[PART_MTIME] = mtime
+	import_brk.load_objects(context, filepath, collection=collection, **keywords)
+	return collection
+
+
+def part_mould(scene, collection):
+	"""
+	Mould of a part collection, that of its only brick or the collection name for multi-object parts
+	"""
+	bricks = [obj for obj in collection.objects if obj.type != 'EMPTY']
+	if len(bricks) == 1:
+		partId = bricks[0].brick_part_id
+		if 0 < partId <= len(scene.brick_parts):
+			return scene.brick_parts[partId - 1].name
+	return collection.name
+
+
+def part_matrix(collection):
+	"""
+	World matrix of the first brick of a part collection. A reference's transform places this brick,
+	the others follow it.
+	"""
+	for obj in collection.objects:
+		if obj.type != 'EMPTY':
+			return obj.matrix_world.copy()
+	return Matrix()
+
+
+def find_material(color):
+	#exporters write material names with underscores for spaces
+	materials = bpy.data.materials
+	return materials.get(color) or materials.get(color.replace("_", " "))
+
+
+def set_color(obj, color):
+	"""
+	Gives one brick of a shared mesh its own material, as its color
+	"""
+	material = find_material(color)
+	slots = obj.material_slots
+	if material is None or not len(slots) or slots[0].material == material:
+		return
+	slots[0].link = 'OBJECT'
+	slots[0].material = material
+
+
+def add_references(context, collection, references, base_dir=None, use_instancing=False, global_matrix=None, **keywords):
+	"""
+	Places parts referenced by a scene file in collection. references are (part reference, color, 4x4 matrix)
+	as read from the file, found in the part library or base_dir. A part is placed as an instance of its part
+	collection with use_instancing, otherwise as linked duplicates of the objects in it.
+	keywords are passed on to import_brk.load_objects for parts that aren't imported yet.
+	Returns the new objects and the set of references whose part wasn't found.
+	"""
+	scene = context.scene
+	if global_matrix is None:
+		global_matrix = Matrix()
+
+	parts = {}  #reference -> (file, part collection, mould, inverted part matrix, bricks with their mould), None when missing
+	missing = set()
+	new_objects = []
+	link = collection.objects.link
+
+	for reference, color, matrix in references:
+		part = parts.get(reference, ...)
+		if part is ...:
+			filepath = library.resolve_part(reference, base_dir)
+			if filepath is None:
+				part = None
+			else:
+				partCollection = part_collection(context, filepath, global_matrix=global_matrix, **keywords)
+				partIds = scene.brick_parts
+				bricks = []
+				for obj in partCollection.objects:
+					if obj.type != 'EMPTY':
+						partId = obj.brick_part_id
+						mould = partIds[partId - 1].name if 0 < partId <= len(partIds) else brick_inventory.brick_mould(obj.name)
+						bricks.append((obj, mould))
+				part = (filepath, partCollection, part_mould(scene, partCollection), part_matrix(partCollection).inverted(), bricks)
+			parts[reference] = part
+
+		if part is None:
+			missing.add(reference)
+			continue
+
+		filepath, partCollection, mould, inverse, bricks = part
+		#the transform maps the part file into the scene file, both in file axes
+		placement = global_matrix @ Matrix(matrix) @ inverse
+
+		if use_instancing:
+			brick = bpy.data.objects.new(mould, None)
+			brick.instance_type = 'COLLECTION'
+			brick.instance_collection = partCollection
+			brick.matrix_world = placement
+			link(brick)
+			brick.brick_part_id = brick_inventory.part_id(scene, mould, filepath)
+			if color:
+				material = find_material(color)
+				brick.brick_color_id = brick_inventory.color_id(scene, material.name if material is not None else color)
+			new_objects.append(brick)
+			continue
+
+		for source, sourceMould in bricks:
+			#shares the mesh, and with it the connectors, with the part
+			brick = source.copy()
+			brick.matrix_world = placement @ source.matrix_world
+			if color:
+				set_color(brick, color)
+			link(brick)
+			brick_inventory.set_brick_ids(scene, brick, sourceMould, filepath)
+			new_objects.append(brick)
+
+	return new_objects, missing
+
+
+def add_instance(context, filepath, **keywords):
+	"""
+	Places an instance of a part file in the active collection, selected, and returns it
+	"""
+	scene = context.scene
+	collection = part_collection(context, filepath, **keywords)
+	mould = part_mould(scene, collection)
+
+	if bpy.ops.object.select_all.poll():
+		bpy.ops.object.select_all(action='DESELECT')
+
+	brick = bpy.data.objects.new(mould, None)
+	brick.instance_type = 'COLLECTION'
+	brick.instance_collection = collection
+	context.view_layer.active_layer_collection.collection.objects.link(brick)
+	brick.select_set(True)
+	context.view_layer.objects.active = brick
+
+	brick_inventory.set_brick_ids(scene, brick, mould, collection[PART_FILE])
+	return brick
@@ -0,0 +1,262 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+What a scene is built from: the mould and color of every brick, counted per (mould, color).
+
+Bricks carry their mould and color as integer IDs, brick_part_id and brick_color_id, indexing the
+scene's brick_parts and brick_colors tables (starting at 1, 0 is no color). Objects from before IDs
+have part ID 0 and are recognised by name, connector empties have NOT_A_BRICK.
+"""
+
+from collections import Counter
+
+import bpy
+import numpy as np
+from bpy.props import PointerProperty, StringProperty
+
+from . import brick_cache
+from .brick_connectivity import is_brick
+
+UNKNOWN_PART = 0
+NOT_A_BRICK = -1
+
+
+class BrickPart(bpy.types.PropertyGroup):
+	#name is the mould
+	filepath: StringProperty(
+			name="File",
+			description="Part file the mould was added from",
+			subtype='FILE_PATH',
+			)
+
+
+class BrickColor(bpy.types.PropertyGroup):
+	#name is the material name when the color was added, the material itself keeps it right when renamed
+	material: PointerProperty(
+			name="Material",
+			description="Material of the bricks of this color",
+			type=bpy.types.Material,
+			)
+
+
+def entry_color(entry):
+	#current name of a BrickColor
+	material = entry.material
+	return material.name if material is not None else entry.name
+
+
+def color_name(scene, colorId):
+	"""
+	Name of the color with colorId in the color table of scene, an empty string for no or an unknown color
+	"""
+	colors = scene.brick_colors
+	return entry_color(colors[colorId - 1]) if 0 < colorId <= len(colors) else ""
+
+
+def part_id(scene, mould, filepath=""):
+	"""
+	ID of mould in the part table of scene, adding it if it's new
+	"""
+	parts = scene.brick_parts
+	index = parts.find(mould)
+	if index < 0:
+		part = parts.add()
+		part.name = mould
+		part.filepath = filepath
+		return len(parts)
+
+	if filepath and not parts[index].filepath:
+		parts[index].filepath = filepath
+	return index + 1
+
+
+def color_id(scene, color):
+	"""
+	ID of color in the color table of scene, adding it if it's new. 0 for no color
+	"""
+	if not color:
+		return 0
+
+	colors = scene.brick_colors
+	index = colors.find(color)
+	if index < 0:
+		#an entry whose material was renamed to color, the entry follows it
+		for index, entry in enumerate(colors):
+			if entry.material is not None and entry.material.name == color:
+				entry.name = color
+				return index + 1
+
+		entry = colors.add()
+		entry.name = color
+		entry.material = bpy.data.materials.get(color)
+		return len(colors)
+
+	entry = colors[index]
+	if entry.material is None or entry.material.name != color:
+		#added before the material existed, or the table's name was taken over by another material
+		entry.material = bpy.data.materials.get(color)
+	return index + 1
+
+
+def set_brick_ids(scene, obj, mould, filepath=""):
+	obj.brick_part_id = part_id(scene, mould, filepath)
+	obj.brick_color_id = color_id(scene, brick_color(obj))
+
+
+def brick_mould(name):
+	#"2x4_brick.003" is another copy of "2x4_brick", only used for bricks without a part ID
+	return name.split(".")[0]
+
+
+def brick_color(obj):
+	#name of the first material, an empty string when there is none
+	slots = obj.material_slots
+	return slots[0].name if len(slots) else ""
+
+
+class Inventory(brick_cache.SceneCache):
+	"""
+	The (mould, color) key of every brick in a scene, and how many bricks there are of each key
+	"""
+
+	uses_materials = True  #a renamed material is a renamed color
+
+	def rebuild(self, scene):
+		self.keys = {}  #brick name -> (mould, color)
+		self.counts = Counter()  #(mould, color) -> number of bricks
+
+		#inverted indexes, to find all bricks sharing a mould, color or both without looking at the others
+		self.by_mould = {}  #mould -> set of brick names
+		self.by_color = {}  #color -> set of brick names
+		self.by_key = {}  #(mould, color) -> set of brick names
+
+		#the IDs of all objects come in two bulk reads, only objects without one are looked at one by one
+		objects = scene.objects
+		names = objects.keys()
+		partIds = np.empty(len(names), dtype=np.intc)
+		colorIds = np.empty(len(names), dtype=np.intc)
+		objects.foreach_get("brick_part_id", partIds)
+		objects.foreach_get("brick_color_id", colorIds)
+
+		parts = scene.brick_parts.keys()
+		colors = [""] + [entry_color(entry) for entry in scene.brick_colors]
+		known = (partIds > 0) & (partIds <= len(parts)) & (colorIds >= 0) & (colorIds < len(colors))
+
+		add = self._add
+		indices = np.flatnonzero(known)
+		for i, partId, colorId in zip(indices.tolist(), partIds[indices].tolist(), colorIds[indices].tolist()):
+			add(names[i], (parts[partId - 1], colors[colorId]))
+
+		for i in np.flatnonzero(~known & (partIds != NOT_A_BRICK)).tolist():
+			obj = objects[i]
+			if is_brick(obj):
+				add(names[i], (brick_mould(names[i]), brick_color(obj)))
+
+	def update(self, scene, names):
+		parts = scene.brick_parts
+		get = brick_cache.object_getter(scene.objects, names)
+		for name in names:
+			self._remove(name)
+			obj = get(name)
+			if obj is None or not is_brick(obj):
+				continue
+
+			partId = obj.brick_part_id
+			if obj.type == 'EMPTY':
+				#instanced bricks have no material of their own, their color only exists as the ID
+				color = color_name(scene, obj.brick_color_id)
+				if 0 < partId <= len(parts):
+					self._add(name, (parts[partId - 1].name, color))
+				elif partId != NOT_A_BRICK:
+					self._add(name, (brick_mould(name), color))
+				continue
+
+			#a changed brick may have a new material, the material is the truth and the color ID follows it
+			color = brick_color(obj)
+			if 0 < partId <= len(parts):
+				try:
+					colorId = color_id(scene, color)
+					if obj.brick_color_id != colorId:
+						obj.brick_color_id = colorId
+				except AttributeError:
+					#no writing to IDs while drawing, the brick stays dirty so the next sync writes it
+					self.dirty.add(name)
+				self._add(name, (parts[partId - 1].name, color))
+			elif partId != NOT_A_BRICK:
+				self._add(name, (brick_mould(name), color))
+
+	def _add(self, name, key):
+		self.keys[name] = key
+		self.counts[key] += 1
+
+		self.by_mould.setdefault(key[0], set()).add(name)
+		self.by_color.setdefault(key[1], set()).add(name)
+		self.by_key.setdefault(key, set()).add(name)
+
+	def _remove(self, name):
+		key = self.keys.pop(name, None)
+		if key is not None:
+			counts = self.counts
+			counts[key] -= 1
+			if not counts[key]:
+				del counts[key]
+
+			for index, indexKey in ((self.by_mould, key[0]), (self.by_color, key[1]), (self.by_key, key)):
+				names = index[indexKey]
+				names.discard(name)
+				if not names:
+					del index[indexKey]
+
+	def rows(self):
+		"""
+		The bill of materials: (mould, color, quantity) rows sorted by mould and color
+		"""
+		return [(mould, color, count) for (mould, color), count in sorted(self.counts.items())]
+
+	def select(self, selected, index, field=None):
+		"""
+		Names of all bricks sharing an index entry (by_mould, by_color or by_key) with one of the selected objects.
+		field picks the part of the (mould, color) key the index is keyed by, 0, 1 or None for the whole key.
+		"""
+		keys = self.keys
+		found = set()
+		seen = set()
+		for obj in selected:
+			key = keys.get(obj.name)
+			if key is None:
+				#empties and other non-bricks have no mould or color
+				continue
+			if field is not None:
+				key = key[field]
+			if key not in seen:
+				seen.add(key)
+				found |= index[key]
+		return found
+
+	def mould_counts(self):
+		counts = Counter()
+		for (mould, _), count in self.counts.items():
+			counts[mould] += count
+		return counts
+
+
+def get_inventory(scene):
+	return brick_cache.get(scene, Inventory)
@@ -0,0 +1,196 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+KD-trees of the studs and holes of a scene that nothing is connected to,
+so a brick being placed can be snapped onto the nearest open connectors.
+"""
+
+from mathutils import kdtree
+
+from . import brick_cache, brick_connectivity
+
+#connectors added since the tree was balanced are searched one by one, past this many the tree is rebuilt
+PENDING_LIMIT = 256
+
+
+class ConnectorTree:
+	"""
+	Free connectors of one kind, entries are (brick name, location, direction).
+	A KDTree can't change once balanced, so connectors added later wait in a short list that is searched directly,
+	and removed ones are only marked dead, until maintain() rebuilds the tree with them.
+	"""
+
+	def __init__(self):
+		self.entries = []
+		self.alive = []
+		self.dead = 0
+		self.size = 0  #entries in the tree, the ones after them are pending
+		self.tree = None
+		self.owners = {}  #brick name -> entry indices
+
+	def add(self, owner, co, direction):
+		index = len(self.entries)
+		self.entries.append((owner, co, direction))
+		self.alive.append(True)
+		self.owners.setdefault(owner, []).append(index)
+
+	def remove_brick(self, owner):
+		alive = self.alive
+		for index in self.owners.pop(owner, ()):
+			if alive[index]:
+				alive[index] = False
+				self.dead += 1
+
+	def maintain(self):
+		"""
+		Rebuilds the tree if too many connectors are pending or dead
+		"""
+		if len(self.entries) - self.size > PENDING_LIMIT or self.dead > max(PENDING_LIMIT, self.size // 2):
+			self.rebuild()
+
+	def rebuild(self):
+		entries = [entry for entry, alive in zip(self.entries, self.alive) if alive]
+		tree = kdtree.KDTree(len(entries))
+		owners = {}
+		for index, entry in enumerate(entries):
+			tree.insert(entry[1], index)
+			owners.setdefault(entry[0], []).append(index)
+		tree.balance()
+
+		self.entries = entries
+		self.alive = [True] * len(entries)
+		self.dead = 0
+		self.size = len(entries)
+		self.tree = tree
+		self.owners = owners
+
+	def find_range(self, co, radius, exclude=()):
+		"""
+		Returns (distance, entry) of the connectors within radius of co, nearest first, leaving out those of the bricks in exclude
+		"""
+		entries = self.entries
+		alive = self.alive
+		found = []
+
+		if self.size:
+			for _, index, distance in self.tree.find_range(co, radius):
+				if alive[index] and entries[index][0] not in exclude:
+					found.append((distance, index))
+
+		x, y, z = co
+		limit = radius * radius
+		for index in range(self.size, len(entries)):
+			owner, (ex, ey, ez), _ = entries[index]
+			squared = (ex - x) ** 2 + (ey - y) ** 2 + (ez - z) ** 2
+			if squared <= limit and alive[index] and owner not in exclude:
+				found.append((squared ** 0.5, index))
+
+		found.sort()
+		return [(distance, entries[index]) for distance, index in found]
+
+	def __len__(self):
+		return len(self.entries) - self.dead
+
+
+class FreeConnectors(brick_cache.SceneCache):
+	"""
+	ConnectorTrees of the free studs and holes of a scene, kept alive between operator calls.
+	It follows the change log of the scene's ConnectorTable like ConnectivityGraph: only the bricks that changed,
+	and the bricks they were or are now connected to, have their free connectors found again.
+	"""
+
+	def __init__(self):
+		super().__init__()
+		self.studs = ConnectorTree()
+		self.holes = ConnectorTree()
+		self.neighbours = {}  #brick name -> names of the bricks it was connected to at the last sync
+		self.tolerance = None
+		self.revision = -1
+
+	def sync(self, scene):
+		graph = brick_connectivity.get_graph(scene)
+		table = brick_connectivity.get_connector_table(scene)
+		index = graph.index
+
+		changed = table.changes(self.revision) if self.valid and graph.tolerance == self.tolerance else None
+		if changed is None:
+			self.studs = ConnectorTree()
+			self.holes = ConnectorTree()
+			self.neighbours.clear()
+			for name in table.bricks:
+				self._refresh(name, table, index)
+			self.tolerance = graph.tolerance
+			self.valid = True
+		else:
+			for name in brick_connectivity.affected_bricks(changed, self.neighbours, index):
+				self._refresh(name, table, index)
+
+		self.studs.maintain()
+		self.holes.maintain()
+		self.revision = table.revision
+		self.dirty.clear()
+
+	def _refresh(self, name, table, index):
+		#a connector is free when no connector of another brick mates with it
+		self.studs.remove_brick(name)
+		self.holes.remove_brick(name)
+
+		connectors = table.bricks.get(name)
+		if connectors is None:
+			self.neighbours.pop(name, None)
+			return
+
+		links = index.links.get(name)
+		self.neighbours[name] = set(links) if links else set()
+
+		occupied = index.occupied(name, connectors)
+		for kind, co, direction, isOccupied in zip(connectors.types.tolist(), connectors.locations.tolist(),
+												   connectors.directions.tolist(), occupied.tolist()):
+			if not isOccupied:
+				tree = self.studs if kind == brick_connectivity.ConnectorType.STUD else self.holes
+				tree.add(name, co, direction)
+
+	def snap(self, studs, holes, radius, exclude=()):
+		"""
+		Finds the nearest free connector that mates with one of the given studs or holes, lists of world (location, direction),
+		within radius. Returns the translation that joins the two, or None if there is none.
+		"""
+		best = None
+		for placements, tree in ((studs, self.holes), (holes, self.studs)):
+			for co, (dx, dy, dz) in placements:
+				for distance, (_, target, (fx, fy, fz)) in tree.find_range(co, radius, exclude):
+					if best is not None and distance >= best[0]:
+						break
+					if fx * dx + fy * dy + fz * dz <= -brick_connectivity.MATE_COS:
+						best = (distance, target, co)
+						break
+
+		if best is None:
+			return None
+		_, target, co = best
+		return (target[0] - co[0], target[1] - co[1], target[2] - co[2])
+
+
+def get_free_connectors(scene):
+	"""
+	Returns the up to date FreeConnectors of scene
+	"""
+	return brick_cache.get(scene, FreeConnectors)
@@ -0,0 +1,270 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Stability of brick assemblies: which bricks are held up from the ground plane through stud connections,
+and how many studs the weakest joint on their strongest way down has. Shown as a heat map of object colors,
+kept up to date while building by analysing again only the assemblies that changed.
+"""
+
+import bpy
+from bpy.app.handlers import persistent
+
+from . import brick_cache, brick_connectivity
+
+#height of the ground plane, bricks with a hole on it (within the connection tolerance) stand on the ground
+GROUND_HEIGHT = 0.0
+
+#support of bricks on the ground and of bricks held by nothing
+GROUNDED = float("inf")
+UNSUPPORTED = 0
+
+#joints of fewer studs than this are weak
+STRONG_STUDS = 2
+
+#object colors of the heat map, from the weakest support up: (fewest studs, RGBA)
+HEAT_COLORS = (
+	(UNSUPPORTED, (1.0, 0.0, 0.0, 1.0)),
+	(1, (1.0, 0.45, 0.0, 1.0)),
+	(2, (1.0, 0.9, 0.0, 1.0)),
+	(3, (0.1, 0.75, 0.1, 1.0)),
+)
+
+#custom property of a brick holding its own object color while the heat map shows.
+#it is saved with the file and undone with the color, and a copy of a brick takes it along
+ORIGINAL_COLOR = "brick_original_color"
+
+#seconds after an edit before the heat map is brought up to date, edits in between are handled together
+REFRESH_DELAY = 0.2
+
+
+def heat_color(support):
+	color = HEAT_COLORS[0][1]
+	for studs, heat in HEAT_COLORS:
+		if support >= studs:
+			color = heat
+	return color
+
+
+def is_grounded(connectors, tolerance):
+	"""
+	True if one of the holes of a brick's BrickConnectors sits on the ground plane
+	"""
+	holes = connectors.types == brick_connectivity.ConnectorType.HOLE
+	return bool((connectors.locations[holes, 2] <= GROUND_HEIGHT + tolerance).any())
+
+
+def analyze(names, links, grounded):
+	"""
+	Support of every brick of names, complete assemblies with their links (brick name -> Counter of linked brick -> studs):
+	the studs of the weakest joint on the strongest path to a brick of grounded, GROUNDED for those, UNSUPPORTED
+	without any path. Returns (name -> support, list of (brick, brick, studs) of the weak joints assemblies hang from).
+	"""
+	#joints strongest first, an assembly reaching the ground this way hangs from this joint and can't do better
+	joints = sorted(((count, a, b) for a in names for b, count in links[a].items() if a < b), key=lambda joint: -joint[0])
+
+	support = {name: GROUNDED if name in grounded else UNSUPPORTED for name in names}
+	parents = {name: name for name in names}
+	onGround = {name: name in grounded for name in names}
+	members = {name: [name] for name in names if name not in grounded}  #bricks of assemblies not yet on the ground
+	weak = []
+
+	def find(name):
+		while parents[name] != name:
+			parents[name] = parents[parents[name]]
+			name = parents[name]
+		return name
+
+	for count, a, b in joints:
+		rootA = find(a)
+		rootB = find(b)
+		if rootA == rootB:
+			continue
+
+		groundA = onGround[rootA]
+		groundB = onGround[rootB]
+		if groundA != groundB:
+			held = rootB if groundA else rootA
+			for name in members.pop(held):
+				support[name] = count
+			if count < STRONG_STUDS:
+				weak.append((a, b, count))
+
+		#the assembly with fewer bricks waiting for support goes under the other
+		if len(members.get(rootA, ())) < len(members.get(rootB, ())):
+			rootA, rootB = rootB, rootA
+		parents[rootB] = rootA
+		onGround[rootA] = groundA or groundB
+		waiting = members.pop(rootB, None)
+		if onGround[rootA]:
+			members.pop(rootA, None)
+		elif waiting:
+			members[rootA].extend(waiting)
+
+	return support, weak
+
+
+class StabilityAnalysis(brick_cache.SceneCache):
+	"""
+	Support of every brick of a scene, kept alive between edits. It follows the change log of the scene's
+	ConnectorTable like ConnectivityGraph: only the assemblies holding a brick that changed, or that one was
+	connected to before, are analysed again.
+	"""
+
+	def __init__(self):
+		super().__init__()
+		self.support = {}  #brick name -> support
+		self.weak = {}  #(brick, brick) -> studs of the weak joints
+		self.grounded = set()
+		self.neighbours = {}  #brick name -> names of the bricks it was connected to when last analysed
+		self.updated = set()  #bricks whose support changed since take_updates()
+		self.tolerance = None
+		self.revision = -1
+
+	def sync(self, scene):
+		graph = brick_connectivity.get_graph(scene)
+		table = brick_connectivity.get_connector_table(scene)
+		index = graph.index
+		tolerance = graph.tolerance
+
+		changed = table.changes(self.revision) if self.valid and tolerance == self.tolerance else None
+		if changed is None:
+			self.grounded = {name for name, connectors in table.bricks.items() if is_grounded(connectors, tolerance)}
+			self.updated |= self.support.keys()
+			self.support.clear()
+			self.weak.clear()
+			self.neighbours.clear()
+			names = set(index.connectors)
+			self.tolerance = tolerance
+			self.valid = True
+		else:
+			seeds = set()
+			for name in changed:
+				seeds.update(self.neighbours.get(name, ()))
+				connectors = table.bricks.get(name)
+				if connectors is None:
+					#deleted, or renamed
+					self.grounded.discard(name)
+					self.neighbours.pop(name, None)
+					if self.support.pop(name, None) is not None:
+						self.updated.add(name)
+					continue
+				seeds.add(name)
+				if is_grounded(connectors, tolerance):
+					self.grounded.add(name)
+				else:
+					self.grounded.discard(name)
+
+			names = index.connected_component(seeds)
+			if names:
+				self.weak = {pair: count for pair, count in self.weak.items() if pair[0] not in names and pair[1] not in names}
+
+		if names:
+			links = index.links
+			support, weak = analyze(names, links, self.grounded)
+			previous = self.support
+			for name, value in support.items():
+				if previous.get(name) != value:
+					previous[name] = value
+					self.updated.add(name)
+				self.neighbours[name] = set(links[name])
+			for a, b, count in weak:
+				self.weak[(a, b)] = count
+
+		self.revision = table.revision
+		self.dirty.clear()
+
+	def unsupported(self):
+		return [name for name, value in self.support.items() if value == UNSUPPORTED]
+
+	def take_updates(self):
+		"""
+		Returns the names of the bricks whose support changed since the last call
+		"""
+		updated = self.updated
+		self.updated = set()
+		return updated
+
+
+def get_analysis(scene):
+	"""
+	Returns the up to date StabilityAnalysis of scene
+	"""
+	return brick_cache.get(scene, StabilityAnalysis)
+
+
+def show_heat_map(scene, everything=False):
+	"""
+	Colors the bricks of scene by their support, only those whose support changed unless everything
+	"""
+	analysis = get_analysis(scene)
+	updated = analysis.take_updates()
+	names = analysis.support.keys() if everything else updated
+
+	get = brick_cache.object_getter(scene.objects, names)
+	for name in names:
+		obj = get(name)
+		support = analysis.support.get(name)
+		if obj is None or support is None:
+			continue
+		#a brick already showing the heat map keeps the color it had before
+		if ORIGINAL_COLOR not in obj:
+			obj[ORIGINAL_COLOR] = obj.color[:]
+		color = heat_color(support)
+		#writing a color is an edit too, only write the ones that differ so refreshing settles
+		if any(abs(old - new) > 1e-4 for old, new in zip(obj.color, color)):
+			obj.color = color
+
+
+def hide_heat_map(scene):
+	"""
+	Gives the bricks back the colors they had before the heat map
+	"""
+	for obj in scene.objects:
+		color = obj.get(ORIGINAL_COLOR)
+		if color is not None:
+			obj.color = color[:]
+			del obj[ORIGINAL_COLOR]
+
+
+def _refresh():
+	scene = bpy.context.scene
+	if scene is not None and scene.brick_show_stability:
+		show_heat_map(scene)
+	return None
+
+
+@persistent
+def _depsgraph_update_post(scene):
+	#the caches only record what changed here, the heat map catches up once the edits pause
+	if scene.brick_show_stability and not bpy.app.timers.is_registered(_refresh):
+		bpy.app.timers.register(_refresh, first_interval=REFRESH_DELAY)
+
+
+def register():
+	if _depsgraph_update_post not in bpy.app.handlers.depsgraph_update_post:
+		bpy.app.handlers.depsgraph_update_post.append(_depsgraph_update_post)
+
+
+def unregister():
+	if _depsgraph_update_post in bpy.app.handlers.depsgraph_update_post:
+		bpy.app.handlers.depsgraph_update_post.remove(_depsgraph_update_post)
+	if bpy.app.timers.is_registered(_refresh):
+		bpy.app.timers.unregister(_refresh)
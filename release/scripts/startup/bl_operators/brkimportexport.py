@@ -72,6 +72,21 @@ class ImportBRK(bpy.types.Operator, ImportHelper):
 			default=0.0,
 			)
 
+	use_connector_empties: BoolProperty(
+			name="Connector Empties",
+			description="Add an empty for each stud and hole to show where they are, "
+						"the connectors themselves are always stored on the brick's mesh",
+			default=False,
+			)
+
+	use_instancing: BoolProperty(
+			name="Instance",
+			description="Import the file once into a hidden part collection and add an instance of it, "
+						"sharing the geometry with every other brick of the same part. "
+						"The parts referenced by a scene file are placed as instances",
+			default=False,
+			)
+
 	def execute(self, context):
 		# print("Selected: " + context.active_object.name)
 		from . import import_brk
@@ -124,6 +139,8 @@ class ImportBRK(bpy.types.Operator, ImportHelper):
 		layout.prop(self, "axis_up")
 
 		layout.prop(self, "use_image_search")
+		layout.prop(self, "use_connector_empties")
+		layout.prop(self, "use_instancing")
 
 
 @orientation_helper(axis_forward='-Z', axis_up='Y')
@@ -191,6 +208,30 @@ class ExportBRK(bpy.types.Operator, ExportHelper):
 			default=False,
 			)
 
+	use_references: BoolProperty(
+			name="Part References",
+			description="Write bricks from the part library as a reference to their part file, "
+						"with their color and transform, instead of their geometry",
+			default=False,
+			)
+	use_cull_studs: BoolProperty(
+			name="Cull Hidden Studs",
+			description="Leave out the studs pushed into other bricks, which can't be seen",
+			default=False,
+			)
+
+	use_animation: BoolProperty(
+			name="Animation",
+			description="Write out a BRK for each frame",
+			default=False,
+			)
+	use_animation_deltas: BoolProperty(
+			name="Only Changes",
+			description="Write the animation as a BRK of its first frame and a .brka file next to it, "
+						"holding for each later frame only the bricks that moved or changed shape",
+			default=False,
+			)
+
 	global_scale: FloatProperty(
 			name="Scale",
 			min=0.01, max=1000.0,
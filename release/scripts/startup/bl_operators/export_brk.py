@@ -23,11 +23,16 @@
 import os
 
 import bpy
+import numpy as np
 from mathutils import Matrix, Vector, Color
 from bpy_extras import io_utils, node_shader_utils
 
 from bpy_extras.wm_utils.progress_report import (ProgressReport, ProgressReportSubstep)
 
+from brickcad import brk_animation, brk_writer, culling, library
+
+from . import brick_connectivity, brick_culling, brick_instances, brick_inventory
+
 def name_compat(name):
 	if name is None:
 		return 'None'
@@ -44,6 +49,160 @@ def mesh_triangulate(me):
 	bm.free()
 
 
+def find_vertex_group_name(face_verts, vWeightMap):
+	"""
+	Searches the vertexDict to see what groups is assigned to a given face.
+	We use a frequency system in order to sort out the name because a given vertex can
+	belong to two or more groups at the same time. To find the right name for the face
+	we list all the possible vertex group names with their frequency and then sort by
+	frequency in descend order. The top element is the one shared by the highest number
+	of vertices is the face's group
+	"""
+	weightDict = {}
+	for vert_index in face_verts:
+		vWeights = vWeightMap[vert_index]
+		for vGroupName, weight in vWeights:
+			weightDict[vGroupName] = weightDict.get(vGroupName, 0.0) + weight
+
+	if weightDict:
+		return max((weight, vGroupName) for vGroupName, weight in weightDict.items())[1]
+	else:
+		return '(null)'
+
+
+def read_mesh(ob, me,
+			  EXPORT_TRI=False,
+			  EXPORT_EDGES=False,
+			  EXPORT_SMOOTH_GROUPS=False,
+			  EXPORT_SMOOTH_GROUPS_BITFLAGS=False,
+			  EXPORT_NORMALS=False,
+			  EXPORT_UV=True,
+			  EXPORT_POLYGROUPS=False,
+			  subprogress=None,
+			  ):
+	"""
+	The brk_writer.MeshData of a mesh made by to_mesh from ob, None if it has nothing to write
+	"""
+	step = subprogress.step if subprogress is not None else (lambda: None)
+
+	# _must_ do this before applying transformation, else tessellation may differ
+	if EXPORT_TRI:
+		# _must_ do this first since it re-allocs arrays
+		mesh_triangulate(me)
+
+	#everything is read in bulk into arrays, in the mesh's own space. Each object using the
+	#mesh is placed, and flipped if it is mirrored, when formatting
+	me_verts = me.vertices
+	polygons = me.polygons
+	loops = me.loops
+	edges = me.edges if EXPORT_EDGES else ()
+
+	if not (len(polygons) + len(edges) + len(me_verts)):  # Make sure there is something to write
+		return None
+
+	if EXPORT_UV:
+		faceuv = len(me.uv_layers) > 0
+	else:
+		faceuv = False
+
+	co = np.empty(len(me_verts) * 3, dtype=np.float32)
+	me_verts.foreach_get("co", co)
+
+	loop_start = np.empty(len(polygons), dtype=np.intc)
+	loop_total = np.empty(len(polygons), dtype=np.intc)
+	polygons.foreach_get("loop_start", loop_start)
+	polygons.foreach_get("loop_total", loop_total)
+	#loops of all faces, one face after the other
+	face_loops = brk_writer.face_loop_order(loop_start, loop_total)
+
+	loop_vertex = np.empty(len(loops), dtype=np.intc)
+	loops.foreach_get("vertex_index", loop_vertex)
+	face_vertex = loop_vertex[face_loops]
+
+	if EXPORT_NORMALS and len(polygons):
+		me.calc_normals_split()
+		# No need to call me.free_normals_split later, as this mesh is deleted anyway!
+
+	if (EXPORT_SMOOTH_GROUPS or EXPORT_SMOOTH_GROUPS_BITFLAGS) and len(polygons):
+		smooth_groups, smooth_groups_tot = me.calc_smooth_groups(use_bitflags=EXPORT_SMOOTH_GROUPS_BITFLAGS)
+		if smooth_groups_tot <= 1:
+			smooth_groups, smooth_groups_tot = (), 0
+	else:
+		smooth_groups, smooth_groups_tot = (), 0
+
+	step()
+
+	# UV
+	uvs = face_uv = None
+	if faceuv:
+		uv = np.empty(len(loops) * 2, dtype=np.float32)
+		me.uv_layers.active.data.foreach_get("uv", uv)
+		uv = uv.reshape(-1, 2)[face_loops]
+
+		# include the vertex index in the key so we don't share UV's between vertices,
+		# allowed by the OBJ spec but can cause issues for other importers, see: T47010.
+		uv_keys = np.column_stack((face_vertex, np.round(uv.astype(np.float64), 4)))
+		uv_first, face_uv = brk_writer.first_seen(uv_keys)
+		uvs = uv[uv_first]
+
+	step()
+
+	# NORMAL, Smooth/Non smoothed.
+	normals = face_normal = None
+	if EXPORT_NORMALS:
+		normals = np.empty(len(loops) * 3, dtype=np.float32)
+		loops.foreach_get("normal", normals)
+		normals = normals.reshape(-1, 3)[face_loops]
+		no_first, face_normal = brk_writer.first_seen(np.round(normals.astype(np.float64), 4))
+		normals = normals[no_first]
+
+	step()
+
+	use_smooth = np.empty(len(polygons), dtype=bool)
+	polygons.foreach_get("use_smooth", use_smooth)
+
+	# XXX
+	group_markers = None
+	if EXPORT_POLYGROUPS:
+		# Retrieve the list of vertex groups
+		vertGroupNames = ob.vertex_groups.keys()
+		if vertGroupNames:
+			currentVGroup = ''
+			group_markers = {}
+			# Create a dictionary keyed by face id and listing, for each vertex, the vertex groups it belongs to
+			vgroupsMap = [[(vertGroupNames[g.group], g.weight) for g in v.groups] for v in me_verts]
+
+			face_vertex_list = face_vertex.tolist()
+			offsets = (np.cumsum(loop_total) - loop_total).tolist()
+			for f_index, (offset, total) in enumerate(zip(offsets, loop_total.tolist())):
+				# find what vertext group the face belongs to
+				vgroup_of_face = find_vertex_group_name(face_vertex_list[offset:offset + total], vgroupsMap)
+				if vgroup_of_face != currentVGroup:
+					currentVGroup = vgroup_of_face
+					group_markers[f_index] = 'g %s\n' % vgroup_of_face
+
+	step()
+
+	# Write edges.
+	loose_edges = None
+	if EXPORT_EDGES and len(edges):
+		is_loose = np.empty(len(edges), dtype=bool)
+		edge_verts = np.empty(len(edges) * 2, dtype=np.intc)
+		edges.foreach_get("is_loose", is_loose)
+		edges.foreach_get("vertices", edge_verts)
+		loose_edges = edge_verts.reshape(-1, 2)[is_loose]
+
+	columns = [face_vertex]
+	if faceuv:
+		columns.append(face_uv)
+	if EXPORT_NORMALS:
+		columns.append(face_normal)
+
+	return brk_writer.MeshData(co.reshape(-1, 3), uvs, normals, loop_total, np.column_stack(columns),
+							   use_smooth, np.asarray(smooth_groups) if smooth_groups else None,
+							   group_markers, loose_edges)
+
+
 def write_file(filepath, objects, depsgraph, scene,
 			   EXPORT_TRI=False,
 			   EXPORT_EDGES=False,
@@ -58,58 +217,81 @@ def write_file(filepath, objects, depsgraph, scene,
 			   EXPORT_POLYGROUPS=False,
 			   EXPORT_GLOBAL_MATRIX=None,
 			   EXPORT_PATH_MODE='AUTO',
+			   EXPORT_REFERENCES=False,
+			   EXPORT_JOBS=0,
+			   EXPORT_CULL_STUDS=False,
 			   progress=ProgressReport(),
+			   blocks=None,
 			   ):
 	"""
 	Basic write function. The context and options must be already set
 	This can be accessed externaly
 	eg.
 	write( 'c:\\test\\foobar.brk', Blender.Object.GetSelected() ) # Using default options.
+	Formatting of large exports is spread over EXPORT_JOBS worker processes, 0 for one per CPU.
+	With EXPORT_CULL_STUDS the faces of the studs pushed into other bricks are left out of the bricks' meshes.
+	When blocks is a list, it gets a (name of the object in objects, object or None, world matrix, MeshData or None)
+	tuple for each 'o' and 'r' line in file order, the object and MeshData only for objects whose evaluated geometry can change.
 	"""
 	if EXPORT_GLOBAL_MATRIX is None:
 		EXPORT_GLOBAL_MATRIX = Matrix()
 
-	def veckey3d(v):
-		return round(v.x, 4), round(v.y, 4), round(v.z, 4)
+	part_references = {}  #object name -> (part reference, color, world matrix of the part's first brick) or None
 
-	def veckey2d(v):
-		return round(v[0], 4), round(v[1], 4)
-
-	def findVertexGroupName(face, vWeightMap):
+	def partReference(ob):
 		"""
-		Searches the vertexDict to see what groups is assigned to a given face.
-		We use a frequency system in order to sort out the name because a given vertex can
-		belong to two or more groups at the same time. To find the right name for the face
-		we list all the possible vertex group names with their frequency and then sort by
-		frequency in descend order. The top element is the one shared by the highest number
-		of vertices is the face's group
+		How a brick from the part library is written with EXPORT_REFERENCES, None for anything else
 		"""
-		weightDict = {}
-		for vert_index in face.vertices:
-			vWeights = vWeightMap[vert_index]
-			for vGroupName, weight in vWeights:
-				weightDict[vGroupName] = weightDict.get(vGroupName, 0.0) + weight
-
-		if weightDict:
-			return max((weight, vGroupName) for vGroupName, weight in weightDict.items())[1]
+		result = part_references.get(ob.name, ...)
+		if result is not ...:
+			return result
+
+		result = None
+		if ob.instance_type == 'COLLECTION' and ob.instance_collection is not None:
+			collection = ob.instance_collection
+			filepath = collection.get(brick_instances.PART_FILE)
+			color = brick_inventory.color_name(scene, ob.brick_color_id)
+			matrix = ob.matrix_world @ brick_instances.part_matrix(collection)
+		elif ob.type == 'MESH':
+			parts = scene.brick_parts
+			partId = ob.brick_part_id
+			filepath = parts[partId - 1].filepath if 0 < partId <= len(parts) else None
+			color = brick_inventory.brick_color(ob)
+			matrix = ob.matrix_world
 		else:
-			return '(null)'
+			filepath = None
+
+		reference = library.part_reference(filepath) if filepath else None
+		if reference is not None:
+			result = (reference, color, matrix)
+		part_references[ob.name] = result
+		return result
 
 	with ProgressReportSubstep(progress, 2, "BRK Export path: %r" % filepath, "BRK Export Finished") as subprogress1:
-		with open(filepath, "w", encoding="utf8", newline="\n") as f:
+		with brk_writer.open_file(filepath) as f:
 			fw = f.write
 
 			# Write Header
 			fw('# BrickCAD v%s BRK File: %r\n' % (bpy.app.version_string, os.path.basename(bpy.data.filepath)))
 
-			# Initialize totals, these are updated each object
-			totverts = totuvco = totno = 1
+			#text and MeshSnapshots of every object in file order, formatted once all of them are read
+			items = []
 
-			face_vert_index = 1
+			#(mesh pointer, vertex group names) -> (MeshData or None, connector layout), for meshes evaluation doesn't change
+			mesh_cache = {}
 
+			#(mesh cache key or object name, studs, buried studs) -> MeshData without the buried studs
+			culled_cache = {}
+			if EXPORT_CULL_STUDS:
+				stud_culling = brick_culling.get_stud_culling(scene)
+				connector_table = brick_connectivity.get_connector_table(scene)
 
 			copy_set = set()
 
+			#the bricks of a part with several objects share a transform and color, and are written as one reference.
+			#(part, color, transform) -> for each reference written, the meshes of the bricks it stands for
+			written_references = {}
+
 			# Get all meshes
 			subprogress1.enter_substeps(len(objects))
 			for i, ob_main in enumerate(objects):
@@ -118,6 +300,38 @@ def write_file(filepath, objects, depsgraph, scene,
 					subprogress1.step("Ignoring %s, dupli child..." % ob_main.name)
 					continue
 
+				if EXPORT_REFERENCES:
+					reference = partReference(ob_main)
+					if reference is not None:
+						part, color, matrix = reference
+						matrix = EXPORT_GLOBAL_MATRIX @ matrix
+						key = (part, color, tuple(round(value, 5) for row in matrix[:3] for value in row))
+						written = written_references.setdefault(key, [])
+						#each object of a part has a mesh of its own, a second brick with the same mesh in the same place is a brick of its own.
+						#an instance is the whole part, it never shares a reference
+						shape = brick_culling.whole_mesh(ob_main).name if ob_main.type == 'MESH' else None
+						group = next((meshes for meshes in written if shape is not None and shape not in meshes), None)
+						if group is not None:
+							group.add(shape)
+						else:
+							written.append({shape})
+							items.append('r %s %.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f %.6f %s\n' % (
+								name_compat(color) if color else '-',
+								matrix[0][3], matrix[1][3], matrix[2][3],
+								matrix[0][0], matrix[0][1], matrix[0][2],
+								matrix[1][0], matrix[1][1], matrix[1][2],
+								matrix[2][0], matrix[2][1], matrix[2][2],
+								part))
+							if blocks is not None:
+								blocks.append((ob_main.name, None, np.array(reference[2]), None))
+						subprogress1.step("Referenced %s" % ob_main.name)
+						continue
+
+					if ob_main.type == 'EMPTY' and ob_main.parent is not None and partReference(ob_main.parent) is not None:
+						#a connector of a referenced brick, it comes with the part
+						subprogress1.step()
+						continue
+
 				obs = [(ob_main, ob_main.matrix_world)]
 				if ob_main.is_instancer:
 					obs += [(dup.instance_object.original, dup.matrix_world.copy())
@@ -129,229 +343,201 @@ def write_file(filepath, objects, depsgraph, scene,
 				for ob, ob_mat in obs:
 					#print(ob.type)
 					with ProgressReportSubstep(subprogress1, 6) as subprogress2:
-						uv_unique_count = no_unique_count = 0
-
-						ob_for_convert = ob.evaluated_get(depsgraph) if EXPORT_APPLY_MODIFIERS else ob.original
+						#a mesh that evaluation leaves as it is gets read once, however many objects use it
+						cacheKey = None
+						if ob.type == 'MESH' and (not EXPORT_APPLY_MODIFIERS or (not ob.modifiers and ob.data.shape_keys is None)):
+							cacheKey = (ob.data.as_pointer(), tuple(ob.vertex_groups.keys()) if EXPORT_POLYGROUPS else ())
+
+						cached = mesh_cache.get(cacheKey) if cacheKey is not None else None
+						if cached is None:
+							ob_for_convert = ob.evaluated_get(depsgraph) if EXPORT_APPLY_MODIFIERS else ob.original
+
+							try:
+								me = ob_for_convert.to_mesh()
+							except RuntimeError:
+								me = None
+
+							if me is None:
+								if ob.is_instancer:
+									#instanced brick, its part's geometry and connectors come as its dupli children
+									continue
+
+								#object is an empty, this is going to be used to indicate the location of a stud
+								obnamestring = name_compat(ob.name)
+								location = ob_mat.translation
+
+								#check if object has a parent
+								parent = ob.parent
+								#print("Parent: " + str(parent.name))
+
+								if parent is not None and parent.type == 'MESH' and brick_connectivity.has_connector_layer(parent.data):
+									#only shows a connector of the parent's connector layer, which is written with the parent
+									continue
+
+								if parent is None:
+									items.append('st %s %.6f %.6f %.6f\n' % (obnamestring, location[0], location[1], location[2]))  # Write Object name and location
+								else:
+									items.append('st %s %.6f %.6f %.6f p %s\n' % (obnamestring, location[0], location[1], location[2], name_compat(parent.name)))  # Write Object name, location, and parent name
+								continue
+
+							cached = (read_mesh(ob, me,
+											    EXPORT_TRI,
+											    EXPORT_EDGES,
+											    EXPORT_SMOOTH_GROUPS,
+											    EXPORT_SMOOTH_GROUPS_BITFLAGS,
+											    EXPORT_NORMALS,
+											    EXPORT_UV,
+											    EXPORT_POLYGROUPS,
+											    subprogress2,
+											    ),
+									  brick_connectivity.mesh_layout(ob.data) if ob.type == 'MESH' else None)
 
-						try:
-							me = ob_for_convert.to_mesh()
-						except RuntimeError:
-							me = None
+							# clean up
+							ob_for_convert.to_mesh_clear()
 
-						if me is None:
-							#object is an empty, this is going to be used to indicate the location of a stud
-							obnamestring = name_compat(ob.name)
+							if cacheKey is not None:
+								mesh_cache[cacheKey] = cached
 
-							#check if object has a parent
-							parent = ob.parent
-							#print("Parent: " + str(parent.name))
+						mesh, layout = cached
+						if mesh is None:
+							continue  # dont bother with this mesh.
 
-							if parent is None:
-								fw('st %s %.6f %.6f %.6f\n' % (obnamestring, ob.matrix_world.translation[0], ob.matrix_world.translation[1], ob.matrix_world.translation[2]))  # Write Object name and location
+						#blocks get the whole mesh, so animation deltas compare like with like
+						whole = mesh
+						if EXPORT_CULL_STUDS and ob is ob_main:
+							buried = stud_culling.buried.get(ob.name)
+							connectors = connector_table.bricks.get(ob.name)
+							if buried and connectors is not None:
+								locations, directions = brick_culling.local_studs(connectors, ob_mat)
+								key = (cacheKey or ob.name, brick_culling.studs_key(locations), buried)
+								culled = culled_cache.get(key)
+								if culled is None:
+									labels = culling.stud_labels(mesh.positions, mesh.loop_total, mesh.columns[:, 0], locations, directions)
+									culled = culled_cache[key] = brk_writer.drop_faces(mesh, culling.culled_faces(labels, buried))
+								mesh = culled
+
+						obnamestring = name_compat(ob.name)
+						head = ['o %s\n' % obnamestring]  # Write Object name
+
+						#connectors stored on the mesh, written the same as connector empties parented to this object
+						if layout is not None:
+							matrix = np.array(ob_mat)
+							locations = layout[2] @ matrix[:3, :3].T + matrix[:3, 3]
+							for connectorName, (x, y, z) in zip(layout[0], locations.tolist()):
+								head.append('st %s %.6f %.6f %.6f p %s\n' % (connectorName, x, y, z, obnamestring))
+
+						#formatting, and placing the mesh, is left to brk_writer, which numbers the indices on from the previous objects
+						items.append(brk_writer.MeshSnapshot("".join(head), mesh, np.array(EXPORT_GLOBAL_MATRIX @ ob_mat)))
+						if blocks is not None:
+							if cacheKey is None:
+								blocks.append((ob_main.name, ob, np.array(ob_mat), whole))
 							else:
-								fw('st %s %.6f %.6f %.6f p %s\n' % (obnamestring, ob.matrix_world.translation[0], ob.matrix_world.translation[1], ob.matrix_world.translation[2], name_compat(parent.name)))  # Write Object name, location, and parent name
-							continue
-
-						# _must_ do this before applying transformation, else tessellation may differ
-						if EXPORT_TRI:
-							# _must_ do this first since it re-allocs arrays
-							mesh_triangulate(me)
-
-						me.transform(EXPORT_GLOBAL_MATRIX @ ob_mat)
-						# If negative scaling, we have to invert the normals...
-						if ob_mat.determinant() < 0.0:
-							me.flip_normals()
-
-						if EXPORT_UV:
-							faceuv = len(me.uv_layers) > 0
-							if faceuv:
-								uv_layer = me.uv_layers.active.data[:]
-						else:
-							faceuv = False
+								blocks.append((ob_main.name, None, np.array(ob_mat), None))
 
-						me_verts = me.vertices[:]
+				subprogress1.leave_substeps("Finished reading geometry of '%s'." % ob_main.name)
+			subprogress1.leave_substeps()
 
-						# Make our own list so it can be sorted to reduce context switching
-						face_index_pairs = [(face, index) for index, face in enumerate(me.polygons)]
+			#only reading the meshes needs Blender, the formatting runs in worker processes for large exports
+			for text in brk_writer.format_items(items, jobs=EXPORT_JOBS, executable=bpy.app.binary_path_python):
+				fw(text)
 
-						if EXPORT_EDGES:
-							edges = me.edges
-						else:
-							edges = []
+		# copy all collected files.
+		io_utils.path_reference_copy(copy_set)
 
-						if not (len(face_index_pairs) + len(edges) + len(me.vertices)):  # Make sure there is something to write
-							# clean up
-							bpy.data.meshes.remove(me)
-							continue  # dont bother with this mesh.
 
-						if EXPORT_NORMALS and face_index_pairs:
-							me.calc_normals_split()
-							# No need to call me.free_normals_split later, as this mesh is deleted anyway!
+def write_animation(filepath, objects, depsgraph, scene, frames,
+					progress=ProgressReport(),
+					**keywords
+					):
+	"""
+	Writes the first of frames to filepath as write_file does, with keywords its options, and the frames after it
+	to the .brka next to it, see brk_animation: only the blocks that moved, or whose evaluated geometry changed.
+	Objects are moved as a whole, what they instance keeps its place relative to them.
+	"""
+	global_matrix = np.array(keywords.get("EXPORT_GLOBAL_MATRIX") or Matrix())
+	apply_modifiers = keywords.get("EXPORT_APPLY_MODIFIERS", True)
+	mesh_options = {name: value for name, value in keywords.items()
+					if name in {"EXPORT_TRI", "EXPORT_EDGES", "EXPORT_SMOOTH_GROUPS", "EXPORT_SMOOTH_GROUPS_BITFLAGS",
+								"EXPORT_NORMALS", "EXPORT_UV", "EXPORT_POLYGROUPS"}}
+
+	progress.enter_substeps(len(frames))
+	scene.frame_set(frames[0], subframe=0.0)
+	blocks = []
+	progress.enter_substeps(1)
+	write_file(filepath, objects, depsgraph, scene, progress=progress, blocks=blocks, **keywords)
+	progress.leave_substeps()
+
+	if not blocks:
+		progress.leave_substeps()
+		return
 
-						loops = me.loops
+	#blocks move with the object of objects they were written for
+	names = list(dict.fromkeys(block[0] for block in blocks))
+	main_index = np.array([names.index(block[0]) for block in blocks])
+	base = np.array([block[2] for block in blocks])
+	offsets = np.linalg.inv(np.array([scene.objects[name].matrix_world for name in names])[main_index]) @ base
+	inverse_base = np.linalg.inv(global_matrix @ base)
 
-						if (EXPORT_SMOOTH_GROUPS or EXPORT_SMOOTH_GROUPS_BITFLAGS) and face_index_pairs:
-							smooth_groups, smooth_groups_tot = me.calc_smooth_groups(use_bitflags=EXPORT_SMOOTH_GROUPS_BITFLAGS)
-							if smooth_groups_tot <= 1:
-								smooth_groups, smooth_groups_tot = (), 0
-						else:
-							smooth_groups, smooth_groups_tot = (), 0
-
-						contextSmooth = None  # Will either be true or false,  set bad to force initialization switch.
-
-						name = ob.name
-						obnamestring = name_compat(name)
-						
-						fw('o %s\n' % obnamestring)  # Write Object name
-
-
-						subprogress2.step()
-
-						# Vert
-						for v in me_verts:
-							fw('v %.6f %.6f %.6f\n' % v.co[:])
-
-						subprogress2.step()
-
-						# UV
-						if faceuv:
-							# in case removing some of these dont get defined.
-							uv = f_index = uv_index = uv_key = uv_val = uv_ls = None
-
-							uv_face_mapping = [None] * len(face_index_pairs)
-
-							uv_dict = {}
-							uv_get = uv_dict.get
-							for f, f_index in face_index_pairs:
-								uv_ls = uv_face_mapping[f_index] = []
-								for uv_index, l_index in enumerate(f.loop_indices):
-									uv = uv_layer[l_index].uv
-									# include the vertex index in the key so we don't share UV's between vertices,
-									# allowed by the OBJ spec but can cause issues for other importers, see: T47010.
-
-									# this works too, shared UV's for all verts
-									#~ uv_key = veckey2d(uv)
-									uv_key = loops[l_index].vertex_index, veckey2d(uv)
-
-									uv_val = uv_get(uv_key)
-									if uv_val is None:
-										uv_val = uv_dict[uv_key] = uv_unique_count
-										fw('vt %.6f %.6f\n' % uv[:])
-										uv_unique_count += 1
-									uv_ls.append(uv_val)
-
-							del uv_dict, uv, f_index, uv_index, uv_ls, uv_get, uv_key, uv_val
-							# Only need uv_unique_count and uv_face_mapping
-
-						subprogress2.step()
-
-						# NORMAL, Smooth/Non smoothed.
-						if EXPORT_NORMALS:
-							no_key = no_val = None
-							normals_to_idx = {}
-							no_get = normals_to_idx.get
-							loops_to_normals = [0] * len(loops)
-							for f, f_index in face_index_pairs:
-								for l_idx in f.loop_indices:
-									no_key = veckey3d(loops[l_idx].normal)
-									no_val = no_get(no_key)
-									if no_val is None:
-										no_val = normals_to_idx[no_key] = no_unique_count
-										fw('vn %.4f %.4f %.4f\n' % no_key)
-										no_unique_count += 1
-									loops_to_normals[l_idx] = no_val
-							del normals_to_idx, no_get, no_key, no_val
-						else:
-							loops_to_normals = []
-
-						subprogress2.step()
-
-						# XXX
-						if EXPORT_POLYGROUPS:
-							# Retrieve the list of vertex groups
-							vertGroupNames = ob.vertex_groups.keys()
-							if vertGroupNames:
-								currentVGroup = ''
-								# Create a dictionary keyed by face id and listing, for each vertex, the vertex groups it belongs to
-								vgroupsMap = [[] for _i in range(len(me_verts))]
-								for v_idx, v_ls in enumerate(vgroupsMap):
-									v_ls[:] = [(vertGroupNames[g.group], g.weight) for g in me_verts[v_idx].groups]
-
-						for f, f_index in face_index_pairs:
-							f_smooth = f.use_smooth
-							if f_smooth and smooth_groups:
-								f_smooth = smooth_groups[f_index]
-
-							# Write the vertex group
-							if EXPORT_POLYGROUPS:
-								if vertGroupNames:
-									# find what vertext group the face belongs to
-									vgroup_of_face = findVertexGroupName(f, vgroupsMap)
-									if vgroup_of_face != currentVGroup:
-										currentVGroup = vgroup_of_face
-										fw('g %s\n' % vgroup_of_face)
-
-							if f_smooth != contextSmooth:
-								if f_smooth:  # on now off
-									if smooth_groups:
-										f_smooth = smooth_groups[f_index]
-										fw('s %d\n' % f_smooth)
-									else:
-										fw('s 1\n')
-								else:  # was off now on
-									fw('s off\n')
-								contextSmooth = f_smooth
-
-							f_v = [(vi, me_verts[v_idx], l_idx)
-								   for vi, (v_idx, l_idx) in enumerate(zip(f.vertices, f.loop_indices))]
-
-							fw('f')
-							if faceuv:
-								if EXPORT_NORMALS:
-									for vi, v, li in f_v:
-										fw(" %d/%d/%d" % (totverts + v.index,
-														  totuvco + uv_face_mapping[f_index][vi],
-														  totno + loops_to_normals[li],
-														  ))  # vert, uv, normal
-								else:  # No Normals
-									for vi, v, li in f_v:
-										fw(" %d/%d" % (totverts + v.index,
-													   totuvco + uv_face_mapping[f_index][vi],
-													   ))  # vert, uv
-
-								face_vert_index += len(f_v)
-
-							else:  # No UV's
-								if EXPORT_NORMALS:
-									for vi, v, li in f_v:
-										fw(" %d//%d" % (totverts + v.index, totno + loops_to_normals[li]))
-								else:  # No Normals
-									for vi, v, li in f_v:
-										fw(" %d" % (totverts + v.index))
-
-							fw('\n')
-
-						subprogress2.step()
-
-						# Write edges.
-						if EXPORT_EDGES:
-							for ed in edges:
-								if ed.is_loose:
-									fw('l %d %d\n' % (totverts + ed.vertices[0], totverts + ed.vertices[1]))
-
-						# Make the indices global rather then per mesh
-						totverts += len(me_verts)
-						totuvco += uv_unique_count
-						totno += no_unique_count
-
-						# clean up
+	previous = base.copy()
+	tolerance = 1e-5 * max(1.0, float(np.abs(base[:, :3, 3]).max()))
+
+	#geometry of the blocks whose evaluation can change, compared by digest
+	dynamic = [i for i, block in enumerate(blocks) if block[1] is not None]
+	keys = {i: brk_animation.mesh_key(blocks[i][3]) for i in dynamic}
+
+	with brk_writer.open_file(brk_animation.animation_path(filepath)) as f:
+		fw = f.write
+		fw('# BrickCAD v%s BRK animation of %r\n' % (bpy.app.version_string, os.path.basename(filepath)))
+
+		for frame in frames[1:]:
+			#only data that depends on time is evaluated again
+			scene.frame_set(frame, subframe=0.0)
+
+			#every block is checked with one bulk read, single precision, only the moved ones are read exactly
+			current = np.transpose(brick_connectivity.read_matrices(scene.objects, names), (0, 2, 1))[main_index] @ offsets
+			moved = np.flatnonzero(np.abs(current - previous).max(axis=(1, 2)) > tolerance).tolist()
+			previous[moved] = current[moved]
+
+			records = {}
+			exact = {}
+			for i in moved:
+				name = blocks[i][0]
+				if name not in exact:
+					exact[name] = np.array(scene.objects[name].matrix_world)
+				records[i] = [brk_animation.format_transform(i, global_matrix @ exact[name] @ offsets[i] @ inverse_base[i])]
+
+			meshes = {}
+			for i in dynamic:
+				ob = blocks[i][1]
+				if ob.name not in meshes:
+					ob_for_convert = ob.evaluated_get(depsgraph) if apply_modifiers else ob.original
+					try:
+						me = ob_for_convert.to_mesh()
+					except RuntimeError:
+						me = None
+					mesh = None
+					if me is not None:
+						mesh = read_mesh(ob, me, **mesh_options)
 						ob_for_convert.to_mesh_clear()
+					meshes[ob.name] = (mesh, brk_animation.mesh_key(mesh))
 
-				subprogress1.leave_substeps("Finished writing geometry of '%s'." % ob_main.name)
-			subprogress1.leave_substeps()
+				mesh, key = meshes[ob.name]
+				if key != keys[i]:
+					keys[i] = key
+					head = 'b %d\no %s\n' % (i, name_compat(ob.name))
+					if mesh is None:
+						text = head
+					else:
+						text = brk_writer.format_mesh(brk_writer.MeshSnapshot(head, mesh, global_matrix @ blocks[i][2]), (1, 1, 1))
+					records.setdefault(i, []).append(text)
 
-		# copy all collected files.
-		io_utils.path_reference_copy(copy_set)
+			if records:
+				fw('frame %d\n' % frame)
+				for i in sorted(records):
+					fw("".join(records[i]))
+			progress.step()
+
+	progress.leave_substeps()
 
 
 def _write(context, filepath,
@@ -370,6 +556,9 @@ def _write(context, filepath,
 		   EXPORT_ANIMATION,
 		   EXPORT_GLOBAL_MATRIX,
 		   EXPORT_PATH_MODE,  # Not used
+		   EXPORT_REFERENCES,
+		   EXPORT_ANIMATION_DELTAS=False,
+		   EXPORT_CULL_STUDS=False,
 		   ):
 
 	with ProgressReport(context.window_manager) as progress:
@@ -387,6 +576,30 @@ def _write(context, filepath,
 		else:
 			scene_frames = [orig_frame]  # Dont export an animation.
 
+		if EXPORT_ANIMATION and EXPORT_ANIMATION_DELTAS:
+			#one file for the first frame, and what changes in each frame after it
+			objects = context.selected_objects if EXPORT_SEL_ONLY else scene.objects
+			write_animation(filepath, objects, depsgraph, scene, scene_frames,
+							progress,
+							EXPORT_TRI=EXPORT_TRI,
+							EXPORT_EDGES=EXPORT_EDGES,
+							EXPORT_SMOOTH_GROUPS=EXPORT_SMOOTH_GROUPS,
+							EXPORT_SMOOTH_GROUPS_BITFLAGS=EXPORT_SMOOTH_GROUPS_BITFLAGS,
+							EXPORT_NORMALS=EXPORT_NORMALS,
+							EXPORT_UV=EXPORT_UV,
+							EXPORT_APPLY_MODIFIERS=EXPORT_APPLY_MODIFIERS,
+							EXPORT_APPLY_MODIFIERS_RENDER=EXPORT_APPLY_MODIFIERS_RENDER,
+							EXPORT_GROUP_BY_OB=EXPORT_GROUP_BY_OB,
+							EXPORT_KEEP_VERT_ORDER=EXPORT_KEEP_VERT_ORDER,
+							EXPORT_POLYGROUPS=EXPORT_POLYGROUPS,
+							EXPORT_GLOBAL_MATRIX=EXPORT_GLOBAL_MATRIX,
+							EXPORT_PATH_MODE=EXPORT_PATH_MODE,
+							EXPORT_REFERENCES=EXPORT_REFERENCES,
+							EXPORT_CULL_STUDS=EXPORT_CULL_STUDS,
+							)
+			scene.frame_set(orig_frame, subframe=0.0)
+			return
+
 		# Loop through all frames in the scene and export.
 		progress.enter_substeps(len(scene_frames))
 		for frame in scene_frames:
@@ -418,7 +631,9 @@ def _write(context, filepath,
 					   EXPORT_POLYGROUPS,
 					   EXPORT_GLOBAL_MATRIX,
 					   EXPORT_PATH_MODE,
-					   progress,
+					   EXPORT_REFERENCES,
+					   progress=progress,
+					   EXPORT_CULL_STUDS=EXPORT_CULL_STUDS,
 					   )
 			progress.leave_substeps()
 
@@ -443,7 +658,10 @@ def save(context,
 		 use_selection=True,
 		 use_animation=False,
 		 global_matrix=None,
-		 path_mode='AUTO'
+		 path_mode='AUTO',
+		 use_references=False,
+		 use_animation_deltas=False,
+		 use_cull_studs=False,
 		 ):
 
 	_write(context, filepath,
@@ -462,6 +680,9 @@ def save(context,
 		   EXPORT_ANIMATION=use_animation,
 		   EXPORT_GLOBAL_MATRIX=global_matrix,
 		   EXPORT_PATH_MODE=path_mode,
+		   EXPORT_REFERENCES=use_references,
+		   EXPORT_ANIMATION_DELTAS=use_animation_deltas,
+		   EXPORT_CULL_STUDS=use_cull_studs,
 		   )
 
 	return {'FINISHED'}
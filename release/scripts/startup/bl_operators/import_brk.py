@@ -24,31 +24,16 @@
 This script imports a BrickCAD BRK file to BrickCAD or Blender.
 """
 
-import array
 import os
-import time
 import bpy
 import mathutils
+import numpy as np
 
-from bpy_extras.io_utils import unpack_list
 from bpy_extras.image_utils import load_image
 from bpy_extras.wm_utils.progress_report import ProgressReport
+from brickcad import brk_parser, brkc
 
-
-def line_value(line_split):
-	"""
-	Returns 1 string representing the value for this line
-	None will be returned if there's only 1 word
-	"""
-	length = len(line_split)
-	if length == 1:
-		return None
-
-	elif length == 2:
-		return line_split[1]
-
-	elif length > 2:
-		return b' '.join(line_split[1:])
+from . import brick_connectivity, brick_inventory
 
 
 def filenames_group_by_ext(line, ext):
@@ -93,232 +78,152 @@ def brk_image_load(context_imagepath_map, line, DIR, recursive, relpath):
 
 	return image
 
-def split_mesh(verts_loc, faces, filepath, SPLIT_OB_OR_GROUP):
-	"""
-	Takes vert_loc and faces, and separates into multiple sets of
-	(verts_loc, faces, dataname)
-	"""
-
-	filename = os.path.splitext((os.path.basename(filepath)))[0]
-
-	if not SPLIT_OB_OR_GROUP or not faces:
-		use_verts_nor = any(f[1] for f in faces)
-		use_verts_tex = any(f[2] for f in faces)
-		# use the filename for the object name since we aren't chopping up the mesh.
-		return [(verts_loc, faces, filename, use_verts_nor, use_verts_tex)]
-
-	def key_to_name(key):
-		# if the key is a tuple, join it to make a string
-		if not key:
-			return filename  # assume its a string. make sure this is true if the splitting code is changed
-		elif isinstance(key, bytes):
-			return key.decode('utf-8', 'replace')
-		else:
-			return "_".join(k.decode('utf-8', 'replace') for k in key)
-
-	# Return a key that makes the faces unique.
-	face_split_dict = {}
-
-	oldkey = -1  # initialize to a value that will never match the key
-
-	for face in faces:
-		(face_vert_loc_indices,
-		 face_vert_nor_indices,
-		 face_vert_tex_indices,
-		 context_smooth_group,
-		 context_object_key,
-		 face_invalid_blenpoly,
-		 ) = face
-		key = context_object_key
-
-		if oldkey != key:
-			# Check the key has changed.
-			(verts_split, faces_split, vert_remap,
-			 use_verts_nor, use_verts_tex) = face_split_dict.setdefault(key, ([], [], {}, [], []))
-			oldkey = key
-
+def _np(buf, dtype):
+	#np.frombuffer() doesn't accept empty buffers with older NumPy
+	if len(buf):
+		return np.frombuffer(buf, dtype=dtype)
+	return np.empty(0, dtype=dtype)
 
-		if not use_verts_nor and face_vert_nor_indices:
-			use_verts_nor.append(True)
 
-		if not use_verts_tex and face_vert_tex_indices:
-			use_verts_tex.append(True)
-
-		# Remap verts to new vert list and add where needed
-		for loop_idx, vert_idx in enumerate(face_vert_loc_indices):
-			map_index = vert_remap.get(vert_idx)
-			if map_index is None:
-				map_index = len(verts_split)
-				vert_remap[vert_idx] = map_index  # set the new remapped index so we only add once and can reference next time.
-				verts_split.append(verts_loc[vert_idx])  # add the vert to the local verts
-
-			face_vert_loc_indices[loop_idx] = map_index  # remap to the local index
+def _loop_ranges(starts, totals):
+	"""
+	Indices of all the loops of the given faces, in order
+	"""
+	if not len(totals):
+		return np.empty(0, dtype=np.intp)
+	offsets = np.cumsum(totals) - totals
+	return np.repeat(starts - offsets, totals) + np.arange(totals.sum())
 
-		faces_split.append(face)
 
-	# remove one of the items and reorder
-	return [(verts_split, faces_split, key_to_name(key), bool(use_vnor), bool(use_vtex))
-			for key, (verts_split, faces_split, _, use_vnor, use_vtex)
-			in face_split_dict.items()]
+def _edge_keys(a, b, count):
+	#one integer per undirected edge, so edges can be compared with NumPy set operations
+	return np.minimum(a, b).astype(np.int64) * count + np.maximum(a, b)
 
 
 def create_mesh(new_objects,
 				use_edges,
-				verts_loc,
-				verts_nor,
-				verts_tex,
-				faces,
-				unique_smooth_groups,
-				vertex_groups,
+				data,
+				object_index,
+				use_split,
 				dataname,
 				):
 	"""
-	Takes all the data gathered and generates a mesh, adding the new object to new_objects
-	deals with ngons, sharp edges and assigning materials
+	Takes the parsed BrkData and generates the mesh of one of its objects (all of them when not splitting),
+	adding the new object to new_objects. Deals with ngons, sharp edges and assigning normals and UVs.
 	"""
-
-	if unique_smooth_groups:
-		sharp_edges = set()
-		smooth_group_users = {context_smooth_group: {} for context_smooth_group in unique_smooth_groups.keys()}
-		context_smooth_group_old = -1
-
+	positions = _np(data.positions, np.float32).reshape(-1, 3)
+	loop_vertex = _np(data.loop_vertex, np.intc)
+	face_starts = _np(data.face_loop_start, np.intc)
+	face_totals = _np(data.face_loop_total, np.intc)
+	face_smooth = _np(data.face_smooth, np.intc)
+	edges = _np(data.edges, np.intc).reshape(-1, 2)
+
+	if use_split:
+		faces = np.flatnonzero(_np(data.face_object, np.intc) == object_index)
+		edges = edges[_np(data.edge_object, np.intc) == object_index]
+	else:
+		faces = np.arange(len(face_starts))
+
+	starts = face_starts[faces]
+	totals = face_totals[faces]
+
+	#cant add single vert faces, and a face with two verts is really an edge
+	if use_edges:
+		line_loops = _loop_ranges(starts[totals == 2], totals[totals == 2])
+		edges = np.concatenate((edges, loop_vertex[line_loops].reshape(-1, 2)))
+	else:
+		edges = edges[:0]
+
+	keep = totals > 2
+	invalid = _np(data.face_invalid, np.int8)[faces] != 0
+	valid = keep & ~invalid
+
+	#polygons as loop indices into the parsed data, blender-invalid ngons (holes...) get tessellated
+	face_loops = [_loop_ranges(starts[valid], totals[valid])]
+	out_totals = [totals[valid]]
+	out_smooth = [face_smooth[faces[valid]]]
 	fgon_edges = set()  # Used for storing fgon keys when we need to tessellate/untessellate them (ngons with hole).
-	edges = []
-	tot_loops = 0
-
-	context_object_key = None
 
-	# reverse loop through face indices
-	for f_idx in range(len(faces) - 1, -1, -1):
-		(face_vert_loc_indices,
-		 face_vert_nor_indices,
-		 face_vert_tex_indices,
-		 context_smooth_group,
-		 context_object_key,
-		 face_invalid_blenpoly,
-		 ) = faces[f_idx]
-
-		len_face_vert_loc_indices = len(face_vert_loc_indices)
-
-		if len_face_vert_loc_indices == 1:
-			faces.pop(f_idx)  # cant add single vert faces
-
-		# Face with a single item in face_vert_nor_indices is actually a polyline!
-		elif len(face_vert_nor_indices) == 1 or len_face_vert_loc_indices == 2:
-			if use_edges:
-				edges.extend((face_vert_loc_indices[i], face_vert_loc_indices[i + 1])
-							 for i in range(len_face_vert_loc_indices - 1))
-			faces.pop(f_idx)
-
-		else:
-			# Smooth Group
-			if unique_smooth_groups and context_smooth_group:
-				# Is a part of of a smooth group and is a face
-				if context_smooth_group_old is not context_smooth_group:
-					edge_dict = smooth_group_users[context_smooth_group]
-					context_smooth_group_old = context_smooth_group
-
-				prev_vidx = face_vert_loc_indices[-1]
-				for vidx in face_vert_loc_indices:
+	for f_idx in faces[keep & invalid].tolist():
+		start = face_starts[f_idx]
+		loops = list(range(start, start + face_totals[f_idx]))
+		face_vert_loc_indices = loop_vertex[loops].tolist()
+
+		from bpy_extras.mesh_utils import ngon_tessellate
+		ngon_face_indices = ngon_tessellate([positions[vidx] for vidx in face_vert_loc_indices],
+											list(range(len(loops))),
+											debug_print=bpy.app.debug)
+		face_loops.append(np.array([loops[i] for ngon in ngon_face_indices for i in ngon], dtype=np.intp))
+		out_totals.append(np.full(len(ngon_face_indices), 3, dtype=np.intc))
+		out_smooth.append(np.full(len(ngon_face_indices), face_smooth[f_idx], dtype=np.intc))
+
+		# edges to make ngons
+		if len(ngon_face_indices) > 1:
+			edge_users = set()
+			for ngon in ngon_face_indices:
+				prev_vidx = face_vert_loc_indices[ngon[-1]]
+				for ngidx in ngon:
+					vidx = face_vert_loc_indices[ngidx]
+					if vidx == prev_vidx:
+						continue  #broken BRK... Just skip
 					edge_key = (prev_vidx, vidx) if (prev_vidx < vidx) else (vidx, prev_vidx)
 					prev_vidx = vidx
-					edge_dict[edge_key] = edge_dict.get(edge_key, 0) + 1
-
-			# NGons into triangles
-			if face_invalid_blenpoly:
-				# ignore triangles with invalid indices
-				if len(face_vert_loc_indices) > 3:
-					from bpy_extras.mesh_utils import ngon_tessellate
-					ngon_face_indices = ngon_tessellate(verts_loc, face_vert_loc_indices, debug_print=bpy.app.debug)
-					faces.extend([([face_vert_loc_indices[ngon[0]],
-									face_vert_loc_indices[ngon[1]],
-									face_vert_loc_indices[ngon[2]],
-									],
-								[face_vert_nor_indices[ngon[0]],
-									face_vert_nor_indices[ngon[1]],
-									face_vert_nor_indices[ngon[2]],
-									] if face_vert_nor_indices else [],
-								[face_vert_tex_indices[ngon[0]],
-									face_vert_tex_indices[ngon[1]],
-									face_vert_tex_indices[ngon[2]],
-									] if face_vert_tex_indices else [],
-								context_smooth_group,
-								context_object_key,
-								[],
-								)
-								for ngon in ngon_face_indices]
-								)
-					tot_loops += 3 * len(ngon_face_indices)
-
-					# edges to make ngons
-					if len(ngon_face_indices) > 1:
-						edge_users = set()
-						for ngon in ngon_face_indices:
-							prev_vidx = face_vert_loc_indices[ngon[-1]]
-							for ngidx in ngon:
-								vidx = face_vert_loc_indices[ngidx]
-								if vidx == prev_vidx:
-									continue  #broken BRK... Just skip
-								edge_key = (prev_vidx, vidx) if (prev_vidx < vidx) else (vidx, prev_vidx)
-								prev_vidx = vidx
-								if edge_key in edge_users:
-									fgon_edges.add(edge_key)
-								else:
-									edge_users.add(edge_key)
-
-				faces.pop(f_idx)
-			else:
-				tot_loops += len_face_vert_loc_indices
-
-	#build sharp edges
-	if unique_smooth_groups:
-		for edge_dict in smooth_group_users.values():
-			for key, users in edge_dict.items():
-				if users == 1:  #this edge is on the boundary of a group
-					sharp_edges.add(key)
+					if edge_key in edge_users:
+						fgon_edges.add(edge_key)
+					else:
+						edge_users.add(edge_key)
+
+	loops = np.concatenate(face_loops)
+	totals = np.concatenate(out_totals).astype(np.intc)
+	smooth = np.concatenate(out_smooth)
+	loop_starts = (np.cumsum(totals) - totals).astype(np.intc)
+
+	#a whole file with nothing to tessellate keeps every loop in order, the parsed (or memory mapped) buffers are used as they are
+	identity = not use_split and len(loops) == len(loop_vertex) and bool(valid.all())
+	if identity:
+		loops = slice(None)
+		verts = loop_vertex
+	else:
+		verts = loop_vertex[loops]
+
+	#only split objects drop the verts they don't use
+	if use_split:
+		used = np.unique(np.concatenate((verts, edges.ravel())))
+		remap = np.full(len(positions), -1, dtype=np.intc)
+		remap[used] = np.arange(len(used), dtype=np.intc)
+		verts = remap[verts]
+		edges = remap[edges]
+		fgon_edges = {(remap[a], remap[b]) for a, b in fgon_edges}
+		positions = positions[used]
 
 	me = bpy.data.meshes.new(dataname)
 
-	me.vertices.add(len(verts_loc))
-	me.loops.add(tot_loops)
-	me.polygons.add(len(faces))
-
-	#verts_loc is a list of (x, y, z) tuples
-	me.vertices.foreach_set("co", unpack_list(verts_loc))
+	me.vertices.add(len(positions))
+	me.loops.add(len(verts))
+	me.polygons.add(len(totals))
 
-	loops_vert_idx = tuple(vidx for (face_vert_loc_indices, _, _, _, _, _) in faces for vidx in face_vert_loc_indices)
-	faces_loop_start = []
-	lidx = 0
-	for f in faces:
-		face_vert_loc_indices = f[0]
-		nbr_vidx = len(face_vert_loc_indices)
-		faces_loop_start.append(lidx)
-		lidx += nbr_vidx
-	faces_loop_total = tuple(len(face_vert_loc_indices) for (face_vert_loc_indices, _, _, _, _, _) in faces)
+	me.vertices.foreach_set("co", np.ascontiguousarray(positions).ravel())
+	me.loops.foreach_set("vertex_index", np.asarray(verts, dtype=np.intc))
+	me.polygons.foreach_set("loop_start", loop_starts)
+	me.polygons.foreach_set("loop_total", totals)
+	me.polygons.foreach_set("use_smooth", smooth != 0)
 
-	me.loops.foreach_set("vertex_index", loops_vert_idx)
-	me.polygons.foreach_set("loop_start", faces_loop_start)
-	me.polygons.foreach_set("loop_total", faces_loop_total)
-
-	faces_use_smooth = tuple(bool(context_smooth_group) for (_, _, _, context_smooth_group, _, _) in faces)
-	me.polygons.foreach_set("use_smooth", faces_use_smooth)
-
-	if verts_nor and me.loops:
+	use_normals = bool(data.normals) and bool(len(verts))
+	if use_normals:
 		#note: we store 'temp' normals in loops, since validate() may alter final mesh, we can only set custom lnors *after* calling it
 		me.create_normals_split()
-		loops_nor = tuple(no for (_, face_vert_nor_indices, _, _, _, _) in faces for face_noidx in face_vert_nor_indices for no in verts_nor[face_noidx])
-		me.loops.foreach_set("normal", loops_nor)
+		normals = _np(data.normals, np.float32).reshape(-1, 3)
+		me.loops.foreach_set("normal", normals[_np(data.loop_normal, np.intc)[loops]].ravel())
 
-	if verts_tex and me.polygons:
+	if data.uvs and len(totals):
 		me.uv_layers.new(do_init=False)
-		loops_uv = tuple(uv for (_, _, face_vert_tex_indices, _, _, _) in faces for face_uvidx in face_vert_tex_indices for uv in verts_tex[face_uvidx])
-		me.uv_layers[0].data.foreach_set("uv", loops_uv)
+		uvs = _np(data.uvs, np.float32).reshape(-1, 2)
+		me.uv_layers[0].data.foreach_set("uv", uvs[_np(data.loop_uv, np.intc)[loops]].ravel())
 
-	use_edges = use_edges and bool(edges)
+	use_edges = use_edges and bool(len(edges))
 	if use_edges:
 		me.edges.add(len(edges))
-		#edges should be a list of (a, b) tuples
-		me.edges.foreach_set("vertices", unpack_list(edges))
+		me.edges.foreach_set("vertices", edges.astype(np.intc).ravel())
 
 	me.validate(clean_customdata=False)  # *Very* important to not remove lnors here!
 	me.update(calc_edges=use_edges)
@@ -328,11 +233,11 @@ def create_mesh(new_objects,
 		import bmesh
 		bm = bmesh.new()
 		bm.from_mesh(me)
-		verts = bm.verts[:]
+		bm_verts = bm.verts[:]
 		get = bm.edges.get
-		edges = [get((verts[vidx1], verts[vidx2])) for vidx1, vidx2 in fgon_edges]
+		dissolve = [get((bm_verts[vidx1], bm_verts[vidx2])) for vidx1, vidx2 in fgon_edges]
 		try:
-			bmesh.ops.dissolve_edges(bm, edges=edges, use_verts=False)
+			bmesh.ops.dissolve_edges(bm, edges=dissolve, use_verts=False)
 		except:
 			#possible dissolve fails for some edges, but don't fail silently in case this is a real bug
 			import traceback
@@ -342,120 +247,168 @@ def create_mesh(new_objects,
 		bm.free()
 
 	# XXX If validate changes the geometry, this is likely to be broken...
-	if unique_smooth_groups and sharp_edges:
-		for e in me.edges:
-			if e.key in sharp_edges:
-				e.use_edge_sharp = True
-
-	if verts_nor:
-		clnors = array.array('f', [0.0] * (len(me.loops) * 3))
+	unique_smooth_groups = len(data.smooth_groups) > 1
+	if unique_smooth_groups and me.edges:
+		#an edge used by only one face of a smooth group is on the boundary of that group
+		grouped = np.repeat(smooth, totals)
+		in_group = grouped != 0
+		loop_next = np.arange(1, len(verts) + 1)
+		loop_next[loop_starts + totals - 1] = loop_starts
+		keys = _edge_keys(verts, verts[loop_next], len(positions))[in_group]
+		group_keys = np.stack((grouped[in_group].astype(np.int64), keys), axis=1)
+		unique_keys, users = np.unique(group_keys, axis=0, return_counts=True)
+		sharp_keys = unique_keys[users == 1, 1]
+
+		if len(sharp_keys):
+			me_edges = np.empty(len(me.edges) * 2, dtype=np.intc)
+			me.edges.foreach_get("vertices", me_edges)
+			me_edges.shape = (-1, 2)
+			sharp = np.isin(_edge_keys(me_edges[:, 0], me_edges[:, 1], len(positions)), sharp_keys)
+			me.edges.foreach_set("use_edge_sharp", sharp)
+
+	if use_normals:
+		clnors = np.empty(len(me.loops) * 3, dtype=np.float32)
 		me.loops.foreach_get("normal", clnors)
 
 		if not unique_smooth_groups:
-			me.polygons.foreach_set("use_smooth", [True] * len(me.polygons))
+			me.polygons.foreach_set("use_smooth", np.ones(len(me.polygons), dtype=bool))
 
-		me.normals_split_custom_set(tuple(zip(*(iter(clnors),) * 3)))
+		me.normals_split_custom_set(clnors.reshape(-1, 3))
 		me.use_auto_smooth = True
 
 	ob = bpy.data.objects.new(me.name, me)
 	new_objects.append(ob)
 
-	# Create the vertex groups. No need to have the flag passed here since we test for the
-	# content of the vertex_groups. If the user selects to NOT have vertex groups saved then
-	# the following test will never run
-	for group_name, group_indices in vertex_groups.items():
-		group = ob.vertex_groups.new(name=group_name.decode('utf-8', "replace"))
-		group.add(group_indices, 1.0, 'REPLACE')
-
-
-def strip_slash(line_split):
-	if line_split[-1][-1] == 92:  # '\' char
-		if len(line_split[-1]) == 1:
-			line_split.pop()  # remove the \ item
-		else:
-			line_split[-1] = line_split[-1][:-1]  # remove the \ from the end last number
-		return True
-	return False
+	# Create the vertex groups. Only filled when not splitting, since the indices refer to the whole file
+	for group_name, group_indices in data.vertex_groups.items():
+		group = ob.vertex_groups.new(name=group_name)
+		group.add(group_indices.tolist(), 1.0, 'REPLACE')
 
 
-def get_float_func(filepath):
+def add_connectors(data, parents, collection, use_connector_empties=False):
 	"""
-	find the float function for this brk file
-	- whether to replace commas or not
+	Stores the connectors of data on the meshes of the objects in parents (file object name -> object) they belong to.
+	Connectors without a brick or of an unknown kind, and with use_connector_empties all of them, also become empties,
+	created in one batch. Returns the new empties.
 	"""
-	file = open(filepath, 'rb')
-	for line in file:  # .readlines():
-		line = line.lstrip()
-		if line.startswith(b'v'):  # vn vt v
-			if b',' in line:
-				file.close()
-				return lambda f: float(f.replace(b',', b'.'))
-			elif b'.' in line:
-				file.close()
-				return float
-
-	file.close()
-	# in case all vert values were ints
-	return float
-
-
-def any_number_as_int(svalue):
-	if b',' in svalue:
-		svalue = svalue.replace(b',', b'.')
-	return int(float(svalue))
+	layers = {}  #parent name -> (parent, connector types, file locations)
+	new_connectors = []
+	inverses = {}  #parent name -> inverted world matrix, computed once per parent
+
+	for name, co, parentName in data.iter_connectors():
+		parent = parents.get(parentName)
+		kind = brick_connectivity.connector_type(name)
+		if parent is not None and kind is not None:
+			layer = layers.get(parent.name)
+			if layer is None:
+				layer = layers[parent.name] = (parent, [], [])
+			layer[1].append(kind)
+			layer[2].append(co)
+			if not use_connector_empties:
+				continue
+
+		studEmpty = bpy.data.objects.new(name, None)
+		studEmpty.location = co
+		studEmpty.brick_part_id = brick_inventory.NOT_A_BRICK
+		new_connectors.append(studEmpty)
+
+		if parent is not None:
+			inverse = inverses.get(parent.name)
+			if inverse is None:
+				inverse = inverses[parent.name] = parent.matrix_world.inverted()
+			studEmpty.parent = parent
+			studEmpty.matrix_parent_inverse = inverse #take care to keep transform, otherwise children end up in weird places
+
+	for parent, types, locations in layers.values():
+		#connector locations are in world space with studs facing up, the layer keeps them in the brick's object space
+		inverse = np.array(parent.matrix_world.inverted())
+		locations = np.array(locations) @ inverse[:3, :3].T + inverse[:3, 3]
+		up = inverse[:3, 2] / (np.linalg.norm(inverse[:3, 2]) or 1.0)
+		directions = np.where((np.array(types) == brick_connectivity.ConnectorType.STUD)[:, None], up, -up)
+		brick_connectivity.set_connector_layer(parent.data, types, locations, directions)
+
+	link = collection.objects.link
+	for studEmpty in new_connectors:
+		link(studEmpty)
+
+	return new_connectors
 
 
 def load(context,
 		 filepath,
 		 *,
-		 global_clight_size=0.0,
-		 use_smooth_groups=True,
-		 use_edges=True,
-		 use_split_objects=True,
-		 use_split_groups=False,
-		 use_image_search=True,
-		 use_groups_as_vgroups=False,
-		 relpath=None,
-		 global_matrix=None
+		 use_instancing=False,
+		 **keywords
 		 ):
 	"""
 	Called by the user interface or another script.
 	load(path) - should give acceptable results.
-	This function passes the file and sends the data off
-		to be split into objects and then converted into mesh objects
+	With use_instancing the file becomes a part collection and the scene only gets an instance of it,
+	unless it is a scene file, then the parts it references are placed as instances.
 	"""
-	def unique_name(existing_names, name_orig):
-		i = 0
-		name = name_orig
-		while name in existing_names:
-			name = b"%s.%03d" % (name_orig, i)
-			i += 1
-		existing_names.add(name)
-		return name
-
-	def handle_vec(line_start, context_multi_line, line_split, tag, data, vec, vec_len):
-		ret_context_multi_line = tag if strip_slash(line_split) else b''
-		if line_start == tag:
-			vec[:] = [float_func(v) for v in line_split[1:]]
-		elif context_multi_line == tag:
-			vec += [float_func(v) for v in line_split]
-		if not ret_context_multi_line:
-			data.append(tuple(vec[:vec_len]))
-		return ret_context_multi_line
-
-	def create_face(context_smooth_group, context_object_key):
-		face_vert_loc_indices = []
-		face_vert_nor_indices = []
-		face_vert_tex_indices = []
-		return (
-			face_vert_loc_indices,
-			face_vert_nor_indices,
-			face_vert_tex_indices,
-			context_smooth_group,
-			context_object_key,
-			[],  # If non-empty, that face is a Blender-invalid ngon (holes...), need a mutable object for that...
-		)
+	if use_instancing:
+		data = load_data(filepath, **{name: keywords[name] for name in brkc.OPTION_FLAGS if name in keywords})
+		if not data.reference_count:
+			from . import brick_instances
+			brick_instances.add_instance(context, filepath, **keywords)
+			return {'FINISHED'}
+
+		load_objects(context, filepath, use_instancing=True, data=data, **keywords)
+	else:
+		load_objects(context, filepath, **keywords)
+
+	return {'FINISHED'}
 
+
+def load_data(filepath,
+			  *,
+			  use_smooth_groups=True,
+			  use_edges=True,
+			  use_split_objects=True,
+			  use_split_groups=False,
+			  use_groups_as_vgroups=False,
+			  ):
+	"""
+	The BrkData of a file, from its compiled sidecar when it has an up to date one
+	"""
+	if use_split_objects or use_split_groups:
+		use_groups_as_vgroups = False
+
+	return brkc.load(filepath,
+					 use_smooth_groups=use_smooth_groups,
+					 use_edges=use_edges,
+					 use_split_objects=use_split_objects,
+					 use_split_groups=use_split_groups,
+					 use_groups_as_vgroups=use_groups_as_vgroups,
+					 )
+
+
+def load_objects(context,
+				 filepath,
+				 *,
+				 global_clight_size=0.0,
+				 use_smooth_groups=True,
+				 use_edges=True,
+				 use_split_objects=True,
+				 use_split_groups=False,
+				 use_image_search=True,
+				 use_groups_as_vgroups=False,
+				 relpath=None,
+				 global_matrix=None,
+				 collection=None,
+				 use_connector_empties=False,
+				 use_instancing=False,
+				 data=None
+				 ):
+	"""
+	This function parses the file with brk_parser (or maps its compiled .brkc) and sends the data off
+		to be split into objects and then converted into mesh objects.
+	New objects go to collection, or selected into the active collection when it is None.
+	Connectors are stored on the meshes, use_connector_empties adds an empty for each of them to show where they are.
+	Parts the file references are placed from the part library, as instances with use_instancing.
+	data is the file's BrkData when the caller already loaded it.
+	Returns the lists of (new objects, new connector empties)
+	"""
 	with ProgressReport(context.window_manager) as progress:
 		progress.enter_substeps(1, "Importing BRK %r..." % filepath)
 
@@ -465,225 +418,21 @@ def load(context,
 		if use_split_objects or use_split_groups:
 			use_groups_as_vgroups = False
 
-		time_main = time.time()
-
-		verts_loc = []
-		verts_nor = []
-		verts_tex = []
-		faces = []  # tuples of the faces
-		vertex_groups = {}  # when use_groups_as_vgroups is true
-
-		# Get the string to float conversion func for this file- is 'float' for almost all files.
-		float_func = get_float_func(filepath)
-
-		# Context variables
-		context_smooth_group = None
-		context_object_key = None
-		context_object_obpart = None
-		context_vgroup = None
-
-		objects_names = set()
-
-		# Until we can use sets
-		unique_smooth_groups = {}
-
-		# when there are faces that end with \
-		# it means they are multiline-
-		# since we use xreadline we cant skip to the next line
-		# so we need to know whether
-		context_multi_line = b''
-
-		# Per-face handling data.
-		face_vert_loc_indices = None
-		face_vert_nor_indices = None
-		face_vert_tex_indices = None
-		verts_loc_len = verts_nor_len = verts_tex_len = 0
-		face_items_usage = set()
-		face_invalid_blenpoly = None
-		prev_vidx = None
-		face = None
-		vec = []
-
-		childParentPairs = [] #maintains a tuple of child objects and parent names
-
-		quick_vert_failures = 0
-		skip_quick_vert = False
-
 		progress.enter_substeps(3, "Parsing BRK file...")
-		with open(filepath, 'rb') as f:
-			for line in f:
-				line_split = line.split()
-
-				if not line_split:
-					continue
-
-				line_start = line_split[0]  # we compare with this a _lot_
-
-				# Handling vertex data are pretty similar, factorize that.
-				# Also, most BRK files store all those on a single line, so try fast parsing for that first,
-				# and only fallback to full multi-line parsing when needed, this gives significant speed-up
-				# (~40% on affected code).
-				if line_start == b'v':
-					vdata, vdata_len, do_quick_vert = verts_loc, 3, not skip_quick_vert
-				elif line_start == b'vn':
-					vdata, vdata_len, do_quick_vert = verts_nor, 3, not skip_quick_vert
-				elif line_start == b'vt':
-					vdata, vdata_len, do_quick_vert = verts_tex, 2, not skip_quick_vert
-				elif context_multi_line == b'v':
-					vdata, vdata_len, do_quick_vert = verts_loc, 3, False
-				elif context_multi_line == b'vn':
-					vdata, vdata_len, do_quick_vert = verts_nor, 3, False
-				elif context_multi_line == b'vt':
-					vdata, vdata_len, do_quick_vert = verts_tex, 2, False
-				else:
-					vdata_len = 0
-
-				if vdata_len:
-					if do_quick_vert:
-						try:
-							vdata.append(tuple(map(float_func, line_split[1:vdata_len + 1])))
-						except:
-							do_quick_vert = False
-							# In case we get too many failures on quick parsing, force fallback to full multi-line one.
-							# Exception handling can become costly...
-							quick_vert_failures += 1
-							if quick_vert_failures > 10000:
-								skip_quick_vert = True
-					if not do_quick_vert:
-						context_multi_line = handle_vec(line_start, context_multi_line, line_split,
-														context_multi_line or line_start, vdata, vec, vdata_len)
-
-				elif line_start == b'f' or context_multi_line == b'f':
-					if not context_multi_line:
-						line_split = line_split[1:]
-						# Instantiate a face
-						face = create_face(context_smooth_group, context_object_key)
-						(face_vert_loc_indices, face_vert_nor_indices, face_vert_tex_indices,
-						 _1, _2, face_invalid_blenpoly) = face
-						faces.append(face)
-						face_items_usage.clear()
-						verts_loc_len = len(verts_loc)
-						verts_nor_len = len(verts_nor)
-						verts_tex_len = len(verts_tex)
-					# Else, use face_vert_loc_indices and face_vert_tex_indices previously defined and used the obj_face
-
-					context_multi_line = b'f' if strip_slash(line_split) else b''
-
-					for v in line_split:
-						brk_vert = v.split(b'/')
-						idx = int(brk_vert[0])  # Note that we assume here we cannot get BRK invalid 0 index...
-						vert_loc_index = (idx + verts_loc_len) if (idx < 1) else idx - 1
-						# Add the vertex to the current group
-						# *warning*, this wont work for files that have groups defined around verts
-						if use_groups_as_vgroups and context_vgroup:
-							vertex_groups[context_vgroup].append(vert_loc_index)
-						# This a first round to quick-detect ngons that *may* use a same edge more than once.
-						# Potential candidate will be re-checked once we have done parsing the whole face.
-						if not face_invalid_blenpoly:
-							# If we use more than once a same vertex, invalid ngon is suspected.
-							if vert_loc_index in face_items_usage:
-								face_invalid_blenpoly.append(True)
-							else:
-								face_items_usage.add(vert_loc_index)
-						face_vert_loc_indices.append(vert_loc_index)
-
-						# formatting for faces with normals and textures is
-						# loc_index/tex_index/nor_index
-						if len(brk_vert) > 1 and brk_vert[1] and brk_vert[1] != b'0':
-							idx = int(brk_vert[1])
-							face_vert_tex_indices.append((idx + verts_tex_len) if (idx < 1) else idx - 1)
-						else:
-							face_vert_tex_indices.append(0)
-
-						if len(brk_vert) > 2 and brk_vert[2] and brk_vert[2] != b'0':
-							idx = int(brk_vert[2])
-							face_vert_nor_indices.append((idx + verts_nor_len) if (idx < 1) else idx - 1)
-						else:
-							face_vert_nor_indices.append(0)
-
-					if not context_multi_line:
-						# Means we have finished a face, we have to do final check if ngon is suspected to be blender-invalid...
-						if face_invalid_blenpoly:
-							face_invalid_blenpoly.clear()
-							face_items_usage.clear()
-							prev_vidx = face_vert_loc_indices[-1]
-							for vidx in face_vert_loc_indices:
-								edge_key = (prev_vidx, vidx) if (prev_vidx < vidx) else (vidx, prev_vidx)
-								if edge_key in face_items_usage:
-									face_invalid_blenpoly.append(True)
-									break
-								face_items_usage.add(edge_key)
-								prev_vidx = vidx
-
-				elif use_edges and (line_start == b'l' or context_multi_line == b'l'):
-					# very similar to the face load function above with some parts removed
-					if not context_multi_line:
-						line_split = line_split[1:]
-						# Instantiate a face
-						face = create_face(context_smooth_group, context_object_key)
-						face_vert_loc_indices = face[0]
-						# XXX A bit hackish, we use special 'value' of face_vert_nor_indices (a single True item) to tag this
-						#	 as a polyline, and not a regular face...
-						face[1][:] = [True]
-						faces.append(face)
-					# Else, use face_vert_loc_indices previously defined and used the brk_face
-
-					context_multi_line = b'l' if strip_slash(line_split) else b''
-
-					for v in line_split:
-						brk_vert = v.split(b'/')
-						idx = int(brk_vert[0]) - 1
-						face_vert_loc_indices.append((idx + len(verts_loc) + 1) if (idx < 0) else idx)
-
-				elif line_start == b's':
-					if use_smooth_groups:
-						context_smooth_group = line_value(line_split)
-						if context_smooth_group == b'off':
-							context_smooth_group = None
-						elif context_smooth_group:  # is not None
-							unique_smooth_groups[context_smooth_group] = None
-
-				elif line_start == b'o':
-					if use_split_objects:
-						context_object_key = unique_name(objects_names, line_value(line_split))
-						context_object_obpart = context_object_key
-						# unique_objects[context_object_key]= None
-
-				elif line_start == b'st':
-					studEmpty = bpy.data.objects.new(line_split[1].decode(), None)
-					bpy.context.collection.objects.link(studEmpty)
-					studEmpty.location = [float(line_split[2].decode()), float(line_split[3].decode()), float(line_split[4].decode())]
-
-					#add stud mesh
-					#print("Adding stud mesh")
-					#mesh = bpy.data.meshes.new("mesh")
-					
-					#studObj = bpy.data.objects.new("test", None)
-					#bpy.context.collection.objects.link(studObj)
-					#studObj.location = [0,0,0]
-
-					if len(line_split) == 7:
-						#indicates that this empty has a parent object
-						parentName = line_split[6].decode()
-
-						#append this pair to the list for future use
-						childParentPairs.append([studEmpty, parentName])
-
-				elif line_start == b'g':
-					if use_split_groups:
-						grppart = line_value(line_split)
-						context_object_key = (context_object_obpart, grppart) if context_object_obpart else grppart
-					elif use_groups_as_vgroups:
-						context_vgroup = line_value(line.split())
-						if context_vgroup and context_vgroup != b'(null)':
-							vertex_groups.setdefault(context_vgroup, [])
-						else:
-							context_vgroup = None  # dont assign a vgroup
-
-		progress.step("Done, building geometries (verts:%i faces:%i smoothgroups:%i) ..." % (len(verts_loc), len(faces), len(unique_smooth_groups)))
+		if data is None:
+			data = load_data(filepath,
+							 use_smooth_groups=use_smooth_groups,
+							 use_edges=use_edges,
+							 use_split_objects=use_split_objects,
+							 use_split_groups=use_split_groups,
+							 use_groups_as_vgroups=use_groups_as_vgroups,
+							 )
+
+		progress.step("Done, building geometries (verts:%i faces:%i smoothgroups:%i) ..." % (data.vertex_count, data.face_count, len(data.smooth_groups) - 1))
 
 		# deselect all
-		if bpy.ops.object.select_all.poll():
+		select = collection is None
+		if select and bpy.ops.object.select_all.poll():
 			bpy.ops.object.select_all(action='DESELECT')
 
 		scene = context.scene
@@ -691,29 +440,37 @@ def load(context,
 
 		# Split the mesh by objects, may
 		SPLIT_OB_OR_GROUP = bool(use_split_objects or use_split_groups)
+		if SPLIT_OB_OR_GROUP and data.face_count:
+			object_indices = sorted(set(data.face_object) | set(data.edge_object))
+		elif data.reference_count and not data.vertex_count:
+			#a scene file made of references only, it has no geometry of its own
+			SPLIT_OB_OR_GROUP = False
+			object_indices = []
+		else:
+			# use the filename for the object name since we aren't chopping up the mesh.
+			SPLIT_OB_OR_GROUP = False
+			object_indices = [0]
 
-		for data in split_mesh(verts_loc, faces, filepath, SPLIT_OB_OR_GROUP):
-			verts_loc_split, faces_split, dataname, use_vnor, use_vtex = data
+		for object_index in object_indices:
 			# Create meshes from the data, warning 'vertex_groups' wont support splitting
-			#~ print(dataname, use_vnor, use_vtex)
 			create_mesh(new_objects,
 						use_edges,
-						verts_loc_split,
-						verts_nor if use_vnor else [],
-						verts_tex if use_vtex else [],
-						faces_split,
-						unique_smooth_groups,
-						vertex_groups,
-						dataname,
+						data,
+						object_index,
+						SPLIT_OB_OR_GROUP,
+						brk_parser.object_name(data, object_index, filepath),
 						)
 
 		view_layer = context.view_layer
-		collection = view_layer.active_layer_collection.collection
+		if collection is None:
+			collection = view_layer.active_layer_collection.collection
 
-		# Create new brk
-		for brk in new_objects:
+		# Create new brk, the part ID keeps its mould when the object gets renamed
+		for object_index, brk in zip(object_indices, new_objects):
 			collection.objects.link(brk)
-			brk.select_set(True)
+			if select:
+				brk.select_set(True)
+			brick_inventory.set_brick_ids(scene, brk, brk_parser.object_name(data, object_index, filepath), filepath)
 
 			# we could apply this anywhere before scaling.
 			brk.matrix_world = global_matrix
@@ -743,15 +500,40 @@ def load(context,
 			for brk in new_objects:
 				brk.scale = scale, scale, scale
 
-		#set parent-child relationships
-		for pair in childParentPairs:
-			for obj in context.scene.objects:
-				if pair[1] == obj.name:
-					pair[0].parent = obj
-					pair[0].matrix_parent_inverse = obj.matrix_world.inverted() #take care to keep transform, otherwise children end up in weird places
-					break
+		#connectors name their parent as written in this file, so resolve them against the objects we just made and never scan the scene
+		#unnamed geometry is None in data.objects, as are connectors without a parent, which stay without one
+		parents = {}
+		for object_index, ob in zip(object_indices, new_objects):
+			if SPLIT_OB_OR_GROUP:
+				parents[data.objects[object_index]] = ob
+			else:
+				parents.update(dict.fromkeys(data.objects, ob))
+		parents.pop(None, None)
+
+		new_connectors = []
+		if data.connector_count:
+			if global_clight_size:
+				view_layer.update()
+			new_connectors = add_connectors(data, parents, collection, use_connector_empties)
+
+		if data.reference_count:
+			from . import brick_instances
+			progress.step("Placing %i parts..." % data.reference_count)
+			placed, missing = brick_instances.add_references(context, collection, data.iter_references(),
+															 os.path.dirname(filepath), use_instancing,
+															 global_matrix=global_matrix,
+															 use_smooth_groups=use_smooth_groups,
+															 use_edges=use_edges,
+															 use_connector_empties=use_connector_empties,
+															 )
+			for reference in sorted(missing):
+				print("\tWarning: part %r not found in the library or next to %r" % (reference, filepath))
+			if select:
+				for brk in placed:
+					brk.select_set(True)
+			new_objects += placed
 
 		progress.leave_substeps("Done.")
 		progress.leave_substeps("Finished importing: %r" % filepath)
 
-	return {'FINISHED'}
+	return new_objects, new_connectors
@@ -0,0 +1,69 @@
+# Apache License, Version 2.0
+
+# ./blender.bin --background -noaudio --python tests/python/bl_brickcad_bom.py -- --verbose
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from brickcad import bom
+
+ROWS = [
+    ("3001", "Red", 4),
+    ("3001", "5", 2),
+    ("3023", "", 10),
+]
+
+
+class BomTesting(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, format, rows=ROWS):
+        filepath = os.path.join(self.directory, "bom" + bom.FORMATS[format][0])
+        bom.write(filepath, rows, format)
+        return filepath
+
+    def test_csv(self):
+        with open(self.write('CSV'), newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ["part", "color", "quantity"])
+        self.assertEqual([(part, color, int(quantity)) for part, color, quantity in rows[1:]], ROWS)
+
+    def test_json(self):
+        with open(self.write('JSON'), encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertEqual(data["total"], 16)
+        self.assertEqual([(row["part"], row["color"], row["quantity"]) for row in data["parts"]], ROWS)
+
+    def test_bricklink(self):
+        items = ET.parse(self.write('BRICKLINK')).getroot().findall("ITEM")
+        self.assertEqual([item.findtext("ITEMID") for item in items], ["3001", "3001", "3023"])
+        self.assertEqual([item.findtext("MINQTY") for item in items], ["4", "2", "10"])
+        # only numeric colors are BrickLink IDs, names are kept as a remark
+        self.assertEqual([item.findtext("COLOR") for item in items], [None, "5", None])
+        self.assertEqual([item.findtext("REMARKS") for item in items], ["Red", None, None])
+
+    def test_bricklink_color_ids(self):
+        filepath = os.path.join(self.directory, "bom.xml")
+        bom.write_bricklink_xml(filepath, ROWS, {"Red": 5})
+        items = ET.parse(filepath).getroot().findall("ITEM")
+        self.assertEqual([item.findtext("COLOR") for item in items], ["5", "5", None])
+        self.assertIsNone(items[0].find("REMARKS"))
+
+    def test_empty(self):
+        with open(self.write('JSON', []), encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {"parts": [], "total": 0})
+        self.assertEqual(ET.parse(self.write('BRICKLINK', [])).getroot().findall("ITEM"), [])
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()
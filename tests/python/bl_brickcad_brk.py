@@ -0,0 +1,258 @@
+# Apache License, Version 2.0
+
+# ./blender.bin --background -noaudio --python tests/python/bl_brickcad_brk.py -- --verbose
+import os
+import shutil
+import tempfile
+import unittest
+from array import array
+from unittest import mock
+
+import numpy as np
+
+from brickcad import brk_animation, brk_parser, brk_writer, brkc
+
+try:
+    import bpy
+    # workers are started with Python, not with Blender
+    EXECUTABLE = bpy.app.binary_path_python
+except ImportError:
+    EXECUTABLE = None
+
+DEMO_BRK = os.path.join(os.path.dirname(__file__), "..", "..", "release", "datafiles", "bricks", "demo-2.brk")
+
+SMALL_BRK = b"""\
+o a
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+f 1 2 3 4
+o b
+v 0 0 1
+v 1 0 1
+v 1 1 1
+f 5 6 7
+l 5 7
+st stud_up 0.5 0.5 1 p a
+st stud_hole 0.5 0.5 0
+"""
+
+
+ARRAYS = ("positions", "normals", "uvs", "loop_vertex", "loop_normal", "loop_uv", "face_loop_start", "face_loop_total",
+          "face_smooth", "face_object", "face_invalid", "edges", "edge_object", "reference_matrices")
+
+
+class ParserTesting(unittest.TestCase):
+    def test_small(self):
+        data = brk_parser.parse_lines(SMALL_BRK.splitlines())
+        self.assertEqual(data.objects, [None, "a", "b"])
+        self.assertEqual(list(data.loop_vertex), [0, 1, 2, 3, 4, 5, 6])
+        self.assertEqual(list(data.face_loop_start), [0, 4])
+        self.assertEqual(list(data.face_loop_total), [4, 3])
+        self.assertEqual(list(data.face_object), [1, 2])
+        self.assertEqual(list(data.edges), [4, 6])
+        self.assertEqual(list(data.iter_connectors()),
+                         [("stud_up", (0.5, 0.5, 1.0), "a"), ("stud_hole", (0.5, 0.5, 0.0), None)])
+
+    def test_decimal_comma(self):
+        data = brk_parser.parse_lines([b"v 1.0 2,5 3.0", b"v 4,0 5.0 6.0", b"vt 0,5 0.25", b"f 1/1 2/1 1/1"])
+        self.assertEqual(list(data.positions), [1.0, 2.5, 3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(list(data.uvs), [0.5, 0.25])
+        self.assertEqual(data.vertex_count, 2)
+
+    def test_demo(self):
+        data = brk_parser.parse(DEMO_BRK)
+        self.assertEqual(data.vertex_count, 3958)
+        self.assertEqual(data.face_count, 2004)
+        self.assertEqual(data.connector_count, 16)
+        self.assertEqual(sum(data.face_loop_total), len(data.loop_vertex))
+        self.assertLess(max(data.loop_vertex), data.vertex_count)
+
+
+class CompiledTesting(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "demo.brk")
+        shutil.copyfile(DEMO_BRK, self.source)
+        self.sidecar = brkc.sidecar_path(self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compile(self):
+        brkc.write(self.sidecar, brk_parser.parse(self.source), self.source)
+
+    def test_round_trip(self):
+        parsed = brk_parser.parse(self.source)
+        self.compile()
+        loaded = brkc.read(self.sidecar, self.source)
+        self.assertIsNotNone(loaded)
+
+        for name in ARRAYS:
+            self.assertEqual(bytes(getattr(loaded, name)), bytes(getattr(parsed, name)), name)
+        self.assertEqual(bytes(loaded.connectors), bytes(parsed.connectors))
+        self.assertEqual(loaded.objects, parsed.objects)
+        self.assertEqual(loaded.strings, parsed.strings)
+        self.assertEqual(list(loaded.iter_connectors()), list(parsed.iter_connectors()))
+        # copies, not views into the map
+        self.assertIsInstance(loaded.positions, array)
+
+    def test_compile_again(self):
+        # the map is closed after reading, so the sidecar can be replaced
+        self.compile()
+        self.assertIsNotNone(brkc.read(self.sidecar, self.source))
+        os.remove(self.sidecar)
+        self.compile()
+        self.assertEqual(brkc.read(self.sidecar, self.source).vertex_count, 3958)
+
+    def test_other_options(self):
+        self.compile()
+        self.assertIsNone(brkc.read(self.sidecar, self.source, use_edges=False))
+
+    def test_changed_source(self):
+        self.compile()
+        with open(self.source, 'ab') as f:
+            f.write(b"v 0 0 0\n")
+        self.assertIsNone(brkc.read(self.sidecar, self.source))
+        self.assertEqual(brkc.load(self.source).vertex_count, 3959)
+
+    def corrupt(self, name, change):
+        self.compile()
+        with open(self.sidecar, 'rb') as f:
+            raw = bytearray(f.read())
+        index = [block for block, _ in brkc.BLOCKS].index(name)
+        position = brkc.HEADER.size + brkc.BLOCK.size * index
+        offset, length = brkc.BLOCK.unpack_from(raw, position)
+        change(raw, position, offset, length)
+        with open(self.sidecar, 'wb') as f:
+            f.write(raw)
+
+        self.assertIsNone(brkc.read(self.sidecar, self.source))
+        self.assertEqual(brkc.load(self.source).vertex_count, 3958)
+
+    def test_truncated(self):
+        def change(raw, position, offset, length):
+            del raw[offset + length // 2:]
+        self.corrupt("positions", change)
+
+    def test_corrupt_tables(self):
+        def change(raw, position, offset, length):
+            raw[offset:offset + length] = b"{" * length
+        self.corrupt("tables", change)
+
+    def test_misaligned_block(self):
+        def change(raw, position, offset, length):
+            brkc.BLOCK.pack_into(raw, position, offset, length - 1)
+        self.corrupt("positions", change)
+
+
+def mesh_data(seed, faces):
+    random = np.random.RandomState(seed)
+    loop_total = random.randint(3, 6, size=faces)
+    vertices = int(loop_total.sum())
+    return brk_writer.MeshData(
+        positions=random.uniform(-10.0, 10.0, size=(vertices, 3)),
+        uvs=random.uniform(0.0, 1.0, size=(vertices, 2)),
+        normals=None,
+        loop_total=loop_total,
+        columns=np.stack((random.permutation(vertices), np.arange(vertices)), axis=1),
+        use_smooth=random.randint(0, 2, size=faces).astype(bool),
+        smooth_groups=None,
+        markers=None,
+        edges=None,
+    )
+
+
+class WriterTesting(unittest.TestCase):
+    def items(self):
+        items = ["# header\n"]
+        for i in range(12):
+            matrix = np.identity(4)
+            matrix[:3, 3] = (i, 2 * i, -i)
+            if i % 3 == 0:
+                # mirrored, faces are flipped
+                matrix[0, 0] = -1.0
+            items.append(brk_writer.MeshSnapshot("o brick%d\n" % i, mesh_data(i, 20 + i), matrix))
+        return items
+
+    def test_offsets(self):
+        first = mesh_data(0, 1)
+        items = [brk_writer.MeshSnapshot("o a\n", first, np.identity(4)),
+                 brk_writer.MeshSnapshot("o b\n", first, np.identity(4))]
+        text = "".join(brk_writer.format_items(items, jobs=1))
+        faces = [line for line in text.splitlines() if line.startswith("f ")]
+
+        count = len(first.positions)
+        self.assertEqual(len(faces), 2)
+        # the second object's indices go on from the first's vertices and uvs
+        self.assertTrue(all(int(index) > count for loop in faces[1].split()[1:] for index in loop.split("/")))
+
+    def test_parallel_matches_serial(self):
+        items = self.items()
+        serial = "".join(brk_writer.format_items(items, jobs=1))
+        with mock.patch.object(brk_writer, "BATCH_LOOPS", 64), mock.patch.object(brk_writer, "PARALLEL_LOOPS", 0):
+            parallel = "".join(brk_writer.format_items(items, jobs=2, executable=EXECUTABLE))
+        self.assertEqual(serial, parallel)
+
+    def test_parse_back(self):
+        items = self.items()
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "written.brk")
+            with brk_writer.open_file(filepath) as f:
+                for text in brk_writer.format_items(items, jobs=1):
+                    f.write(text)
+            data = brk_parser.parse(filepath)
+
+        meshes = [item.mesh for item in items[1:]]
+        self.assertEqual(data.objects[1:], ["brick%d" % i for i in range(len(meshes))])
+        self.assertEqual(data.face_count, sum(len(mesh.loop_total) for mesh in meshes))
+        self.assertEqual(data.vertex_count, sum(len(mesh.positions) for mesh in meshes))
+
+        first = meshes[0]
+        positions = np.array(data.positions[:len(first.positions) * 3]).reshape(-1, 3)
+        expected = first.positions * (-1.0, 1.0, 1.0)
+        np.testing.assert_allclose(positions, expected, atol=1e-5)
+
+    def test_drop_faces(self):
+        mesh = mesh_data(3, 10)
+        drop = np.zeros(10, dtype=bool)
+        drop[[1, 4, 5]] = True
+        kept = brk_writer.drop_faces(mesh, drop)
+
+        self.assertEqual(list(kept.loop_total), list(mesh.loop_total[~drop]))
+        self.assertEqual(len(kept.positions), int(kept.loop_total.sum()))
+        # the kept faces have the same corners as before
+        loops = np.repeat(~drop, mesh.loop_total)
+        np.testing.assert_array_equal(kept.positions[kept.columns[:, 0]], mesh.positions[mesh.columns[loops, 0]])
+        self.assertIs(brk_writer.drop_faces(mesh, np.zeros(10, dtype=bool)), mesh)
+
+
+class AnimationTesting(unittest.TestCase):
+    def test_mesh_key(self):
+        self.assertEqual(brk_animation.mesh_key(mesh_data(1, 5)), brk_animation.mesh_key(mesh_data(1, 5)))
+        self.assertNotEqual(brk_animation.mesh_key(mesh_data(1, 5)), brk_animation.mesh_key(mesh_data(2, 5)))
+        self.assertIsNone(brk_animation.mesh_key(None))
+
+    def test_read(self):
+        matrix = np.identity(4)
+        matrix[:3, 3] = (1.0, 2.0, 3.0)
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = brk_animation.animation_path(os.path.join(directory, "scene.brk"))
+            self.assertTrue(filepath.endswith(brk_animation.EXTENSION))
+            with open(filepath, 'w') as f:
+                f.write("# moves block 1, then replaces block 0\n")
+                f.write("frame 2\n" + brk_animation.format_transform(1, matrix))
+                f.write("frame 3\nb 0\n" + SMALL_BRK.decode() + "m 1 0 0 0 1 0 0 0 1 0 0 0 1\n")
+            frames = brk_animation.read(filepath)
+
+        self.assertEqual([(frame, [record[:2] for record in records]) for frame, records in frames],
+                         [(2, [('m', 1)]), (3, [('b', 0), ('m', 1)])])
+        np.testing.assert_allclose(frames[0][1][0][2], matrix)
+        self.assertEqual(frames[1][1][0][2].face_count, 2)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()
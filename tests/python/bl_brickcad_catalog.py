@@ -0,0 +1,119 @@
+# Apache License, Version 2.0
+
+# ./blender.bin --background -noaudio --python tests/python/bl_brickcad_catalog.py -- --verbose
+import os
+import shutil
+import tempfile
+import unittest
+
+from brickcad import catalog
+
+LIST = """\
+# file | name | category
+bricks/2x4.brk | 2x4 Brick
+bricks/2x2.brk | 2 x 2 Brick
+plates/1x2.brk | 1x2 Plate
+plates/2x4.brk | 2x4 Plate
+tiles/round.brk | Round Tile | Tile
+
+misc/minifig.brk
+"""
+
+
+class ParseTesting(unittest.TestCase):
+    def test_dimensions(self):
+        self.assertEqual(catalog.dimensions_key("2x4"), (2, 4))
+        self.assertEqual(catalog.dimensions_key("1 X 2 x 3"), (1, 2, 3))
+        self.assertIsNone(catalog.dimensions_key("2x"))
+        self.assertIsNone(catalog.dimensions_key("brick"))
+
+    def test_parse_line(self):
+        self.assertIsNone(catalog.parse_line("   "))
+        self.assertIsNone(catalog.parse_line("# comment"))
+        self.assertEqual(catalog.parse_line("bricks/2x4.brk | 2x4 Brick"),
+                         catalog.Part("bricks/2x4.brk", "2x4 Brick", "Brick", (2, 4)))
+        self.assertEqual(catalog.parse_line("tiles/round.brk | Round Tile | Tile"),
+                         catalog.Part("tiles/round.brk", "Round Tile", "Tile", ()))
+        self.assertEqual(catalog.parse_line("misc/minifig.brk"),
+                         catalog.Part("misc/minifig.brk", "minifig", "minifig", ()))
+        self.assertEqual(catalog.parse_line("a.brk | 2x2"), catalog.Part("a.brk", "2x2", "Other", (2, 2)))
+
+
+class CatalogTesting(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.write(LIST)
+        self.catalog = catalog.Catalog(self.root)
+        self.assertTrue(self.catalog.refresh())
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, text):
+        with open(os.path.join(self.root, catalog.LIST_FILE), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def names(self, text="", category=""):
+        return [self.catalog.parts[i].name for i in self.catalog.query(text, category)]
+
+    def test_index(self):
+        self.assertEqual(len(self.catalog.parts), 6)
+        self.assertEqual(self.catalog.categories, ["Brick", "Plate", "Tile", "minifig"])
+        self.assertEqual(self.catalog.find("2X4 plate").file, "plates/2x4.brk")
+        self.assertIsNone(self.catalog.find("missing"))
+        self.assertEqual(self.catalog.filepath(self.catalog.find("Round Tile")),
+                         os.path.join(self.root, "tiles/round.brk"))
+
+    def test_query(self):
+        self.assertEqual(self.names(), [part.name for part in self.catalog.parts])
+        self.assertEqual(self.names("2x4"), ["2x4 Brick", "2x4 Plate"])
+        self.assertEqual(self.names("2X2"), ["2 x 2 Brick"])
+        # words match by prefix, every word has to match
+        self.assertEqual(self.names("pla"), ["1x2 Plate", "2x4 Plate"])
+        self.assertEqual(self.names("2x4 pl"), ["2x4 Plate"])
+        self.assertEqual(self.names("2x4", "Brick"), ["2x4 Brick"])
+        self.assertEqual(self.names("tiles"), ["Round Tile"])
+        self.assertEqual(self.names("nothing"), [])
+        self.assertEqual(self.names("", "Missing"), [])
+
+    def test_query_cache(self):
+        self.assertIs(self.catalog.query("brick"), self.catalog.query(" Brick "))
+        for i in range(self.catalog.QUERY_CACHE_SIZE + 2):
+            self.catalog.query("x%d" % i)
+        self.assertLessEqual(len(self.catalog._queries), self.catalog.QUERY_CACHE_SIZE)
+
+    def test_search(self):
+        parts, total, pages = self.catalog.search(per_page=4)
+        self.assertEqual((len(parts), total, pages), (4, 6, 2))
+
+        parts, total, pages = self.catalog.search(page=1, per_page=4)
+        self.assertEqual([part.name for part in parts], ["Round Tile", "minifig"])
+
+        # pages out of range show the nearest page
+        self.assertEqual(self.catalog.search(page=5, per_page=4)[0], parts)
+        self.assertEqual(self.catalog.search(page=-1, per_page=4)[0], self.catalog.search(per_page=4)[0])
+
+        # no matches is one empty page
+        self.assertEqual(self.catalog.search("nothing"), ([], 0, 1))
+
+    def test_refresh(self):
+        self.assertFalse(self.catalog.refresh())
+        self.assertEqual(self.names("2x4"), ["2x4 Brick", "2x4 Plate"])
+
+        self.write(LIST + "plates/2x4-dark.brk | 2x4 Plate Dark\n")
+        self.assertTrue(self.catalog.refresh())
+        self.assertEqual(self.names("2x4"), ["2x4 Brick", "2x4 Plate", "2x4 Plate Dark"])
+
+        os.remove(os.path.join(self.root, catalog.LIST_FILE))
+        self.assertTrue(self.catalog.refresh())
+        self.assertEqual(self.catalog.parts, [])
+
+    def test_get_catalog(self):
+        self.assertIs(catalog.get_catalog(self.root), catalog.get_catalog(self.root))
+        self.assertEqual(len(catalog.get_catalog(self.root).parts), 6)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,70 @@
+# Apache License, Version 2.0
+
+# ./blender.bin --background -noaudio --factory-startup --python tests/python/bl_brickcad_clash.py -- --verbose
+import unittest
+
+import bpy
+from mathutils import Matrix
+
+from bl_operators import brick_clash
+
+CUBE_VERTICES = [(x, y, z) for x in (0.0, 4.0) for y in (0.0, 4.0) for z in (0.0, 4.0)]
+CUBE_FACES = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+
+
+def cube_mesh(name, size):
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata([tuple(value * size / 4.0 for value in co) for co in CUBE_VERTICES], [], CUBE_FACES)
+    mesh.update()
+    return mesh
+
+
+class NarrowPhaseTesting(unittest.TestCase):
+    def setUp(self):
+        for ob in list(bpy.data.objects):
+            bpy.data.objects.remove(ob)
+        self.scene = bpy.context.scene
+        self.cube = cube_mesh("cube", 4.0)
+
+    def add(self, mesh, location):
+        ob = bpy.data.objects.new(mesh.name, mesh)
+        ob.matrix_world = Matrix.Translation(location)
+        self.scene.collection.objects.link(ob)
+        return ob
+
+    def clashes(self):
+        bpy.context.view_layer.update()
+        return sorted(tuple(sorted(pair)) for pair in brick_clash.find_clashes(self.scene))
+
+    def test_touching(self):
+        a = self.add(self.cube, (0.0, 0.0, 0.0))
+        self.add(self.cube, (4.0, 0.0, 0.0))
+        self.add(self.cube, (0.0, 0.0, 4.0))
+        self.assertEqual(self.clashes(), [])
+
+        b = self.add(self.cube, (1.0, 1.0, 1.0))
+        self.assertEqual(len([pair for pair in self.clashes() if b.name in pair]), 3)
+        self.assertIn(tuple(sorted((a.name, b.name))), self.clashes())
+
+    def test_duplicate(self):
+        # all the surfaces of a copy lie on the original's, no triangles cross
+        a = self.add(self.cube, (2.0, 0.0, 0.0))
+        b = self.add(self.cube, (2.0, 0.0, 0.0))
+        self.assertEqual(self.clashes(), [tuple(sorted((a.name, b.name)))])
+
+    def test_nested(self):
+        # a small brick inside a big one, no surfaces cross either
+        a = self.add(self.cube, (0.0, 0.0, 0.0))
+        b = self.add(cube_mesh("small", 1.0), (1.5, 1.5, 1.5))
+        self.assertEqual(self.clashes(), [tuple(sorted((a.name, b.name)))])
+
+        # found whichever of the two comes first
+        self.scene.collection.objects.unlink(a)
+        self.scene.collection.objects.link(a)
+        self.assertEqual(self.clashes(), [tuple(sorted((a.name, b.name)))])
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()
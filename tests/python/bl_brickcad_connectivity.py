@@ -0,0 +1,163 @@
+# Apache License, Version 2.0
+
+# ./blender.bin --background -noaudio --python tests/python/bl_brickcad_connectivity.py -- --verbose
+import random
+import unittest
+from unittest import mock
+
+import bpy
+import numpy as np
+
+from bl_operators import brick_connectivity, brick_stability
+from bl_operators.brick_stability import GROUNDED, UNSUPPORTED
+
+UP = (0.0, 0.0, 1.0)
+DOWN = (0.0, 0.0, -1.0)
+
+
+def brick(x, y, z, width=2):
+    """
+    Studs and holes of a 1 x width brick at (x, y) with its bottom at z, one unit high
+    """
+    studs = [((x + i, y, z + 1.0), UP) for i in range(width)]
+    holes = [((x + i, y, z), DOWN) for i in range(width)]
+    return studs, holes
+
+
+def build(bricks):
+    index = brick_connectivity.ConnectionIndex()
+    for name, (studs, holes) in bricks.items():
+        index.add_connectors(name, studs, holes)
+    return index
+
+
+def normalized(components):
+    return sorted(sorted(component) for component in components)
+
+
+class ComponentsTesting(unittest.TestCase):
+    def test_tower_and_loose(self):
+        index = build({
+            "a": brick(0, 0, 0),
+            "b": brick(1, 0, 1),  # one stud on a
+            "c": brick(0, 0, 2),  # one stud on b
+            "d": brick(10, 0, 0),
+            "e": brick(20, 0, 5),
+        })
+        components = index.components()
+        self.assertEqual(sorted(components[0]), ["a", "b", "c"])
+        self.assertEqual(normalized(components), [["a", "b", "c"], ["d"], ["e"]])
+
+    def test_not_facing(self):
+        # holes facing up don't take studs
+        studs, _ = brick(0, 0, 0)
+        index = build({"a": (studs, []), "b": ([], [(co, UP) for co, _ in studs])})
+        self.assertEqual(normalized(index.components()), [["a"], ["b"]])
+
+    def test_removed(self):
+        index = build({"a": brick(0, 0, 0), "b": brick(0, 0, 1), "c": brick(0, 0, 2)})
+        index.remove_brick("b")
+        self.assertEqual(normalized(index.components()), [["a"], ["c"]])
+
+    def test_matches_search(self):
+        rng = random.Random(0)
+        bricks = {"brick%d" % i: brick(rng.randrange(12), rng.randrange(3), rng.randrange(6)) for i in range(150)}
+        index = build(bricks)
+
+        # every component is what a search from one of its bricks reaches
+        components = index.components()
+        self.assertEqual(sum(len(component) for component in components), len(bricks))
+        self.assertEqual([len(component) for component in components],
+                         sorted((len(component) for component in components), reverse=True))
+        for component in components:
+            self.assertEqual(index.connected_component([component[0]]), set(component))
+
+    def test_occupied(self):
+        index = build({"a": brick(0, 0, 0), "b": brick(1, 0, 1)})
+        studs, holes = brick(0, 0, 0)
+        kinds = [brick_connectivity.ConnectorType.STUD] * 2 + [brick_connectivity.ConnectorType.HOLE] * 2
+        connectors = brick_connectivity.BrickConnectors(["s0", "s1", "h0", "h1"], np.array(kinds, dtype=np.int8),
+                                                        np.array([co for co, _ in studs + holes]),
+                                                        np.array([direction for _, direction in studs + holes]))
+        self.assertEqual(index.occupied("a", connectors).tolist(), [False, True, False, False])
+
+
+def links(joints):
+    result = {}
+    for a, b, count in joints:
+        result.setdefault(a, {})[b] = count
+        result.setdefault(b, {})[a] = count
+    return result
+
+
+class StabilityTesting(unittest.TestCase):
+    def analyze(self, names, joints, grounded):
+        table = links(joints)
+        return brick_stability.analyze(names, {name: table.get(name, {}) for name in names}, grounded)
+
+    def test_chain(self):
+        support, weak = self.analyze(["g", "a", "b"], [("g", "a", 4), ("a", "b", 1)], {"g"})
+        self.assertEqual(support, {"g": GROUNDED, "a": 4, "b": 1})
+        self.assertEqual(weak, [("a", "b", 1)])
+
+    def test_strongest_path(self):
+        # b hangs from a by one stud, and from c by three, the best way down is through c
+        support, weak = self.analyze(["g", "a", "b", "c"],
+                                     [("g", "a", 2), ("a", "b", 1), ("g", "c", 4), ("c", "b", 3)], {"g"})
+        self.assertEqual(support, {"g": GROUNDED, "a": 2, "b": 3, "c": 4})
+        self.assertEqual(weak, [])
+
+    def test_unsupported(self):
+        support, weak = self.analyze(["g", "x", "y"], [("x", "y", 2)], {"g"})
+        self.assertEqual(support, {"g": GROUNDED, "x": UNSUPPORTED, "y": UNSUPPORTED})
+        self.assertEqual(weak, [])
+
+    def test_weakest_joint(self):
+        # a long arm is only as strong as its weakest joint
+        names = ["g"] + ["arm%d" % i for i in range(5)]
+        counts = [4, 3, 1, 4, 2]
+        joints = [(names[i], names[i + 1], count) for i, count in enumerate(counts)]
+        support, weak = self.analyze(names, joints, {"g"})
+        self.assertEqual([support[name] for name in names[1:]], [4, 3, 1, 1, 1])
+        self.assertEqual(weak, [("arm1", "arm2", 1)])
+
+    def test_heat_color(self):
+        self.assertEqual(brick_stability.heat_color(UNSUPPORTED), brick_stability.HEAT_COLORS[0][1])
+        self.assertEqual(brick_stability.heat_color(GROUNDED), brick_stability.HEAT_COLORS[-1][1])
+        self.assertEqual(brick_stability.heat_color(1), brick_stability.HEAT_COLORS[1][1])
+
+
+class HeatMapTesting(unittest.TestCase):
+    COLOR = (0.25, 0.5, 0.75, 1.0)
+
+    def setUp(self):
+        self.scene = bpy.context.scene
+        self.brick = bpy.data.objects.new("heat_brick", None)
+        self.scene.collection.objects.link(self.brick)
+        self.brick.color = self.COLOR
+
+    def tearDown(self):
+        bpy.data.objects.remove(self.brick)
+
+    def show(self, support):
+        analysis = mock.Mock(support={self.brick.name: support})
+        analysis.take_updates.return_value = {self.brick.name}
+        with mock.patch.object(brick_stability, "get_analysis", return_value=analysis):
+            brick_stability.show_heat_map(self.scene, everything=True)
+
+    def test_original_color(self):
+        self.show(UNSUPPORTED)
+        self.assertEqual([round(value, 4) for value in self.brick.color], list(brick_stability.heat_color(UNSUPPORTED)))
+        # shown again, as after reloading the file, the heat color isn't taken for the brick's own
+        self.show(1)
+        self.assertEqual([round(value, 4) for value in self.brick[brick_stability.ORIGINAL_COLOR]], list(self.COLOR))
+
+        brick_stability.hide_heat_map(self.scene)
+        self.assertEqual([round(value, 4) for value in self.brick.color], list(self.COLOR))
+        self.assertNotIn(brick_stability.ORIGINAL_COLOR, self.brick)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()
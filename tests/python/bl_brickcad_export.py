@@ -0,0 +1,118 @@
+# Apache License, Version 2.0
+
+# ./blender.bin --background -noaudio --factory-startup --python tests/python/bl_brickcad_export.py -- --verbose
+import os
+import shutil
+import tempfile
+import unittest
+
+import bpy
+import numpy as np
+from bpy_extras.io_utils import axis_conversion
+from mathutils import Matrix
+
+from bl_operators import brick_instances, export_brk, import_brk
+from brickcad import brk_animation, brk_parser
+
+DEMO_BRK = os.path.join(os.path.dirname(__file__), "..", "..", "release", "datafiles", "bricks", "demo-2.brk")
+
+# the axes the import and export operators default to
+IMPORT_MATRIX = axis_conversion(from_forward='-Z', from_up='Y').to_4x4()
+EXPORT_MATRIX = axis_conversion(to_forward='-Z', to_up='Y').to_4x4()
+
+# demo-2.brk is a 2x4 brick, 6 units high with 121 faces to each of its 8 studs
+BRICK_HEIGHT = 6.0
+STUD_FACES = 121
+
+
+def face_positions(data):
+    # positions of the vertices used by faces, rounded, as a set
+    positions = np.array(data.positions).reshape(-1, 3)[np.array(data.loop_vertex)]
+    return set(map(tuple, np.round(positions, 4).tolist()))
+
+
+def connector_positions(data):
+    return sorted(tuple(round(value, 4) for value in co) for _, co, _ in data.iter_connectors())
+
+
+class ExportTesting(unittest.TestCase):
+    def setUp(self):
+        for ob in list(bpy.data.objects):
+            bpy.data.objects.remove(ob)
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "demo.brk")
+        shutil.copyfile(DEMO_BRK, self.source)
+        self.original = brk_parser.parse(self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def add_brick(self):
+        objects, _ = import_brk.load_objects(bpy.context, self.source, global_matrix=IMPORT_MATRIX)
+        return objects
+
+    def export(self, **keywords):
+        filepath = os.path.join(self.directory, "export.brk")
+        result = export_brk.save(bpy.context, filepath, use_selection=False, global_matrix=EXPORT_MATRIX, **keywords)
+        self.assertEqual(result, {'FINISHED'})
+        return filepath, brk_parser.parse(filepath)
+
+    def test_round_trip(self):
+        self.add_brick()
+        _, exported = self.export()
+
+        self.assertEqual(exported.face_count, self.original.face_count)
+        self.assertEqual(face_positions(exported), face_positions(self.original))
+        self.assertEqual(connector_positions(exported), connector_positions(self.original))
+
+    def test_animation_deltas(self):
+        self.add_brick()
+        scene = bpy.context.scene
+        scene.frame_start = 1
+        scene.frame_end = 3
+        filepath, exported = self.export(use_animation=True, use_animation_deltas=True)
+
+        self.assertEqual(exported.face_count, self.original.face_count)
+        # nothing moves, the animation has no frames
+        self.assertEqual(brk_animation.read(brk_animation.animation_path(filepath)), [])
+
+    def test_coincident_references(self):
+        # two bricks of the library part in the same place, with different colors, are two references
+        objects, _ = import_brk.load_objects(bpy.context, DEMO_BRK, global_matrix=IMPORT_MATRIX)
+        for color in ("Red", "Blue"):
+            bpy.data.materials.new(color)
+        brick = objects[0]
+        if not brick.data.materials:
+            brick.data.materials.append(bpy.data.materials["Red"])
+        other = brick.copy()
+        bpy.context.collection.objects.link(other)
+        brick_instances.set_color(brick, "Red")
+        brick_instances.set_color(other, "Blue")
+
+        _, exported = self.export(use_references=True)
+
+        references = list(exported.iter_references())
+        self.assertEqual(sorted(color for _, color, _ in references), ["Blue", "Red"])
+        self.assertEqual({part for part, _, _ in references}, {"demo-2.brk"})
+        self.assertEqual(references[0][2], references[1][2])
+        self.assertEqual(exported.face_count, 0)
+
+    def test_cull_studs(self):
+        self.add_brick()
+        for ob in self.add_brick():
+            ob.matrix_world = Matrix.Translation((0.0, 0.0, BRICK_HEIGHT)) @ ob.matrix_world
+        bpy.context.view_layer.update()
+
+        _, whole = self.export()
+        _, culled = self.export(use_cull_studs=True)
+
+        # the studs of the lower brick are inside the upper one
+        self.assertEqual(whole.face_count, 2 * self.original.face_count)
+        self.assertEqual(culled.face_count, 2 * self.original.face_count - 8 * STUD_FACES)
+        self.assertEqual(culled.connector_count, whole.connector_count)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()
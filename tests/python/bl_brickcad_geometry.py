@@ -0,0 +1,156 @@
+# Apache License, Version 2.0
+
+# ./blender.bin --background -noaudio --python tests/python/bl_brickcad_geometry.py -- --verbose
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from brickcad import brk_parser, clash, culling
+
+DEMO_BRK = os.path.join(os.path.dirname(__file__), "..", "..", "release", "datafiles", "bricks", "demo-2.brk")
+
+
+def brute_force_pairs(mins, maxs):
+    pairs = [(i, j) for i in range(len(mins)) for j in range(i + 1, len(mins))
+             if np.all(mins[i] < maxs[j]) and np.all(mins[j] < maxs[i])]
+    return np.array(pairs, dtype=np.intp).reshape(-1, 2)
+
+
+class ClashTesting(unittest.TestCase):
+    def random_boxes(self, seed, count, spread):
+        random = np.random.RandomState(seed)
+        mins = random.uniform(0.0, spread, size=(count, 3))
+        return mins, mins + random.uniform(0.5, 4.0, size=(count, 3))
+
+    def test_matches_brute_force(self):
+        for seed, count, spread in ((0, 2, 5.0), (1, 50, 10.0), (2, 300, 40.0), (3, 300, 5.0)):
+            mins, maxs = self.random_boxes(seed, count, spread)
+            np.testing.assert_array_equal(clash.overlapping_pairs(mins, maxs), brute_force_pairs(mins, maxs))
+
+    def test_small_chunks(self):
+        mins, maxs = self.random_boxes(4, 200, 10.0)
+        with mock.patch.object(clash, "SWEEP_CHUNK", 7):
+            np.testing.assert_array_equal(clash.overlapping_pairs(mins, maxs), brute_force_pairs(mins, maxs))
+
+    def test_touching(self):
+        # a stack of bricks touching face to face, none of them share volume
+        mins = np.array([(0.0, 0.0, z) for z in range(5)])
+        maxs = mins + (4.0, 2.0, 1.0)
+        self.assertEqual(len(clash.overlapping_pairs(mins, maxs)), 0)
+        maxs[2, 2] += 0.25
+        self.assertEqual(clash.overlapping_pairs(mins, maxs).tolist(), [[2, 3]])
+
+    def test_empty(self):
+        self.assertEqual(clash.overlapping_pairs(np.zeros((1, 3)), np.ones((1, 3))).shape, (0, 2))
+
+    def test_world_boxes(self):
+        rotation = np.array([[0.0, -1.0, 0.0, 10.0],
+                             [1.0, 0.0, 0.0, 0.0],
+                             [0.0, 0.0, 1.0, 0.0],
+                             [0.0, 0.0, 0.0, 1.0]])
+        mins, maxs = clash.world_boxes([(0.0, 0.0, 0.0)], [(4.0, 2.0, 1.0)], [rotation])
+        np.testing.assert_allclose(mins, [(8.0, 0.0, 0.0)])
+        np.testing.assert_allclose(maxs, [(10.0, 4.0, 1.0)])
+
+
+# a unit cube as quads, and the same cube scaled by 0.25 around its center
+CUBE_VERTICES = np.array([(x, y, z) for x in (0.0, 1.0) for y in (0.0, 1.0) for z in (0.0, 1.0)])
+CUBE_FACES = [[0, 1, 3, 2], [4, 6, 7, 5], [0, 4, 5, 1], [2, 3, 7, 6], [0, 2, 6, 4], [1, 5, 7, 3]]
+SMALL_CUBE_VERTICES = (CUBE_VERTICES - 0.5) * 0.25 + 0.5
+
+
+class ContainsTesting(unittest.TestCase):
+    def test_fan_triangles(self):
+        self.assertEqual(clash.fan_triangles([[0, 1, 2, 3, 4], [5, 6, 7]]).tolist(),
+                         [[0, 1, 2], [0, 2, 3], [0, 3, 4], [5, 6, 7]])
+        self.assertEqual(clash.fan_triangles([]).shape, (0, 3))
+
+    def test_cube(self):
+        triangles = clash.fan_triangles(CUBE_FACES)
+        # the corner of a nested cube, the ray from it crosses one face
+        self.assertTrue(clash.contains(CUBE_VERTICES, triangles, SMALL_CUBE_VERTICES[0]))
+        self.assertTrue(clash.contains(CUBE_VERTICES, triangles, (0.01, 0.99, 0.5)))
+        # the ray from outside crosses two faces, or none
+        self.assertFalse(clash.contains(CUBE_VERTICES, triangles, (-0.5, 0.5, 0.2)))
+        self.assertFalse(clash.contains(CUBE_VERTICES, triangles, (2.0, 2.0, 2.0)))
+        self.assertFalse(clash.contains(CUBE_VERTICES, clash.fan_triangles([]), (0.5, 0.5, 0.5)))
+
+    def test_demo_brick(self):
+        # demo-2.brk is Y up
+        data = brk_parser.parse(DEMO_BRK)
+        positions = np.array(data.positions).reshape(-1, 3)[:, (0, 2, 1)] * (1.0, -1.0, 1.0)
+        loop_total = np.array(data.face_loop_total)
+        starts = np.cumsum(loop_total) - loop_total
+        triangles = clash.fan_triangles([data.loop_vertex[start:start + total]
+                                         for start, total in zip(starts.tolist(), loop_total.tolist())])
+
+        # the top of the brick is solid, below it the brick is hollow
+        self.assertTrue(clash.contains(positions, triangles, (0.3, 0.3, 5.9)))
+        self.assertFalse(clash.contains(positions, triangles, (0.3, 0.3, 2.9)))
+        self.assertFalse(clash.contains(positions, triangles, (0.3, 0.3, 7.5)))
+
+    def test_identity_key(self):
+        matrix = np.identity(4)
+        matrix[:3, :3] += 1e-5
+        self.assertEqual(clash.transform_key(matrix), clash.IDENTITY_KEY)
+        matrix[0, 3] = 0.25
+        self.assertNotEqual(clash.transform_key(matrix), clash.IDENTITY_KEY)
+
+
+def demo_brick():
+    # demo-2.brk is Y up, its connectors are written Z up
+    data = brk_parser.parse(DEMO_BRK)
+    positions = np.array(data.positions).reshape(-1, 3)[:, (0, 2, 1)] * (1.0, -1.0, 1.0)
+    studs = np.array([co for name, co, _ in data.iter_connectors() if name.startswith("stud_up")])
+    return positions, np.array(data.face_loop_total), np.array(data.loop_vertex), studs
+
+
+class CullingTesting(unittest.TestCase):
+    def test_demo_studs(self):
+        positions, loop_total, face_vertex, studs = demo_brick()
+        directions = np.tile((0.0, 0.0, 1.0), (len(studs), 1))
+        labels = culling.stud_labels(positions, loop_total, face_vertex, studs, directions)
+
+        self.assertEqual(len(labels), len(loop_total))
+        # every stud is the same shape
+        self.assertEqual(np.bincount(labels[labels >= 0]).tolist(), [121] * len(studs))
+
+        for stud, location in enumerate(studs):
+            corners = positions[face_vertex[np.repeat(labels == stud, loop_total)]]
+            self.assertLessEqual(np.linalg.norm(corners[:, :2] - location[:2], axis=1).max(),
+                                 culling.STUD_RADIUS + culling.EPSILON)
+
+        drop = culling.culled_faces(labels, (0, 3))
+        self.assertEqual(int(drop.sum()), 242)
+        self.assertFalse(culling.culled_faces(labels, ()).any())
+
+    def test_faces(self):
+        positions = np.array([
+            # inside the stud
+            (0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 1.0, 1.0),
+            # reaching out of it
+            (3.0, 0.0, 0.0),
+            # above it
+            (0.0, 0.0, 2.0),
+        ])
+        loop_total = [3, 3, 3]
+        face_vertex = [0, 1, 2, 0, 1, 3, 0, 1, 4]
+        labels = culling.stud_labels(positions, loop_total, face_vertex, [(0.0, 0.0, 0.0)], [(0.0, 0.0, 1.0)])
+        self.assertEqual(labels.tolist(), [0, -1, -1])
+
+    def test_direction(self):
+        # a stud facing along X, in a mesh rotated on its side
+        positions = np.array([(0.0, 0.0, 0.0), (1.0, 1.0, 0.0), (1.0, 0.0, 1.0), (-1.0, 0.0, 0.0)])
+        labels = culling.stud_labels(positions, [3, 3], [0, 1, 2, 0, 1, 3], [(0.0, 0.0, 0.0)], [(2.0, 0.0, 0.0)])
+        self.assertEqual(labels.tolist(), [0, -1])
+
+    def test_no_faces(self):
+        self.assertEqual(len(culling.stud_labels(np.zeros((0, 3)), [], [], [(0.0, 0.0, 0.0)], [(0.0, 0.0, 1.0)])), 0)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,90 @@
+# Apache License, Version 2.0
+
+# ./blender.bin --background -noaudio --python tests/python/bl_brickcad_library.py -- --verbose
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from brickcad import brkc, library
+
+try:
+    import bpy
+    # workers are started with Python, not with Blender
+    EXECUTABLE = bpy.app.binary_path_python
+except ImportError:
+    EXECUTABLE = None
+
+DEMO_BRK = os.path.join(os.path.dirname(__file__), "..", "..", "release", "datafiles", "bricks", "demo-2.brk")
+
+
+class LibraryTesting(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, "bricks"))
+        for path in ("bricks/2x4.brk", "bricks/2x2.brk", "plate.brk"):
+            shutil.copyfile(DEMO_BRK, os.path.join(self.root, path))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def compile(self, **keywords):
+        results = library.compile_library(self.root, jobs=2, executable=EXECUTABLE, **keywords)
+        return {result.path: result.status for result in results}
+
+    def manifest(self):
+        with open(os.path.join(self.root, library.MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_library_files(self):
+        self.assertEqual(library.library_files(self.root), ["plate.brk", "bricks/2x2.brk", "bricks/2x4.brk"])
+
+    def test_compile(self):
+        self.assertEqual(self.compile(), dict.fromkeys(library.library_files(self.root), 'COMPILED'))
+
+        entry = self.manifest()["files"]["bricks/2x4.brk"]
+        self.assertEqual((entry["vertices"], entry["faces"], entry["connectors"]), (3958, 2004, 16))
+        self.assertEqual(entry["objects"], ["2x4_brick"])
+
+        filepath = os.path.join(self.root, "bricks", "2x4.brk")
+        self.assertEqual(brkc.read(brkc.sidecar_path(filepath), filepath).vertex_count, 3958)
+
+    def test_only_changes(self):
+        self.compile()
+        self.assertEqual(set(self.compile().values()), {'SKIPPED'})
+
+        with open(os.path.join(self.root, "plate.brk"), 'ab') as f:
+            f.write(b"v 0 0 0\n")
+        os.remove(os.path.join(self.root, "bricks", "2x2.brk"))
+        self.assertEqual(self.compile(), {"bricks/2x4.brk": 'SKIPPED', "plate.brk": 'COMPILED'})
+        self.assertEqual(sorted(self.manifest()["files"]), ["bricks/2x4.brk", "plate.brk"])
+
+        self.assertEqual(set(self.compile(force=True).values()), {'COMPILED'})
+
+    def test_missing_sidecar(self):
+        self.compile()
+        os.remove(brkc.sidecar_path(os.path.join(self.root, "plate.brk")))
+        self.assertEqual(self.compile()["plate.brk"], 'COMPILED')
+
+    def test_other_manifest_version(self):
+        with open(os.path.join(self.root, library.MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump({"version": library.MANIFEST_VERSION + 1, "files": {}}, f)
+        self.assertEqual(library.load_manifest(self.root)["version"], library.MANIFEST_VERSION)
+
+    def test_references(self):
+        filepath = os.path.join(self.root, "bricks", "2x4.brk")
+        self.assertEqual(library.part_reference(filepath, self.root), "bricks/2x4.brk")
+        self.assertIsNone(library.part_reference(DEMO_BRK, self.root))
+        self.assertEqual(library.resolve_part("bricks/2x4.brk", root=self.root), os.path.normpath(filepath))
+
+        # not in the library, but next to the scene file
+        self.assertEqual(library.resolve_part("demo-2.brk", os.path.dirname(DEMO_BRK), self.root),
+                         os.path.normpath(DEMO_BRK))
+        self.assertIsNone(library.resolve_part("missing.brk", None, self.root))
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,111 @@
+# Apache License, Version 2.0
+
+# ./blender.bin --background -noaudio --python tests/python/bl_brickcad_snapping.py -- --verbose
+import random
+import unittest
+from unittest import mock
+
+from bl_operators import brick_snapping
+
+UP = (0.0, 0.0, 1.0)
+DOWN = (0.0, 0.0, -1.0)
+
+
+def names(found):
+    return [entry[0] for _, entry in found]
+
+
+class ConnectorTreeTesting(unittest.TestCase):
+    def setUp(self):
+        self.tree = brick_snapping.ConnectorTree()
+        for i in range(4):
+            self.tree.add("brick%d" % i, (float(i), 0.0, 0.0), UP)
+
+    def test_pending(self):
+        # nothing is in the KDTree yet, every connector is searched directly
+        self.assertEqual(self.tree.size, 0)
+        self.assertEqual(names(self.tree.find_range((0.2, 0.0, 0.0), 1.5)), ["brick0", "brick1"])
+
+    def test_rebuilt(self):
+        self.tree.rebuild()
+        self.tree.add("late", (0.5, 0.0, 0.0), UP)
+        self.assertEqual(self.tree.size, 4)
+        found = self.tree.find_range((0.2, 0.0, 0.0), 1.5)
+        # tree and pending entries come back nearest first
+        self.assertEqual(names(found), ["brick0", "late", "brick1"])
+        self.assertAlmostEqual(found[1][0], 0.3)
+
+    def test_removed(self):
+        self.tree.rebuild()
+        self.tree.add("brick1", (1.0, 1.0, 0.0), UP)
+        self.tree.remove_brick("brick1")
+        self.assertEqual(len(self.tree), 3)
+        self.assertEqual(names(self.tree.find_range((1.0, 0.0, 0.0), 1.5)), ["brick0", "brick2"])
+
+        self.tree.rebuild()
+        self.assertEqual((len(self.tree.entries), self.tree.dead), (3, 0))
+        self.assertEqual(names(self.tree.find_range((1.0, 0.0, 0.0), 1.5)), ["brick0", "brick2"])
+
+    def test_exclude(self):
+        self.tree.rebuild()
+        self.assertEqual(names(self.tree.find_range((0.0, 0.0, 0.0), 1.5, {"brick0"})), ["brick1"])
+
+    def test_maintain(self):
+        with mock.patch.object(brick_snapping, "PENDING_LIMIT", 3):
+            self.tree.maintain()
+            self.assertEqual(self.tree.size, 4)
+            self.tree.add("late", (9.0, 0.0, 0.0), UP)
+            self.tree.maintain()
+            self.assertEqual(self.tree.size, 4)
+
+    def test_matches_brute_force(self):
+        generator = random.Random(1)
+        points = [(generator.uniform(0, 20), generator.uniform(0, 20), generator.uniform(0, 5)) for _ in range(300)]
+        tree = brick_snapping.ConnectorTree()
+        for i, co in enumerate(points[:200]):
+            tree.add(i % 50, co, UP)
+        tree.rebuild()
+        for i, co in enumerate(points[200:]):
+            tree.add(i % 50, co, UP)
+        for owner in range(0, 50, 7):
+            tree.remove_brick(owner)
+
+        for co in points[:20]:
+            found = sorted((round(distance, 6), entry[1]) for distance, entry in tree.find_range(co, 3.0))
+            expected = sorted(
+                (round(sum((a - b) ** 2 for a, b in zip(co, other)) ** 0.5, 6), other)
+                for i, other in enumerate(points) if (i if i < 200 else i - 200) % 50 % 7 and
+                sum((a - b) ** 2 for a, b in zip(co, other)) <= 9.0)
+            self.assertEqual(found, expected)
+
+
+class SnapTesting(unittest.TestCase):
+    def setUp(self):
+        self.free = brick_snapping.FreeConnectors()
+        # a brick on the ground with two free studs on top
+        for x in (0.0, 1.0):
+            self.free.studs.add("ground", (x, 0.0, 1.0), UP)
+        self.free.holes.add("ground", (0.0, 0.0, 0.0), DOWN)
+
+    def test_hole_onto_stud(self):
+        offset = self.free.snap([], [((1.1, 0.2, 1.3), DOWN)], 1.0)
+        self.assertEqual([round(value, 6) for value in offset], [-0.1, -0.2, -0.3])
+
+    def test_facing(self):
+        # a hole facing up doesn't go onto a stud
+        self.assertIsNone(self.free.snap([], [((1.0, 0.0, 1.1), UP)], 1.0))
+
+    def test_nearest(self):
+        # of the stud and the hole being moved, the hole is nearer to a free connector
+        offset = self.free.snap([((0.0, 0.0, -0.5), UP)], [((0.0, 0.0, 1.2), DOWN)], 1.0)
+        self.assertEqual([round(value, 6) for value in offset], [0.0, 0.0, -0.2])
+
+    def test_radius_and_exclude(self):
+        self.assertIsNone(self.free.snap([], [((5.0, 0.0, 1.0), DOWN)], 1.0))
+        self.assertIsNone(self.free.snap([], [((1.0, 0.0, 1.0), DOWN)], 1.0, {"ground"}))
+
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    unittest.main()